@@ -1,3 +1,22 @@
 from .post_processor import *
 from .telegram_api import *
 from .vkontakte_api import *
+from .transport import *
+from .cache import *
+from .rate_limiter import *
+from .retry import *
+from .journal import *
+from .async_runtime import *
+from .routes import *
+from .composer import *
+from .media_relay import *
+from .photo_size import *
+from .models import *
+from .backfill import *
+from .poll_scheduler import *
+from .callback_server import *
+from .metrics import *
+from .logs import *
+from .dedup import *
+from .state_store import *
+from .sharding import *
@@ -0,0 +1,190 @@
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, List, Optional, TypeVar, Union
+import asyncio
+import logging
+import time
+
+from app.models import Post
+from app.vkontakte_api import VkAPI
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Признак конца потока в очередях конвейера
+_DONE = object()
+# Стадии конвейера источника, каждой нужен поток: загрузка, обработка, отправка
+PIPELINE_STAGES = 3
+
+
+class BlockingRunner:
+    def __init__(self, sleep: Callable[[float], None] = time.sleep):
+        """Инициализируем выполнение шагов отправки в текущем потоке.
+
+        Корутины отправки (SendScheduler.call, TelegramBot) ждут и делают
+        запросы через runner. С BlockingRunner они ни разу не отдают
+        управление и выполняются функцией run_blocking без цикла событий.
+
+        Args:
+            sleep (Callable[[float], None]): Функция ожидания.
+        """
+        self._sleep = sleep
+
+    async def sleep(self, seconds: float) -> None:
+        """Ждём, блокируя поток."""
+        self._sleep(seconds)
+
+    async def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняем блокирующий вызов в текущем потоке."""
+        return func(*args, **kwargs)
+
+
+class LoopRunner:
+    def __init__(self, executor: Optional[Executor] = None):
+        """Инициализируем выполнение шагов отправки в цикле событий.
+
+        Ожидания лимитов и повторов - asyncio.sleep, поэтому они не занимают
+        потоки, в пул уходят только сами запросы.
+
+        Args:
+            executor (Optional[Executor]): Пул для запросов, None - пул цикла по умолчанию.
+        """
+        self.executor = executor
+
+    async def sleep(self, seconds: float) -> None:
+        """Ждём в цикле событий."""
+        await asyncio.sleep(seconds)
+
+    async def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Выполняем блокирующий вызов в пуле потоков."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+
+# Способ ожидания и выполнения запросов в корутинах отправки
+Runner = Union[BlockingRunner, LoopRunner]
+
+
+def run_blocking(coroutine: Coroutine[Any, Any, T]) -> T:
+    """Выполняем корутину, которая ждёт только через BlockingRunner, без цикла событий.
+
+    Args:
+        coroutine (Coroutine[Any, Any, T]): Корутина.
+
+    Returns:
+        T: Результат корутины.
+
+    Raises:
+        RuntimeError: Если корутина ждёт цикл событий.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    coroutine.close()
+    raise RuntimeError("Корутина ждёт цикл событий, её нужно выполнять через await")
+
+
+class AsyncVkAPI:
+    def __init__(self, vk_api: VkAPI):
+        """Инициализируем асинхронный интерфейс VK API.
+
+        Запросы выполняет синхронный VkAPI в пуле потоков, поэтому
+        соединения и кэш имён остаются общими с синхронным кодом.
+
+        Args:
+            vk_api (VkAPI): Синхронный клиент VK API.
+        """
+        self.vk_api = vk_api
+
+    async def get_data(self, count_vk: int, offset: int = 0) -> Dict[str, Any]:
+        """Асинхронная версия VkAPI.get_data."""
+        return await asyncio.to_thread(self.vk_api.get_data, count_vk, offset)
+
+    async def get_posts(self, posts: str) -> List[Post]:
+        """Асинхронная версия VkAPI.get_posts."""
+        return await asyncio.to_thread(self.vk_api.get_posts, posts)
+
+    async def iter_new_posts(self, last_date: Optional[int], count_vk: int, max_posts: int) -> AsyncIterator[Post]:
+        """Асинхронная версия VkAPI.iter_new_posts.
+
+        Посты отправляются от старых к новым, а стена загружается от новых к
+        старым, поэтому первый пост известен только после загрузки всех
+        страниц: загрузка стены не идёт одновременно с отправкой.
+
+        Yields:
+            Post: Новые посты в порядке публикации.
+        """
+        posts = await asyncio.to_thread(lambda: list(self.vk_api.iter_new_posts(last_date, count_vk, max_posts)))
+        for post in posts:
+            yield post
+
+
+class AsyncPipeline:
+    def __init__(self, logger: logging.Logger, queue_size: int = 10):
+        """Инициализируем конвейер загрузка -> обработка -> отправка.
+
+        Каждая стадия - отдельная задача с одной очередью, поэтому порядок
+        постов сохраняется, а стадии работают одновременно: пока отправляется
+        один пост, следующий уже обрабатывается (текст, сообщения).
+
+        Args:
+            logger (logging.Logger): Логгер для вывода сообщений.
+            queue_size (int): Сколько постов стадия может держать впереди следующей.
+        """
+        self.logger = logger
+        self.queue_size = queue_size
+
+    async def run(
+        self,
+        posts: AsyncIterator[T],
+        prepare: Callable[[T], Optional[R]],
+        deliver: Callable[[R], Awaitable[None]]
+    ) -> int:
+        """Прогоняем поток постов через конвейер.
+
+        Args:
+            posts (AsyncIterator[T]): Поток постов из ВК.
+            prepare (Callable[[T], Optional[R]]): Синхронная обработка поста, None - пропустить.
+            deliver (Callable[[R], Awaitable[None]]): Отправка обработанного поста.
+
+        Returns:
+            int: Количество отправленных постов.
+        """
+        fetched: asyncio.Queue = asyncio.Queue(self.queue_size)
+        prepared: asyncio.Queue = asyncio.Queue(self.queue_size)
+
+        async def fetch() -> None:
+            try:
+                async for post in posts:
+                    await fetched.put(post)
+            finally:
+                await fetched.put(_DONE)
+
+        async def process() -> None:
+            try:
+                while (post := await fetched.get()) is not _DONE:
+                    item = await asyncio.to_thread(prepare, post)
+                    if item is not None:
+                        await prepared.put(item)
+            finally:
+                await prepared.put(_DONE)
+
+        async def send() -> int:
+            delivered = 0
+            while (item := await prepared.get()) is not _DONE:
+                await deliver(item)
+                delivered += 1
+            return delivered
+
+        fetch_task = asyncio.create_task(fetch())
+        process_task = asyncio.create_task(process())
+        try:
+            delivered = await send()
+            # Ошибка обработки поднимется здесь, а загрузка в этом случае будет отменена
+            await process_task
+            await fetch_task
+        finally:
+            fetch_task.cancel()
+            process_task.cancel()
+        self.logger.debug("Конвейер завершён, отправлено постов: %d", delivered)
+        return delivered
@@ -0,0 +1,282 @@
+from datetime import datetime, time as day_time, timedelta
+from typing import Callable, Iterable, List, Optional, Tuple
+import logging
+import sqlite3
+import threading
+import time
+
+from app.models import Post
+from app.vkontakte_api import WALL_GET_LIMIT
+
+# Окна отправки по умолчанию: с 10 до 22 часов по местному времени
+DEFAULT_WINDOWS = '10:00-22:00'
+
+Window = Tuple[day_time, day_time]
+
+
+def parse_windows(value: str) -> List[Window]:
+    """Разбираем окна отправки вида "09:00-12:00,18:00-22:00".
+
+    Args:
+        value (str): Окна через запятую, конец окна не включается. Пустая строка - весь день.
+
+    Returns:
+        List[Window]: Окна в порядке начала.
+
+    Raises:
+        ValueError: Если окно записано неверно.
+    """
+    windows = []
+    for item in filter(None, (x.strip() for x in value.split(','))):
+        start, end = (day_time.fromisoformat(x.strip()) for x in item.split('-'))
+        if end <= start:
+            raise ValueError(f"Окно отправки должно заканчиваться позже начала: {item}")
+        windows.append((start, end))
+    return sorted(windows) or [(day_time(0), day_time.max)]
+
+
+class BackfillSchedule:
+    def __init__(self, per_day: int, windows: List[Window]):
+        """Инициализируем темп отправки старых постов.
+
+        Посты отправляются не чаще per_day в сутки и только внутри окон,
+        равномерно: между постами проходит суммарная длина окон / per_day.
+
+        Args:
+            per_day (int): Сколько постов отправлять в сутки.
+            windows (List[Window]): Окна отправки по местному времени.
+        """
+        self.per_day = per_day
+        self.windows = windows
+        window_seconds = sum(
+            (datetime.combine(datetime.min, end) - datetime.combine(datetime.min, start)).total_seconds()
+            for start, end in windows)
+        self.interval = window_seconds / per_day
+
+    def next_send(self, now: datetime, last_sent: Optional[datetime], sent_today: int) -> datetime:
+        """Получаем ближайшее время, когда можно отправить следующий пост.
+
+        Args:
+            now (datetime): Текущее местное время.
+            last_sent (Optional[datetime]): Время последней отправки.
+            sent_today (int): Сколько постов уже отправлено сегодня.
+
+        Returns:
+            datetime: Время отправки, не раньше now.
+        """
+        earliest = now if last_sent is None else max(now, last_sent + timedelta(seconds=self.interval))
+        day = now.date()
+        if sent_today >= self.per_day:
+            day += timedelta(days=1)
+            earliest = max(earliest, datetime.combine(day, day_time(0)))
+
+        while True:
+            for start, end in self.windows:
+                window_start = datetime.combine(day, start)
+                window_end = datetime.combine(day, end)
+                if earliest < window_end:
+                    return max(earliest, window_start)
+            day += timedelta(days=1)
+            earliest = max(earliest, datetime.combine(day, day_time(0)))
+
+
+class BackfillQueue:
+    def __init__(self, path: str):
+        """Инициализируем очередь старых постов в SQLite (режим WAL).
+
+        Для каждого поста хранится состояние: pending - ждёт отправки,
+        done - отправлен, skipped - уже был опубликован или отклонён фильтрами,
+        missing - не найден в ВК.
+
+        Args:
+            path (str): Путь к файлу базы данных, может совпадать с журналом доставки.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS backfill ('
+                'position INTEGER PRIMARY KEY AUTOINCREMENT, post_id TEXT NOT NULL UNIQUE, '
+                'date INTEGER, status TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+
+    def add(self, post_ids: Iterable[str]) -> int:
+        """Добавляем посты в очередь, уже известные пропускаются.
+
+        Args:
+            post_ids (Iterable[str]): ID постов вида owner_id_postid.
+
+        Returns:
+            int: Сколько постов добавлено.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO backfill (post_id, status, updated_at) VALUES (?, 'pending', ?)",
+                ((post_id, now) for post_id in post_ids)
+            )
+            return self._conn.total_changes - before
+
+    def unresolved(self, limit: int) -> List[str]:
+        """Получаем посты, дата которых ещё не известна.
+
+        Args:
+            limit (int): Максимальное количество.
+
+        Returns:
+            List[str]: ID постов.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT post_id FROM backfill WHERE status = 'pending' AND date IS NULL ORDER BY position LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_date(self, post_id: str, date: int) -> None:
+        """Запоминаем дату поста, по ней определяется порядок отправки.
+
+        Args:
+            post_id (str): ID поста.
+            date (int): Дата публикации.
+        """
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE backfill SET date = ? WHERE post_id = ?', (date, post_id))
+
+    def next_pending(self) -> Optional[str]:
+        """Получаем следующий пост для отправки: самый старый по дате публикации.
+
+        Returns:
+            Optional[str]: ID поста или None, если очередь пуста.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT post_id FROM backfill WHERE status = 'pending' ORDER BY date IS NULL, date, position LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark(self, post_id: str, status: str) -> None:
+        """Записываем состояние поста.
+
+        Args:
+            post_id (str): ID поста.
+            status (str): done, skipped или missing.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE backfill SET status = ?, updated_at = ? WHERE post_id = ?', (status, time.time(), post_id))
+
+    def pending_count(self) -> int:
+        """Количество постов, ждущих отправки."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM backfill WHERE status = 'pending'").fetchone()[0]
+
+    def sent_since(self, since: float) -> Tuple[int, Optional[float]]:
+        """Считаем отправленные посты начиная с момента since.
+
+        Args:
+            since (float): Unix timestamp.
+
+        Returns:
+            Tuple[int, Optional[float]]: Количество и время последней отправки вообще.
+        """
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM backfill WHERE status = 'done' AND updated_at >= ?", (since,)
+            ).fetchone()[0]
+            last = self._conn.execute("SELECT MAX(updated_at) FROM backfill WHERE status = 'done'").fetchone()[0]
+        return count, last
+
+    def close(self) -> None:
+        """Закрываем соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+
+class Backfill:
+    def __init__(self, queue: BackfillQueue, schedule: BackfillSchedule, logger: logging.Logger):
+        """Инициализируем отправку старых постов по расписанию параллельно с обычной проверкой.
+
+        Args:
+            queue (BackfillQueue): Очередь постов с сохранённым прогрессом.
+            schedule (BackfillSchedule): Темп отправки.
+            logger (logging.Logger): Логгер для вывода сообщений.
+        """
+        self.queue = queue
+        self.schedule = schedule
+        self.logger = logger
+
+    def resolve(self, get_posts: Callable[[str], List[Post]]) -> None:
+        """Узнаём даты новых постов очереди запросами wall.getById по 100 постов.
+
+        Посты, которых нет в ответе (удалены или недоступны), отмечаются missing.
+
+        Args:
+            get_posts (Callable[[str], List[Post]]): Загрузка постов по строке ID через запятую.
+        """
+        while post_ids := self.queue.unresolved(WALL_GET_LIMIT):
+            posts = {post.key: post.date for post in get_posts(','.join(post_ids))}
+            for post_id in post_ids:
+                if post_id in posts:
+                    self.queue.set_date(post_id, posts[post_id])
+                else:
+                    self.logger.warning(f"Пост {post_id} из списка не найден в ВК")
+                    self.queue.mark(post_id, 'missing')
+
+    def next_send(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Получаем время следующей отправки.
+
+        Args:
+            now (Optional[datetime]): Текущее местное время.
+
+        Returns:
+            Optional[datetime]: Время или None, если очередь пуста.
+        """
+        if not self.queue.pending_count():
+            return None
+        now = now or datetime.now()
+        today = datetime.combine(now.date(), day_time(0)).timestamp()
+        sent_today, last_sent = self.queue.sent_since(today)
+        last_sent = datetime.fromtimestamp(last_sent) if last_sent else None
+        return self.schedule.next_send(now, last_sent, sent_today)
+
+    def step(self, get_posts: Callable[[str], List[Post]], send: Callable[[Post], bool]) -> Optional[float]:
+        """Отправляем следующий пост, если подошло его время.
+
+        Посты, которые не были отправлены (уже опубликованы или отклонены
+        фильтрами), не расходуют место в расписании, за ними сразу берётся
+        следующий.
+
+        Args:
+            get_posts (Callable[[str], List[Post]]): Загрузка постов по строке ID через запятую.
+                Ошибки запроса должны подниматься, чтобы пост не был потерян.
+            send (Callable[[Post], bool]): Проверка и отправка поста, True - пост отправлен.
+
+        Returns:
+            Optional[float]: Секунды до следующей отправки или None, если очередь пуста.
+        """
+        self.resolve(get_posts)
+        processed = False
+        while (next_send := self.next_send()) is not None:
+            delay = (next_send - datetime.now()).total_seconds()
+            if delay > 0:
+                return delay
+
+            post_id = self.queue.next_pending()
+            posts = get_posts(post_id)
+            processed = True
+            if not posts:
+                self.logger.warning(f"Пост {post_id} из списка больше не доступен в ВК")
+                self.queue.mark(post_id, 'missing')
+            elif send(posts[0]):
+                self.queue.mark(post_id, 'done')
+                self.logger.info("Пост %s из списка отправлен, осталось: %d", post_id, self.queue.pending_count())
+            else:
+                self.queue.mark(post_id, 'skipped')
+
+        if processed:
+            self.logger.info("Список постов отправлен полностью")
+        return None
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import sqlite3
+import threading
+import time
+
+
+class SqliteStore:
+    def __init__(self, path: str, table: str, max_rows: int = 100000):
+        """Инициализируем дисковое хранилище ключ-значение в SQLite.
+
+        Args:
+            path (str): Путь к файлу базы данных.
+            table (str): Имя таблицы, чтобы несколько кэшей делили один файл.
+            max_rows (int): Максимальное количество записей, старые вытесняются.
+        """
+        self.table = table
+        self.max_rows = max_rows
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_updated ON {table} (updated_at)')
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Читаем значение и время его записи.
+
+        Args:
+            key (str): Ключ.
+
+        Returns:
+            Optional[Tuple[str, float]]: Значение и Unix-время записи или None.
+        """
+        with self._lock:
+            row = self._conn.execute(f'SELECT value, updated_at FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str) -> None:
+        """Записываем значение, периодически вытесняя самые старые записи.
+
+        Args:
+            key (str): Ключ.
+            value (str): Значение.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)',
+                (key, value, time.time())
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._conn.execute(
+                    f'DELETE FROM {self.table} WHERE key IN ('
+                    f'SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_rows,)
+                )
+
+    def delete(self, key: str) -> None:
+        """Удаляем значение.
+
+        Args:
+            key (str): Ключ.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def close(self) -> None:
+        """Закрываем соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, store: Optional[SqliteStore] = None):
+        """Инициализируем LRU-кэш в памяти с ограничением времени жизни записей.
+
+        Args:
+            maxsize (int): Максимальное количество записей в памяти.
+            ttl (Optional[float]): Время жизни записи в секундах, None - бессрочно.
+            store (Optional[SqliteStore]): Дисковое хранилище второго уровня,
+                переживающее перезапуск контейнера.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl is not None and time.time() - updated_at > self.ttl
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Получаем значение из памяти или с диска.
+
+        Args:
+            key (Hashable): Ключ.
+
+        Returns:
+            Optional[str]: Значение или None, если его нет или срок жизни истёк.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not self._expired(item[1]):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+
+        stored = self.store.get(str(key)) if self.store else None
+        with self._lock:
+            if stored is not None and not self._expired(stored[1]):
+                self._put(key, stored[0], stored[1])
+                self.hits += 1
+                return stored[0]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: str) -> None:
+        """Сохраняем значение в памяти и на диске.
+
+        Args:
+            key (Hashable): Ключ.
+            value (str): Значение.
+        """
+        with self._lock:
+            self._put(key, value, time.time())
+        if self.store:
+            self.store.set(str(key), value)
+
+    def delete(self, key: Hashable) -> None:
+        """Удаляем значение из памяти и с диска.
+
+        Args:
+            key (Hashable): Ключ.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+        if self.store:
+            self.store.delete(str(key))
+
+    def _put(self, key: Hashable, value: str, updated_at: float) -> None:
+        self._data[key] = (value, updated_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        """Возвращаем счётчики попаданий и промахов.
+
+        Returns:
+            Dict[str, float]: Размер, попадания, промахи и доля попаданий.
+        """
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
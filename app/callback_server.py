@@ -0,0 +1,160 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+import asyncio
+import hmac
+import json
+import logging
+import queue
+import threading
+
+# Максимальный размер тела запроса Callback API, байт
+MAX_BODY = 1024 * 1024
+
+
+class CallbackEvent(NamedTuple):
+    """Событие Callback API о новом посте."""
+    group_id: int
+    post: Dict[str, Any]
+
+
+class CallbackServer:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        logger: logging.Logger,
+        confirmation: str,
+        secret: str = '',
+        path: str = '/'
+    ):
+        """Инициализируем приёмник событий VK Callback API.
+
+        Сервер отвечает на запрос подтверждения адреса, проверяет секретный
+        ключ и складывает события wall_post_new в очередь events. ВК ждёт
+        ответ "ok" не дольше нескольких секунд, поэтому посты отправляются
+        не в обработчике запроса, а основным циклом. Цикл на asyncio получает
+        события через attach.
+
+        Args:
+            host (str): Адрес, на котором слушать.
+            port (int): Порт, 0 - выбрать свободный.
+            logger (logging.Logger): Логгер для вывода сообщений.
+            confirmation (str): Строка, которую нужно вернуть на запрос confirmation.
+            secret (str): Секретный ключ из настроек Callback API, пусто - не проверять.
+            path (str): Путь, на который ВК отправляет события.
+        """
+        self.logger = logger
+        self.confirmation = confirmation
+        self.secret = secret
+        self.path = path
+        self.events: queue.Queue = queue.Queue()
+        # Очередь цикла событий из attach, в неё события передаются вместо events
+        self._attached: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Порт, на котором слушает сервер."""
+        return self._server.server_address[1]
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        """Передаём события в очередь цикла событий, чтобы ждать их без опроса из потока.
+
+        События, уже лежащие в events, переносятся в новую очередь.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Цикл, в котором события будут читаться.
+
+        Returns:
+            asyncio.Queue: Очередь событий CallbackEvent.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            while not self.events.empty():
+                events.put_nowait(self.events.get_nowait())
+            self._attached = (loop, events)
+        return events
+
+    def pending(self) -> int:
+        """Количество событий, которые ещё не обработаны."""
+        with self._lock:
+            return self._attached[1].qsize() if self._attached else self.events.qsize()
+
+    def _put(self, event: CallbackEvent) -> None:
+        with self._lock:
+            if self._attached:
+                loop, events = self._attached
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            else:
+                self.events.put(event)
+
+    def handle(self, body: Dict[str, Any]) -> Tuple[int, str]:
+        """Обрабатываем одно событие Callback API.
+
+        Args:
+            body (Dict[str, Any]): JSON тела запроса.
+
+        Returns:
+            Tuple[int, str]: HTTP-статус и текст ответа.
+        """
+        if self.secret and not hmac.compare_digest(str(body.get('secret', '')), self.secret):
+            self.logger.warning(f"Событие Callback API с неверным секретным ключом, группа {body.get('group_id')}")
+            return 403, 'forbidden'
+
+        event_type = body.get('type')
+        if event_type == 'confirmation':
+            self.logger.info(f"Подтверждение адреса Callback API для группы {body.get('group_id')}")
+            return 200, self.confirmation
+        # Предложенные и отложенные записи тоже приходят как wall_post_new, берём только опубликованные
+        post = body.get('object')
+        if event_type == 'wall_post_new' and isinstance(post, dict) and post.get('post_type', 'post') == 'post':
+            self._put(CallbackEvent(int(body.get('group_id', 0)), post))
+            self.logger.info("Событие о новом посте %s_%s", post.get('owner_id'), post.get('id'))
+        # На остальные события тоже отвечаем ok, иначе ВК будет их повторять
+        return 200, 'ok'
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if self.path.split('?')[0] != server.path:
+                    self._reply(404, 'not found')
+                    return
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY:
+                    self._reply(413, 'too large')
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self._reply(400, 'bad request')
+                    return
+                self._reply(*server.handle(body if isinstance(body, dict) else {}))
+
+            def _reply(self, status: int, text: str) -> None:
+                data = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                server.logger.debug("Callback API %s: " + format, self.address_string(), *args)
+
+        return Handler
+
+    def start(self) -> None:
+        """Запускаем сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='vk-callback', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Приём событий VK Callback API на порту {self.port}, путь {self.path}")
+
+    def stop(self) -> None:
+        """Останавливаем сервер."""
+        self._server.shutdown()
+        self._server.server_close()
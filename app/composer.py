@@ -0,0 +1,49 @@
+from typing import List, NamedTuple, Optional
+
+from app.models import Photo
+from app.post_processor import CAPTION_LIMIT, PostProcessor, utf16_len
+
+# Telegram принимает в одном альбоме не больше 10 фото
+MEDIA_GROUP_LIMIT = 10
+
+
+class MessagePart(NamedTuple):
+    """Одно сообщение Telegram из поста: текст или альбом с необязательной подписью."""
+    step: str
+    text: str = ''
+    images: List[Photo] = []
+
+
+def compose_message(
+    text: str,
+    images: List[Photo],
+    parse_mode: Optional[str] = None,
+    use_caption: bool = True
+) -> List[MessagePart]:
+    """Раскладываем пост на сообщения Telegram.
+
+    Если текст помещается в подпись (1024 символа UTF-16), он отправляется
+    подписью к первому альбому, и пост занимает один вызов API вместо двух.
+    Иначе текст уходит отдельными сообщениями перед альбомами.
+
+    Args:
+        text (str): Текст поста после PostProcessor.process.
+        images (List[Photo]): Изображения поста.
+        parse_mode (Optional[str]): None, 'HTML' или 'MarkdownV2'.
+        use_caption (bool): Разрешать ли отправку текста подписью к альбому.
+
+    Returns:
+        List[MessagePart]: Сообщения в порядке отправки. Имя шага (text:N, photos:N)
+            используется журналом доставки.
+    """
+    text = PostProcessor.clean_text(text, parse_mode).strip() if text else ''
+    chunks = [images[i:i + MEDIA_GROUP_LIMIT] for i in range(0, len(images), MEDIA_GROUP_LIMIT)]
+
+    if chunks and text and use_caption and utf16_len(text) <= CAPTION_LIMIT:
+        parts = [MessagePart('photos:0', text, chunks[0])]
+        return parts + [MessagePart(f'photos:{index}', '', chunk) for index, chunk in enumerate(chunks[1:], 1)]
+
+    # В телеграмме есть ограничения на длину одного сообщения в 4096 символов UTF-16, разбиваем длинные на части
+    parts = [MessagePart(f'text:{index}', part)
+             for index, part in enumerate(PostProcessor.split_text(text, parse_mode=parse_mode))]
+    return parts + [MessagePart(f'photos:{index}', '', chunk) for index, chunk in enumerate(chunks)]
@@ -0,0 +1,110 @@
+from typing import List, Optional
+import hashlib
+import re
+import threading
+
+from app.cache import LRUCache
+from app.models import Post
+from app.post_processor import MENTION_RE
+
+# Окно поиска повторов по умолчанию, секунд
+DEDUP_WINDOW = 86400
+# Текст без фото короче этого (после нормализации) не считается отпечатком: слишком легко совпасть случайно
+MIN_TEXT_LENGTH = 40
+
+URL_RE = re.compile(r'https?://\S+')
+HASHTAG_RE = re.compile(r'#\w+(?:@\w+)?')
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """Приводим текст к виду, в котором копии одного поста совпадают.
+
+    Упоминания заменяются именами, ссылки и хэштеги (их зеркала часто
+    добавляют свои) убираются, регистр, пунктуация и пробелы не учитываются.
+
+    Args:
+        text (str): Текст поста.
+
+    Returns:
+        str: Слова текста в нижнем регистре через пробел.
+    """
+    text = MENTION_RE.sub(lambda match: match.group(3), text)
+    text = HASHTAG_RE.sub(' ', URL_RE.sub(' ', text))
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def post_fingerprints(post: Post) -> List[str]:
+    """Получаем ключи, по которым пост считается повтором другого.
+
+    origin - исходный пост: для репоста это пост из copy_history, для
+    обычного поста - он сам, поэтому оригинал и его репост в зеркале
+    совпадают. content - хэш нормализованного текста и ID фото поста вместе
+    с репостом, он находит копии, опубликованные без репоста.
+
+    Args:
+        post (Post): Пост ВК.
+
+    Returns:
+        List[str]: Ключи вида origin:owner_id_id и content:sha1.
+    """
+    origin = post.repost or post
+    keys = [f"origin:{origin.key}"]
+
+    parts = [post] + ([post.repost] if post.repost else [])
+    text = normalize_text('\n'.join(part.text for part in parts))
+    photos = sorted(f"{photo.owner_id}_{photo.id}" for part in parts for photo in part.photos)
+    if photos or len(text) >= MIN_TEXT_LENGTH:
+        digest = hashlib.sha1(f"{text}|{','.join(photos)}".encode('utf-8')).hexdigest()
+        keys.append(f"content:{digest}")
+    return keys
+
+
+class DedupIndex:
+    def __init__(self, cache: LRUCache):
+        """Инициализируем индекс уже отправленного содержимого по каналам.
+
+        Когда несколько групп-зеркал репостят один пост, в канал уходит только
+        первая копия. Срок хранения записей (окно поиска повторов) и их
+        количество ограничивает кэш: LRUCache с ttl и SqliteStore с max_rows.
+
+        Args:
+            cache (LRUCache): Хранилище ключей поста, значение - ключ отправленного поста.
+        """
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def claim(self, post: Post, channel: str) -> Optional[str]:
+        """Проверяем, не отправлялся ли в канал другой пост с тем же содержимым, и занимаем его ключи.
+
+        Проверка и запись выполняются вместе, поэтому из двух копий, которые
+        проверяются одновременно разными источниками, отправится одна.
+
+        Args:
+            post (Post): Пост ВК.
+            channel (str): Канал Telegram.
+
+        Returns:
+            Optional[str]: Ключ ранее отправленного поста или None, если пост не повтор.
+        """
+        keys = [f"{channel} {key}" for key in post_fingerprints(post)]
+        with self._lock:
+            for key in keys:
+                post_key = self.cache.get(key)
+                if post_key is not None and post_key != post.key:
+                    return post_key
+            for key in keys:
+                self.cache.set(key, post.key)
+        return None
+
+    def release(self, post: Post, channel: str) -> None:
+        """Освобождаем ключи поста, который не будет отправлен (например, отклонён фильтрами).
+
+        Args:
+            post (Post): Пост ВК.
+            channel (str): Канал Telegram.
+        """
+        with self._lock:
+            for key in (f"{channel} {key}" for key in post_fingerprints(post)):
+                if self.cache.get(key) == post.key:
+                    self.cache.delete(key)
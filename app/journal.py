@@ -0,0 +1,214 @@
+from typing import List, Optional
+import sqlite3
+import threading
+import time
+
+
+class PostSteps:
+    def __init__(self, journal: 'DeliveryJournal', post_key: str, channel: str):
+        """Инициализируем шаги доставки одного поста в один канал.
+
+        Args:
+            journal (DeliveryJournal): Журнал доставки.
+            post_key (str): Ключ поста вида owner_id_postid.
+            channel (str): Канал Telegram.
+        """
+        self.journal = journal
+        self.post_key = post_key
+        self.channel = channel
+        self.done = journal.completed_steps(post_key, channel)
+
+    def is_done(self, step: str) -> bool:
+        """Проверяем, выполнен ли шаг до перезапуска.
+
+        Args:
+            step (str): Имя шага, например text:0 или photos:1.
+
+        Returns:
+            bool: True, если шаг уже выполнен.
+        """
+        return step in self.done
+
+    def mark(self, step: str, ok: bool = True) -> None:
+        """Записываем выполненный шаг.
+
+        Args:
+            step (str): Имя шага.
+            ok (bool): False, если шаг окончательно не удался и ушёл в журнал неотправленных.
+        """
+        self.journal.mark_step(self.post_key, self.channel, step, ok)
+        self.done.add(step)
+
+
+class DeliveryJournal:
+    def __init__(self, path: str):
+        """Инициализируем журнал доставки постов в SQLite (режим WAL).
+
+        Args:
+            path (str): Путь к файлу базы данных.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS deliveries ('
+                'post_key TEXT NOT NULL, channel TEXT NOT NULL, date INTEGER NOT NULL, '
+                'status TEXT NOT NULL, updated_at REAL NOT NULL, '
+                'PRIMARY KEY (post_key, channel))'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS deliveries_channel_date ON deliveries (channel, status, date)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS delivery_steps ('
+                'post_key TEXT NOT NULL, channel TEXT NOT NULL, step TEXT NOT NULL, '
+                'ok INTEGER NOT NULL, sent_at REAL NOT NULL, '
+                'PRIMARY KEY (post_key, channel, step))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+
+    def is_delivered(self, post_key: str, channel: str, date: Optional[int] = None) -> bool:
+        """Проверяем, доставлен ли пост в канал полностью.
+
+        Посты не новее даты, перенесённой из старого файла last_post/date,
+        тоже считаются доставленными.
+
+        Args:
+            post_key (str): Ключ поста.
+            channel (str): Канал Telegram.
+            date (Optional[int]): Дата поста (Unix timestamp).
+
+        Returns:
+            bool: True, если пост уже доставлен.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status FROM deliveries WHERE post_key = ? AND channel = ?', (post_key, channel)
+            ).fetchone()
+            legacy = self._conn.execute(
+                'SELECT value FROM meta WHERE key = ?', (f'last_date:{channel}',)
+            ).fetchone()
+        if row:
+            return row[0] == 'done'
+        return bool(legacy) and date is not None and date <= int(legacy[0])
+
+    def begin(self, post_key: str, channel: str, date: int) -> PostSteps:
+        """Начинаем или продолжаем доставку поста.
+
+        Args:
+            post_key (str): Ключ поста.
+            channel (str): Канал Telegram.
+            date (int): Дата поста (Unix timestamp).
+
+        Returns:
+            PostSteps: Шаги доставки, в том числе выполненные до перезапуска.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO deliveries (post_key, channel, date, status, updated_at) '
+                "VALUES (?, ?, ?, 'pending', ?)",
+                (post_key, channel, date, time.time())
+            )
+        return PostSteps(self, post_key, channel)
+
+    def completed_steps(self, post_key: str, channel: str) -> set:
+        """Получаем выполненные шаги доставки поста.
+
+        Args:
+            post_key (str): Ключ поста.
+            channel (str): Канал Telegram.
+
+        Returns:
+            set: Имена выполненных шагов.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT step FROM delivery_steps WHERE post_key = ? AND channel = ?', (post_key, channel)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_step(self, post_key: str, channel: str, step: str, ok: bool = True) -> None:
+        """Записываем выполненный шаг доставки.
+
+        Args:
+            post_key (str): Ключ поста.
+            channel (str): Канал Telegram.
+            step (str): Имя шага.
+            ok (bool): Успешно ли выполнен шаг.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO delivery_steps (post_key, channel, step, ok, sent_at) VALUES (?, ?, ?, ?, ?)',
+                (post_key, channel, step, int(ok), time.time())
+            )
+
+    def mark_done(self, post_key: str, channel: str) -> None:
+        """Отмечаем пост доставленным.
+
+        Args:
+            post_key (str): Ключ поста.
+            channel (str): Канал Telegram.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE deliveries SET status = 'done', updated_at = ? WHERE post_key = ? AND channel = ?",
+                (time.time(), post_key, channel)
+            )
+
+    def last_date(self, channel: str) -> Optional[int]:
+        """Получаем дату последнего доставленного в канал поста.
+
+        Args:
+            channel (str): Канал Telegram.
+
+        Returns:
+            Optional[int]: Unix timestamp или None, если в канал ещё ничего не доставлено.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(date) FROM deliveries WHERE channel = ? AND status = 'done'", (channel,)
+            ).fetchone()
+            legacy = self._conn.execute(
+                'SELECT value FROM meta WHERE key = ?', (f'last_date:{channel}',)
+            ).fetchone()
+        dates = [int(value) for value in (row[0], legacy[0] if legacy else None) if value is not None]
+        return max(dates) if dates else None
+
+    def recent_dates(self, channels: List[str], limit: int = 20) -> List[int]:
+        """Получаем даты последних доставленных постов, для оценки частоты публикаций.
+
+        Args:
+            channels (List[str]): Каналы Telegram.
+            limit (int): Сколько дат вернуть.
+
+        Returns:
+            List[int]: Даты публикации постов от новых к старым.
+        """
+        placeholders = ', '.join('?' * len(channels))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT date FROM deliveries WHERE channel IN ({placeholders}) AND status = 'done' "
+                'ORDER BY date DESC LIMIT ?', (*channels, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def import_last_date(self, channel: str, date: int) -> None:
+        """Переносим дату из старого файла last_post/date.
+
+        Args:
+            channel (str): Канал Telegram.
+            date (int): Unix timestamp последнего опубликованного поста.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (f'last_date:{channel}', str(date))
+            )
+
+    def close(self) -> None:
+        """Закрываем соединение с базой."""
+        with self._lock:
+            self._conn.close()
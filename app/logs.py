@@ -0,0 +1,215 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Optional, TextIO, Tuple
+import datetime
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMATS = ('text', 'json')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Сколько записей может ждать вывода, остальные отбрасываются, чтобы не блокировать отправку постов
+QUEUE_SIZE = 10000
+# Сколько разных шаблонов сообщений отслеживает ограничение повторов
+MAX_TEMPLATES = 1000
+
+# Атрибуты LogRecord, которые не считаются дополнительными полями записи
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """Разбираем уровни логов по модулям вида "telegram_api=WARNING,vkontakte_api=DEBUG".
+
+    Args:
+        value (str): Пары модуль=уровень через запятую. Модуль можно указывать с префиксом app.
+
+    Returns:
+        Dict[str, int]: Уровни по имени модуля без префикса.
+
+    Raises:
+        ValueError: Если пара записана неверно или уровень неизвестен.
+    """
+    levels = {}
+    for item in filter(None, (x.strip() for x in value.split(','))):
+        module, _, level = item.partition('=')
+        number = logging.getLevelName(level.strip().upper())
+        if not module.strip() or not isinstance(number, int):
+            raise ValueError(f"Неверный уровень лога для модуля: {item}")
+        levels[module.strip().rsplit('.', 1)[-1]] = number
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        """Собираем запись в одну строку JSON.
+
+        Кроме времени, уровня, логгера, модуля и текста в запись попадают
+        поля, переданные через extra.
+
+        Args:
+            record (logging.LogRecord): Запись лога.
+
+        Returns:
+            str: Строка JSON.
+        """
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ModuleLevelFilter(logging.Filter):
+    def __init__(self, level: int, module_levels: Dict[str, int]):
+        """Инициализируем фильтр уровней по модулям, из которых пишутся записи.
+
+        Компоненты получают общий логгер, поэтому модуль определяется по
+        файлу, из которого вызван логгер (record.module).
+
+        Args:
+            level (int): Уровень для модулей без своей настройки.
+            module_levels (Dict[str, int]): Уровни по имени модуля.
+        """
+        super().__init__()
+        self.level = level
+        self.module_levels = module_levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.module_levels.get(record.module, self.level)
+
+
+class RepeatFilter(logging.Filter):
+    def __init__(self, limit: int, interval: float, clock: Callable[[], float] = time.monotonic):
+        """Инициализируем ограничение повторяющихся сообщений.
+
+        Сообщения считаются одинаковыми, если у них один шаблон (первый
+        аргумент вызова логгера). Из одинаковых за interval секунд выводятся
+        первые limit, о пропущенных сообщается в следующем выведенном.
+        Ошибки выводятся всегда.
+
+        Args:
+            limit (int): Сколько одинаковых сообщений выводить за интервал, 0 - без ограничения.
+            interval (float): Длина интервала в секундах.
+            clock (Callable[[], float]): Источник монотонного времени.
+        """
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.clock = clock
+        # Для каждого шаблона: начало интервала, выведено за интервал, пропущено
+        self._counters: Dict[Tuple[str, int, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.limit or record.levelno >= logging.ERROR:
+            return True
+        key = (record.module, record.levelno, str(record.msg))
+        now = self.clock()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.interval:
+                suppressed = counter[2] if counter else 0
+                self._counters[key] = [now, 1, 0]
+                if len(self._counters) > MAX_TEMPLATES:
+                    # Сообщения из f-строк почти всегда уникальны, счётчики по ним не должны копиться
+                    self._counters = {key: value for key, value in self._counters.items()
+                                      if now - value[0] < self.interval and value[2]}
+                    self._counters[key] = [now, 1, 0]
+            elif counter[1] < self.limit:
+                counter[1] += 1
+                suppressed = 0
+            else:
+                counter[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SuppressedFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        """Добавляем к тексту число пропущенных одинаковых сообщений."""
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} (похожих сообщений пропущено: {suppressed})" if suppressed else text
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        """Инициализируем обработчик, который только кладёт запись в очередь.
+
+        Текст записи собирается потоком вывода, а не вызывающим кодом, поэтому
+        аргументы сообщения не должны меняться после вызова логгера. Если
+        очередь переполнена (вывод не успевает), запись отбрасывается.
+
+        Args:
+            log_queue (queue.Queue): Очередь записей для QueueListener.
+        """
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Очередь внутри процесса, запись передаётся как есть, без форматирования в потоке отправки
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    logger: logging.Logger,
+    level: int = logging.INFO,
+    module_levels: Optional[Dict[str, int]] = None,
+    log_format: str = 'text',
+    repeat_limit: int = 5,
+    repeat_interval: float = 60.0,
+    stream: TextIO = sys.stdout
+) -> QueueListener:
+    """Настраиваем неблокирующий вывод логов через очередь.
+
+    Вызывающий поток только фильтрует запись и кладёт её в очередь, текст
+    собирается и пишется в stream отдельным потоком QueueListener.
+
+    Args:
+        logger (logging.Logger): Логгер приложения.
+        level (int): Уровень по умолчанию.
+        module_levels (Optional[Dict[str, int]]): Уровни по модулям.
+        log_format (str): text - строки для чтения человеком, json - одна запись JSON на строку.
+        repeat_limit (int): Сколько одинаковых сообщений выводить за repeat_interval, 0 - все.
+        repeat_interval (float): Интервал ограничения повторов, секунд.
+        stream (TextIO): Куда писать логи.
+
+    Returns:
+        QueueListener: Запущенный поток вывода, его нужно остановить при выходе, чтобы дописать очередь.
+
+    Raises:
+        ValueError: Если формат неизвестен.
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Формат логов должен быть одним из: {', '.join(LOG_FORMATS)}")
+    module_levels = module_levels or {}
+
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else SuppressedFormatter(TEXT_FORMAT))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+    queue_handler.addFilter(ModuleLevelFilter(level, module_levels))
+    queue_handler.addFilter(RepeatFilter(repeat_limit, repeat_interval))
+
+    # Логгер пропускает самый подробный из уровней, точный уровень проверяет фильтр модулей
+    logger.setLevel(min([level, *module_levels.values()]))
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+    return listener
@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from typing import IO, Iterator, List, Optional
+import logging
+import os
+import tempfile
+import threading
+
+import requests
+from telebot.types import InputFile
+
+from app.transport import Timeout, build_session
+
+# Режимы пересылки фото через бота: не пересылать, только если Telegram не смог скачать URL, всегда
+RELAY_MODES = ('off', 'fallback', 'always')
+
+# Telegram принимает фото не больше 10 МБ
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+# Сколько байт фото можно загрузить одним альбомом. telebot собирает тело запроса
+# с файлами целиком в памяти, поэтому более тяжёлые альбомы загружаются по одному фото
+MAX_ALBUM_BYTES = 20 * 1024 * 1024
+
+
+class MediaRelay:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        mode: str = 'fallback',
+        max_downloads: int = 2,
+        chunk_size: int = 64 * 1024,
+        max_bytes: int = MAX_PHOTO_BYTES,
+        max_album_bytes: int = MAX_ALBUM_BYTES,
+        spool_dir: Optional[str] = None,
+        timeout: Timeout = (5, 60),
+        session: Optional[requests.Session] = None
+    ):
+        """Инициализируем пересылку фото из ВК в Telegram через бота.
+
+        Фото скачивается потоком небольшими блоками во временный файл на
+        диске и загружается в Telegram как файл. При загрузке тело запроса
+        собирается в памяти, поэтому альбом тяжелее max_album_bytes
+        загружается по одному фото: в памяти не бывает больше max_album_bytes
+        или одного фото.
+
+        Args:
+            logger (logging.Logger): Логгер для вывода сообщений.
+            mode (str): Режим из RELAY_MODES.
+            max_downloads (int): Сколько фото можно скачивать одновременно.
+            chunk_size (int): Размер блока при скачивании в байтах.
+            max_bytes (int): Максимальный размер фото в байтах.
+            max_album_bytes (int): Максимальный размер фото одного альбома в байтах.
+            spool_dir (Optional[str]): Каталог для временных файлов, по умолчанию системный.
+            timeout (Timeout): Таймаут запроса (connect, read) в секундах.
+            session (Optional[requests.Session]): Сессия с пулом соединений.
+        """
+        if mode not in RELAY_MODES:
+            raise ValueError(f"Неизвестный режим пересылки фото: {mode}")
+        self.logger = logger
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_album_bytes = max_album_bytes
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self.session = session or build_session(max_downloads)
+        self._downloads = threading.BoundedSemaphore(max_downloads)
+
+    @property
+    def always(self) -> bool:
+        """Пересылать ли фото через бота сразу, не пробуя отправку по URL."""
+        return self.mode == 'always'
+
+    @property
+    def enabled(self) -> bool:
+        """Включена ли пересылка фото через бота."""
+        return self.mode != 'off'
+
+    def fits_album(self, files: List[IO[bytes]]) -> bool:
+        """Проверяем, можно ли загрузить скачанные фото одним альбомом.
+
+        Args:
+            files (List[IO[bytes]]): Временные файлы скачанных фото.
+
+        Returns:
+            bool: True, если вместе они не больше max_album_bytes.
+        """
+        return sum(os.fstat(file.fileno()).st_size for file in files) <= self.max_album_bytes
+
+    @contextmanager
+    def open(self, url: str) -> Iterator[InputFile]:
+        """Скачиваем фото во временный файл и отдаём его для загрузки в Telegram.
+
+        Файл удаляется при выходе из контекста.
+
+        Args:
+            url (str): URL фото в ВК.
+
+        Yields:
+            InputFile: Файл для InputMediaPhoto или send_photo.
+
+        Raises:
+            requests.RequestException: Если скачать фото не удалось.
+            IOError: Если фото больше max_bytes.
+        """
+        with tempfile.TemporaryFile(dir=self.spool_dir) as spool:
+            size = 0
+            with self._downloads, self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(self.chunk_size):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise IOError(f"Фото больше {self.max_bytes} байт: {url}")
+                    spool.write(chunk)
+            spool.seek(0)
+            self.logger.debug("Фото скачано для пересылки, %d байт", size)
+            yield InputFile(spool, file_name='photo.jpg')
@@ -0,0 +1,310 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar
+import logging
+import math
+import threading
+import time
+
+# Границы корзин гистограмм длительности по умолчанию, секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Границы корзин задержки доставки поста: от секунды до суток
+LAG_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0, 7200.0, 14400.0, 43200.0, 86400.0)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+M = TypeVar('M', bound='Metric')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Инициализируем метрику с набором меток.
+
+        Args:
+            name (str): Имя метрики в формате Prometheus.
+            documentation (str): Описание для строки HELP.
+            labelnames (Sequence[str]): Имена меток.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {', '.join(self.labelnames) or 'без меток'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, func: Callable[[], float], **labels: Any) -> None:
+        """Берём значение из функции при каждом чтении метрик, например размер очереди.
+
+        Args:
+            func (Callable[[], float]): Функция, возвращающая текущее значение.
+            **labels (Any): Значения меток.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def _values(self) -> Dict[LabelValues, float]:
+        return {}
+
+    def samples(self) -> Iterator[Sample]:
+        """Значения метрики для вывода.
+
+        Yields:
+            Sample: Имя ряда, метки и значение.
+        """
+        with self._lock:
+            values = dict(self._values())
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                values[key] = float(func())
+            except Exception:
+                # Значение, которое не удалось получить, просто не выводится
+                continue
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Инициализируем счётчик, который только растёт."""
+        super().__init__(name, documentation, labelnames)
+        self._counts: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """Увеличиваем счётчик.
+
+        Args:
+            amount (float): На сколько увеличить, не меньше 0.
+            **labels (Any): Значения меток.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0.0) + amount
+
+    def _values(self) -> Dict[LabelValues, float]:
+        return self._counts
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Инициализируем метрику с произвольным текущим значением."""
+        super().__init__(name, documentation, labelnames)
+        self._current: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        """Задаём текущее значение.
+
+        Args:
+            value (float): Значение.
+            **labels (Any): Значения меток.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._current[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """Изменяем текущее значение на amount."""
+        key = self._key(labels)
+        with self._lock:
+            self._current[key] = self._current.get(key, 0.0) + amount
+
+    def _values(self) -> Dict[LabelValues, float]:
+        return self._current
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Инициализируем гистограмму с фиксированными корзинами.
+
+        Args:
+            name (str): Имя метрики.
+            documentation (str): Описание для строки HELP.
+            labelnames (Sequence[str]): Имена меток, метка le добавляется сама.
+            buckets (Sequence[float]): Верхние границы корзин по возрастанию.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Для каждого набора меток: количество в каждой корзине (не накопленное) и сумма
+        self._observations: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """Записываем наблюдение.
+
+        Args:
+            value (float): Значение, например длительность в секундах.
+            **labels (Any): Значения меток.
+        """
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._observations.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Записываем длительность блока with в секундах.
+
+        Args:
+            **labels (Any): Значения меток.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            observations = sorted((key, (list(counts), total[0]))
+                                  for key, (counts, total) in self._observations.items())
+        for key, (counts, total) in observations:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Инициализируем реестр метрик процесса.
+
+        Компоненты получают метрики по имени через counter, gauge и histogram:
+        повторный запрос с тем же именем возвращает уже созданную метрику,
+        поэтому несколько ботов или источников пишут в общие ряды. Вместо
+        реестра можно передать любой объект с такими же методами, например
+        обёртку над другой системой метрик.
+        """
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls: Type[M], name: str, documentation: str, labelnames: Sequence[str], **kwargs: Any) -> M:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом или метками")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Получаем или создаём счётчик."""
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Получаем или создаём метрику текущего значения."""
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Получаем или создаём гистограмму."""
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Выводим все метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: Текст для ответа /metrics.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if label_text
+                             else f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Реестр по умолчанию для компонентов, которым реестр не передан явно
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    def __init__(self, host: str, port: int, registry: MetricsRegistry, logger: logging.Logger,
+                 path: str = '/metrics'):
+        """Инициализируем HTTP-сервер, отдающий метрики в формате Prometheus.
+
+        Args:
+            host (str): Адрес, на котором слушать.
+            port (int): Порт, 0 - выбрать свободный.
+            registry (MetricsRegistry): Реестр метрик.
+            logger (logging.Logger): Логгер для вывода сообщений.
+            path (str): Путь, по которому отдаются метрики.
+        """
+        self.registry = registry
+        self.logger = logger
+        self.path = path
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Порт, на котором слушает сервер."""
+        return self._server.server_address[1]
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != server.path:
+                    self._reply(404, 'not found', 'text/plain; charset=utf-8')
+                    return
+                self._reply(200, server.registry.render(), 'text/plain; version=0.0.4; charset=utf-8')
+
+            def _reply(self, status: int, text: str, content_type: str) -> None:
+                data = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        """Запускаем сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Метрики доступны на порту {self.port}, путь {self.path}")
+
+    def stop(self) -> None:
+        """Останавливаем сервер."""
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.photo_size import PhotoSizeSelector
+
+
+@dataclass(slots=True)
+class Owner:
+    """Пользователь или группа ВК. ID групп отрицательные, как в owner_id постов."""
+    id: int
+    name: str
+
+    @classmethod
+    def from_profile(cls, profile: Dict[str, Any]) -> Owner:
+        """Создаём владельца из элемента profiles ответа VK API."""
+        return cls(int(profile['id']), f"{profile['first_name']} {profile['last_name']}")
+
+    @classmethod
+    def from_group(cls, group: Dict[str, Any]) -> Owner:
+        """Создаём владельца из элемента groups ответа VK API."""
+        return cls(-int(group['id']), group['name'])
+
+
+@dataclass(slots=True)
+class Photo:
+    """Фото с одним выбранным вариантом размера."""
+    owner_id: int
+    id: int
+    type: str
+    url: str
+    width: int = 0
+    height: int = 0
+
+    @property
+    def key(self) -> str:
+        """Ключ фото для кэша file_id: owner_id_id_размер."""
+        return f"{self.owner_id}_{self.id}_{self.type}"
+
+    @classmethod
+    def from_vk(cls, photo: Dict[str, Any], photo_sizes: PhotoSizeSelector) -> Photo:
+        """Создаём фото из вложения VK API, выбирая вариант размера.
+
+        Args:
+            photo (Dict[str, Any]): Поле photo вложения.
+            photo_sizes (PhotoSizeSelector): Выбор варианта фото.
+
+        Returns:
+            Photo: Фото.
+        """
+        size = photo_sizes.select_size(photo['sizes'])
+        return cls(photo.get('owner_id'), photo.get('id'), size.get('type', ''), size['url'],
+                   size.get('width') or 0, size.get('height') or 0)
+
+
+@dataclass(slots=True)
+class Video:
+    """Видео. Ссылка на плеер есть не у всех видео."""
+    owner_id: int
+    id: int
+    player: Optional[str] = None
+
+    @classmethod
+    def from_vk(cls, video: Dict[str, Any]) -> Video:
+        """Создаём видео из вложения VK API."""
+        return cls(video.get('owner_id'), video.get('id'), video.get('player'))
+
+
+@dataclass(slots=True)
+class Link:
+    """Ссылка из вложения: ссылка, документ, товар и другие вложения с полем url."""
+    url: str
+
+
+@dataclass(slots=True)
+class Post:
+    """Пост ВК: только поля, которые используются при обработке."""
+    owner_id: int
+    id: int
+    date: int
+    text: str = ''
+    is_pinned: bool = False
+    photos: List[Photo] = field(default_factory=list)
+    videos: List[Video] = field(default_factory=list)
+    links: List[Link] = field(default_factory=list)
+    coowner_ids: List[int] = field(default_factory=list)
+    repost: Optional[Post] = None
+
+    @property
+    def key(self) -> str:
+        """Ключ поста вида owner_id_id."""
+        return f"{self.owner_id}_{self.id}"
+
+    @classmethod
+    def from_vk(cls, item: Dict[str, Any], photo_sizes: PhotoSizeSelector) -> Post:
+        """Создаём пост из элемента items ответа wall.get или wall.getById.
+
+        Из репостов берётся только первый (copy_history[0]), как и при отправке.
+
+        Args:
+            item (Dict[str, Any]): Пост из VK API.
+            photo_sizes (PhotoSizeSelector): Выбор варианта фото.
+
+        Returns:
+            Post: Пост.
+        """
+        post = cls(int(item['owner_id']), int(item['id']), int(item.get('date', 0)), item.get('text', ''),
+                   bool(item.get('is_pinned')))
+
+        for attach in item.get('attachments', []):
+            kind = attach['type']
+            if kind == 'photo':
+                post.photos.append(Photo.from_vk(attach['photo'], photo_sizes))
+            elif kind == 'video':
+                post.videos.append(Video.from_vk(attach['video']))
+            elif isinstance(attach.get(kind), dict) and 'url' in attach[kind]:
+                post.links.append(Link(attach[kind]['url']))
+
+        if 'coowners' in item:
+            post.coowner_ids = [int(x['owner_id']) for x in item['coowners']['list']]
+        if item.get('copy_history'):
+            post.repost = cls.from_vk(item['copy_history'][0], photo_sizes)
+        return post
+
+
+def parse_posts(data: Dict[str, Any], photo_sizes: PhotoSizeSelector) -> List[Post]:
+    """Разбираем посты из ответа wall.get или wall.getById.
+
+    Args:
+        data (Dict[str, Any]): Поле response ответа VK API.
+        photo_sizes (PhotoSizeSelector): Выбор варианта фото.
+
+    Returns:
+        List[Post]: Посты в порядке ответа.
+    """
+    return [Post.from_vk(item, photo_sizes) for item in data.get('items', [])]
+
+
+def parse_owners(data: Dict[str, Any]) -> List[Owner]:
+    """Разбираем массивы profiles и groups ответа VK API с extended=1.
+
+    Args:
+        data (Dict[str, Any]): Поле response ответа VK API.
+
+    Returns:
+        List[Owner]: Пользователи и группы.
+    """
+    profiles = [Owner.from_profile(profile) for profile in data.get('profiles', [])]
+    return profiles + [Owner.from_group(group) for group in data.get('groups', [])]
@@ -0,0 +1,71 @@
+from typing import Any, Dict, List, Optional
+
+# Типы размеров фото ВК от меньшего к большему, если ширина и высота не указаны
+SIZE_TYPES = 'smopqrxyzw'
+
+# Максимальная сторона фото по умолчанию: Telegram всё равно сжимает фото до 2560 пикселей
+MAX_SIDE = 2560
+
+# Примерный вес JPEG ВК в байтах на пиксель, для выбора размера по весу
+JPEG_BYTES_PER_PIXEL = 0.25
+
+
+def size_area(size: Dict[str, Any]) -> int:
+    """Площадь варианта фото в пикселях.
+
+    Args:
+        size (Dict[str, Any]): Вариант фото из поля sizes.
+
+    Returns:
+        int: Ширина на высоту или 0, если размеры не указаны.
+    """
+    return (size.get('width') or 0) * (size.get('height') or 0)
+
+
+def _size_rank(size: Dict[str, Any]) -> tuple:
+    # Старые фото ВК приходят без ширины и высоты, тогда сравниваем по типу
+    return size_area(size), SIZE_TYPES.find(size.get('type', ''))
+
+
+class PhotoSizeSelector:
+    def __init__(self, max_side: int = MAX_SIDE, target_kb: Optional[int] = None):
+        """Инициализируем выбор варианта фото для отправки.
+
+        Args:
+            max_side (int): Наибольший размер стороны в пикселях, 0 - без ограничения.
+                Выбирается самый большой вариант, который в него помещается.
+            target_kb (Optional[int]): Если задан, выбирается вариант, чей примерный
+                вес ближе всего к target_kb килобайт. max_side при этом тоже действует.
+        """
+        self.max_side = max_side
+        self.target_kb = target_kb
+
+    def fits(self, size: Dict[str, Any]) -> bool:
+        """Помещается ли вариант фото в max_side.
+
+        Args:
+            size (Dict[str, Any]): Вариант фото.
+
+        Returns:
+            bool: True, если ограничения нет, размеры не указаны или обе стороны не больше max_side.
+        """
+        if not self.max_side or not size_area(size):
+            return True
+        return max(size['width'], size['height']) <= self.max_side
+
+    def select_size(self, sizes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Выбираем вариант фото по площади с учётом ограничений.
+
+        Args:
+            sizes (List[Dict[str, Any]]): Поле sizes фото из VK API.
+
+        Returns:
+            Dict[str, Any]: Выбранный вариант. Если ни один не помещается в max_side,
+                возвращается наименьший.
+        """
+        fitting = [size for size in sizes if self.fits(size)] or [min(sizes, key=_size_rank)]
+        if self.target_kb:
+            target = self.target_kb * 1024 / JPEG_BYTES_PER_PIXEL
+            # При равном отклонении берём больший вариант
+            return min(fitting, key=lambda size: (abs(size_area(size) - target), -size_area(size)))
+        return max(fitting, key=_size_rank)
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+import random
+import time
+
+# Сколько раз опрашивать источник за средний промежуток между его постами
+POLLS_PER_GAP = 4
+# Во сколько раз растёт интервал после пустой проверки
+BACKOFF = 1.5
+# Во сколько средних промежутков без постов источник считается затихшим
+QUIET_GAPS = 2
+# Сдвиг первых проверок соседних источников, секунд
+STAGGER = 15
+
+
+@dataclass
+class PollState:
+    """Состояние опроса одного источника."""
+    interval: float
+    next_poll: float
+    gap: Optional[float] = None
+    last_post: Optional[float] = None
+    fixed: Optional[float] = None
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        initial_interval: float,
+        alpha: float = 0.3,
+        jitter: float = 0.1,
+        clock: Callable[[], float] = time.time,
+        rand: Callable[[], float] = random.random
+    ):
+        """Инициализируем планировщик проверок ВК, подстраивающийся под частоту постов.
+
+        Для каждого источника считается скользящее среднее (EWMA) промежутка
+        между постами. После нового поста источник проверяется с минимальным
+        интервалом, затем интервал растёт до четверти среднего промежутка,
+        а если источник затих - до max_interval. Интервалы слегка случайны,
+        чтобы проверки разных источников не совпадали.
+
+        Args:
+            min_interval (float): Минимальный интервал между проверками, секунд.
+            max_interval (float): Максимальный интервал, секунд.
+            initial_interval (float): Интервал, пока о частоте постов ничего не известно.
+            alpha (float): Вес нового промежутка в скользящем среднем.
+            jitter (float): Доля случайного разброса интервала.
+            clock (Callable[[], float]): Источник времени (Unix timestamp).
+            rand (Callable[[], float]): Генератор случайных чисел от 0 до 1.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.initial_interval = self._clamp(initial_interval)
+        self.alpha = alpha
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+        self.states: Dict[Hashable, PollState] = {}
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _update_gap(self, state: PollState, dates: Iterable[float]) -> None:
+        for date in sorted(dates):
+            if state.last_post is not None and date > state.last_post:
+                gap = date - state.last_post
+                state.gap = gap if state.gap is None else self.alpha * gap + (1 - self.alpha) * state.gap
+            if state.last_post is None or date > state.last_post:
+                state.last_post = date
+
+    def add(self, key: Hashable, history: Iterable[float] = (), fixed: Optional[float] = None) -> None:
+        """Добавляем источник. Первые проверки источников сдвигаются на STAGGER секунд друг от друга.
+
+        Args:
+            key (Hashable): Ключ источника.
+            history (Iterable[float]): Даты уже доставленных постов источника для начальной оценки.
+            fixed (Optional[float]): Постоянный интервал вместо подстройки, например для
+                редких сверочных проверок источников с Callback API.
+        """
+        state = PollState(self.initial_interval, self.clock() + len(self.states) * STAGGER, fixed=fixed)
+        self._update_gap(state, history)
+        self.states[key] = state
+        state.interval = fixed or self.target_interval(key)
+
+    def target_interval(self, key: Hashable) -> float:
+        """Интервал для источника без новых постов по оценке частоты.
+
+        Args:
+            key (Hashable): Ключ источника.
+
+        Returns:
+            float: Интервал в секундах в пределах min_interval и max_interval.
+        """
+        state = self.states[key]
+        if state.gap is None:
+            return self.initial_interval
+        if state.last_post is not None and self.clock() - state.last_post > QUIET_GAPS * state.gap:
+            return self.max_interval
+        return self._clamp(state.gap / POLLS_PER_GAP)
+
+    def record(self, key: Hashable, dates: List[float]) -> float:
+        """Записываем результат проверки и планируем следующую.
+
+        Args:
+            key (Hashable): Ключ источника.
+            dates (List[float]): Даты новых постов, найденных при проверке.
+
+        Returns:
+            float: Интервал до следующей проверки в секундах.
+        """
+        state = self.states[key]
+        if state.fixed:
+            state.interval = state.fixed
+        elif dates:
+            self._update_gap(state, dates)
+            state.interval = self.min_interval
+        else:
+            state.interval = self._clamp(min(state.interval * BACKOFF, max(self.target_interval(key), state.interval)))
+
+        interval = state.interval * (1 + self.jitter * (2 * self.rand() - 1))
+        state.next_poll = self.clock() + interval
+        return interval
+
+    def postpone(self, key: Hashable, seconds: float) -> None:
+        """Откладываем проверку без изменения интервала, например пока источник обрабатывает другой процесс.
+
+        Args:
+            key (Hashable): Ключ источника.
+            seconds (float): Через сколько секунд проверить снова.
+        """
+        self.states[key].next_poll = self.clock() + seconds
+
+    def due(self) -> List[Hashable]:
+        """Источники, которые пора проверить, в порядке времени проверки.
+
+        Returns:
+            List[Hashable]: Ключи источников.
+        """
+        now = self.clock()
+        due = [key for key, state in self.states.items() if state.next_poll <= now]
+        return sorted(due, key=lambda key: self.states[key].next_poll)
+
+    def delay(self, key: Optional[Hashable] = None) -> float:
+        """Секунды до ближайшей проверки.
+
+        Args:
+            key (Optional[Hashable]): Ключ источника. Если не указан - ближайшая проверка любого источника.
+
+        Returns:
+            float: Задержка, не меньше 0.
+        """
+        states = [self.states[key]] if key is not None else self.states.values()
+        next_poll = min((state.next_poll for state in states), default=self.clock() + self.initial_interval)
+        return max(0.0, next_poll - self.clock())
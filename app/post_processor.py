@@ -1,12 +1,135 @@
 from __future__ import annotations
-from typing import Tuple, List, Dict, Any, TYPE_CHECKING
+from typing import Tuple, List, Callable, Iterable, Iterator, Optional, TYPE_CHECKING
+from bisect import bisect_right
+from dataclasses import dataclass, field
+import html
 import re
 import logging
+import time
+
+from app.metrics import MetricsRegistry, REGISTRY
+from app.models import Photo, Post
 
 if TYPE_CHECKING:
+    from app.composer import MessagePart
     from app.vkontakte_api import VkAPI
     from app.telegram_api import TelegramBot
 
+# Упоминания ВК вида [id123|Имя], [club123|Название] и [public123|Название]
+MENTION_RE = re.compile(r'\[(id|club|public)(\d+)\|([^\[\]]*)\]')
+# Символы, которые нужно экранировать в режиме MarkdownV2
+MARKDOWN_RE = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+
+# Ограничения Telegram в кодовых единицах UTF-16: текст сообщения и подпись к медиа
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+# Границы разбиения текста в порядке предпочтения: абзац, строка или предложение, слово
+BREAKERS = (
+    ('\n\n',),
+    ('\n', '. ', '! ', '? ', '… ', ': '),
+    (' ',),
+)
+
+# Фрагменты разметки, которые нельзя разрывать: ссылки, теги, экранированные символы
+ENTITY_RES = {
+    'HTML': re.compile(r'<a\s[^>]*>.*?</a>|<[^>]*>|&#?\w+;', re.S),
+    'MarkdownV2': re.compile(r'\[(?:[^\]\\]|\\.)*\]\((?:[^)\\]|\\.)*\)|\\.', re.S),
+}
+
+
+def utf16_len(text: str) -> int:
+    """Считаем длину текста в кодовых единицах UTF-16, как это делает Telegram.
+
+    Args:
+        text (str): Текст.
+
+    Returns:
+        int: Длина в UTF-16.
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _utf16_end(text: str, start: int, limit: int) -> int:
+    """Находим конец самого длинного фрагмента text[start:end] длиной не больше limit в UTF-16."""
+    end = min(len(text), start + limit)
+    units = utf16_len(text[start:end])
+    # Символы вне BMP (эмодзи) занимают две единицы, отступаем, пока не влезем в лимит
+    while units > limit:
+        end -= 1
+        units -= 2 if ord(text[end]) > 0xFFFF else 1
+    return end
+
+
+def _find_break(text: str, start: int, end: int, spans: List[Tuple[int, int]], span_starts: List[int]) -> int:
+    """Выбираем место разреза в окне text[start:end], не попадающее внутрь разметки."""
+
+    def outside_entity(position: int) -> int:
+        index = bisect_right(span_starts, position) - 1
+        if index >= 0 and spans[index][0] < position < spans[index][1]:
+            return spans[index][0]
+        return position
+
+    for separators in BREAKERS:
+        position = max(text.rfind(separator, start, end) + len(separator) for separator in separators)
+        if position > start + len(separators[0]) and position <= end:
+            position = outside_entity(position)
+            if position > start:
+                return position
+
+    position = outside_entity(end)
+    return position if position > start else end
+
+
+# Стадии обработки поста в порядке выполнения. Фильтры идут до получения имён,
+# чтобы пропущенные посты не стоили запросов к ВК. Стадия owners выполняется
+# сразу для всех постов страницы
+STAGES = ('extract', 'filter', 'owners', 'format', 'split')
+# Стадии, без которых пост не собрать
+REQUIRED_STAGES = ('extract', 'format')
+
+# Строка перед ссылкой на пост, если видео нельзя открыть по ссылке плеера
+VIDEO_NOTICE = '# Для просмотра видео, пожалуйста, перейдите по ссылке ниже '
+
+# Фильтр возвращает причину пропуска поста или None, преобразование меняет собранный текст
+PostFilter = Callable[['PostDraft'], Optional[str]]
+TextTransform = Callable[[str], str]
+
+
+def owner_placeholder(owner_id: int) -> str:
+    """Подпись автора по ID, если его имя неизвестно.
+
+    Args:
+        owner_id (int): ID владельца (положительный для пользователей, отрицательный для групп).
+
+    Returns:
+        str: idN или clubN.
+    """
+    return f'id{owner_id}' if owner_id > 0 else f'club{-owner_id}'
+
+
+@dataclass
+class Quote:
+    """Цитата в посте: текст соавторов или репоста с подписью авторов."""
+    owner_ids: List[int]
+    text: str
+    names: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PostDraft:
+    """Пост на пути через стадии обработки."""
+    post: Post
+    url: str
+    text: str = ''
+    quotes: List[Quote] = field(default_factory=list)
+    images: List[Photo] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    is_repost: bool = False
+    skip_reason: Optional[str] = None
+    message: str = ''
+    parts: Optional[List[MessagePart]] = None
+
 
 class PostProcessor:
     def __init__(
@@ -16,10 +139,21 @@ class PostProcessor:
         include_link: bool,
         preview_link: bool,
         reposts: bool,
-        logger: logging.Logger
+        logger: logging.Logger,
+        media_caption: bool = True,
+        stages: Iterable[str] = STAGES,
+        filters: Optional[List[PostFilter]] = None,
+        transforms: Optional[List[TextTransform]] = None,
+        metrics: Optional[MetricsRegistry] = None
     ):
         """Инициализируем обработчик постов.
 
+        Пост проходит стадии STAGES: extract разбирает вложения, filter
+        применяет фильтры, owners получает имена авторов цитат, format
+        собирает текст, split раскладывает его на сообщения Telegram.
+        Страница постов обрабатывается в три шага: screen для каждого поста,
+        resolve_owners для оставшихся постов одним запросом и finish.
+
         Args:
             bot (TelegramBot): Telegram-бот.
             vk_api (VkAPI): VK API клиент.
@@ -27,145 +161,270 @@ class PostProcessor:
             preview_link (bool): Включать ли предпросмотр ссылок.
             reposts (bool): Разрешать ли репосты.
             logger (logging.Logger): Логгер для вывода сообщений.
+            media_caption (bool): Отправлять ли короткий текст подписью к фото.
+            stages (Iterable[str]): Включённые стадии. Без owners авторы подписываются
+                по ID, без filter посты не фильтруются, без split сообщения собираются
+                при отправке для каждого канала.
+            filters (Optional[List[PostFilter]]): Дополнительные фильтры постов.
+            transforms (Optional[List[TextTransform]]): Преобразования собранного текста.
+            metrics (Optional[MetricsRegistry]): Реестр метрик, по умолчанию общий REGISTRY.
+
+        Raises:
+            ValueError: Если стадия неизвестна или не включена обязательная.
         """
+        stages = set(stages)
+        unknown = stages - set(STAGES)
+        if unknown:
+            raise ValueError(f"Неизвестные стадии обработки: {', '.join(sorted(unknown))}")
+        missing = set(REQUIRED_STAGES) - stages
+        if missing:
+            raise ValueError(f"Обязательные стадии обработки не включены: {', '.join(sorted(missing))}")
+
         self.bot = bot
         self.vk_api = vk_api
         self.include_link = include_link
         self.preview_link = preview_link
         self.reposts = reposts
         self.logger = logger
+        self.media_caption = media_caption
+        self.filters: List[PostFilter] = [self.skip_repost] + list(filters or [])
+        self.transforms = list(transforms or [])
+        # Стадии до owners и после неё, сама owners выполняется для нескольких постов сразу
+        owners = STAGES.index('owners')
+        self.screen_stages: List[Callable[[PostDraft], None]] = [
+            getattr(self, f'_stage_{name}') for name in STAGES[:owners] if name in stages]
+        self.resolve_names = 'owners' in stages
+        self.finish_stages: List[Callable[[PostDraft], None]] = [
+            getattr(self, f'_stage_{name}') for name in STAGES[owners + 1:] if name in stages]
+        self.metrics = metrics or REGISTRY
+        self.stage_seconds = self.metrics.histogram(
+            'vk2tg_stage_seconds', 'Длительность стадий обработки поста', ('stage',))
+        self.posts_total = self.metrics.counter(
+            'vk2tg_posts_processed_total', 'Обработанные посты', ('source', 'result'))
+
+    def process(self, post: Post) -> PostDraft:
+        """Прогоняем один пост через все включённые стадии.
+
+        Подходит для отдельных постов (события, список last_post/posts).
+        Для страницы постов имена авторов лучше получать одним запросом:
+        screen, resolve_owners и finish.
+
+        Args:
+            post (Post): Пост ВК.
+
+        Returns:
+            PostDraft: Обработанный пост. Если фильтр отклонил пост, заполнена только
+                причина skip_reason, остальные стадии не выполняются.
+        """
+        draft = self.screen(post)
+        if not draft.skip_reason:
+            self.resolve_owners([draft])
+            self.finish(draft)
+        return draft
+
+    def screen(self, post: Post) -> PostDraft:
+        """Прогоняем пост через стадии до owners: разбор вложений и фильтры.
+
+        Args:
+            post (Post): Пост ВК.
+
+        Returns:
+            PostDraft: Пост после фильтров. Если фильтр отклонил пост, заполнена причина skip_reason.
+        """
+        draft = PostDraft(post, f"https://vk.ru/{self.vk_api.domain_vk}?w=wall{post.key}")
+        self._run_stages(draft, self.screen_stages)
+        if draft.skip_reason:
+            self.posts_total.inc(source=self.vk_api.domain_vk, result='skipped')
+        return draft
+
+    def resolve_owners(self, drafts: Iterable[PostDraft]) -> None:
+        """Стадия owners: получаем имена авторов цитат всех постов из кэша и одним пакетным запросом.
+
+        Вызывается для постов после screen и поиска повторов, поэтому имена
+        запрашиваются только для постов, которые будут отправлены. Автор,
+        имя которого не удалось получить, подписывается по ID.
+
+        Args:
+            drafts (Iterable[PostDraft]): Посты, прошедшие фильтры.
+        """
+        quotes = [quote for draft in drafts for quote in draft.quotes]
+        if not self.resolve_names or not quotes:
+            return
+        started = time.perf_counter()
+        names = self.vk_api.resolve_owner_names(owner_id for quote in quotes for owner_id in quote.owner_ids)
+        for quote in quotes:
+            quote.names = [names.get(owner_id) or owner_placeholder(owner_id) for owner_id in quote.owner_ids]
+        self.stage_seconds.observe(time.perf_counter() - started, stage='owners')
+
+    def finish(self, draft: PostDraft) -> PostDraft:
+        """Прогоняем пост через стадии после owners: текст и сообщения Telegram.
+
+        Args:
+            draft (PostDraft): Пост после screen и resolve_owners.
+
+        Returns:
+            PostDraft: Обработанный пост.
+        """
+        self._run_stages(draft, self.finish_stages)
+        self.posts_total.inc(source=self.vk_api.domain_vk, result='processed')
+        self.logger.info("Обработан пост: %s", draft.url)
+        return draft
+
+    def _run_stages(self, draft: PostDraft, stages: List[Callable[[PostDraft], None]]) -> None:
+        """Выполняем стадии по очереди, пока фильтр не отклонит пост."""
+        for stage in stages:
+            started = time.perf_counter()
+            stage(draft)
+            self.stage_seconds.observe(time.perf_counter() - started, stage=stage.__name__[len('_stage_'):])
+            if draft.skip_reason:
+                return
 
-    def process_post(self, post: Dict[str, Any]) -> Tuple[str, List[Dict]]:
-        """Обрабатываем пост ВК и возвращаем текст и изображения для отправки.
+    def skip_repost(self, draft: PostDraft) -> Optional[str]:
+        """Фильтр репостов, если они отключены.
 
         Args:
-            post (Dict[str, Any]): Данные поста из VK API.
+            draft (PostDraft): Пост после стадии extract.
 
         Returns:
-            Tuple[str, List[Dict]]: Текст сообщения и список изображений.
+            Optional[str]: Причина пропуска или None.
         """
-        text = post.get('text', '')
-        copy_history_text = ''
-        images = []
-        links = []
-
-        # Проверка, есть ли аттачи к посту
-        if 'attachments' in post:
-            have_video = False
-            for attach in post['attachments']:
-                if attach['type'] == 'photo':
-                    images.append(attach['photo'])
-                elif attach['type'] == 'video' and not have_video:
-                    links.insert(0, '# Для просмотра видео, пожалуйста, перейдите по ссылке ниже ')
-                    have_video = True
-                    if 'player' in attach['video']:
-                        links.append(video['player'])
-                else:
-                    for (key, value) in attach.items():
-                        if key != 'type' and 'url' in value:
-                            links.append(value['url'])
-
-        post_url = f"https://vk.ru/{self.vk_api.domain_vk}?w=wall{str(post['owner_id'])}_{str(post['id'])}"
-
-        # Есть соавторство поста
-        if 'coowners' in post:
-            text = ""
-            copy_history_text = post['text']
-
-            # Добавление строки с савторами поста
-            owner_list = post['coowners']['list']
-            owner_names = [self.vk_api.get_owner_name_by_id(x['owner_id']) for x in owner_list]
-            owners = " & ".join(owner_names)
-            
-            copy_history_text = f"\n \N{speech balloon} {owners}:\n{copy_history_text}"
-                    
+        if draft.is_repost and not self.reposts:
+            return 'перепост отключен'
+        return None
+
+    def _stage_extract(self, draft: PostDraft) -> None:
+        """Разбираем текст, соавторов, репост и вложения поста."""
+        post = draft.post
+        draft.text = post.text
+        self._extract_attachments(draft, post)
+
+        # Есть соавторство поста: текст поста подписывается соавторами
+        if post.coowner_ids:
+            draft.text = ''
+            draft.quotes.append(Quote(post.coowner_ids, post.text))
+
         # Это репост другой записи
-        if 'copy_history' in post:
-            copy_history = post['copy_history'][0]
-            copy_history_text = copy_history['text']
-
-            # Добавление строки с автором репоста
-            owner_id = int(copy_history['owner_id'])
-            owner_name = self.vk_api.get_owner_name_by_id(owner_id)
-            copy_history_text = f"\n \N{speech balloon} {owner_name}:\n{copy_history_text}"
-
-            # Проверка, есть ли аттачи у репоста
-            if 'attachments' in copy_history:
-                have_video = False
-                for attach in copy_history['attachments']:
-                    if attach['type'] == 'photo':
-                        images.append(attach['photo'])
-                    elif attach['type'] == 'video' and have_video is False:
-                        video = attach['video']
-                        if 'player' in video:
-                            links.append(video['player'])
-                        elif self.include_link:
-                            # пока с видео бяда у ВК, player не у всех есть
-                            links.append('# Для просмотра видео, пожалуйста, перейдите по ссылке ниже ')
-                            have_video = True
-
-                    elif self.include_link:
-                        if attach['type'] == 'link':
-                            links.append(attach['link']['url'])
-                        else:
-                            for key, value in attach.items():
-                                if key != 'type' and 'url' in value:
-                                    links.append(value['url'])
-
-        # Добавление ссылок, если надо
+        if post.repost:
+            draft.is_repost = True
+            draft.quotes.append(Quote([post.repost.owner_id], post.repost.text))
+            self._extract_attachments(draft, post.repost)
+
+    def _extract_attachments(self, draft: PostDraft, post: Post) -> None:
+        """Добавляем фото и ссылки из вложений поста или репоста."""
+        draft.images.extend(post.photos)
+        # Берётся только первое видео
+        if post.videos:
+            if post.videos[0].player:
+                draft.links.append(post.videos[0].player)
+            elif self.include_link:
+                # пока с видео бяда у ВК, player не у всех есть
+                draft.links.append(VIDEO_NOTICE)
+        if self.include_link:
+            draft.links.extend(link.url for link in post.links)
+
+    def _stage_filter(self, draft: PostDraft) -> None:
+        """Применяем фильтры, первый сработавший задаёт причину пропуска."""
+        for post_filter in self.filters:
+            reason = post_filter(draft)
+            if reason:
+                draft.skip_reason = reason
+                return
+
+    def _stage_format(self, draft: PostDraft) -> None:
+        """Собираем текст сообщения: текст поста, цитаты и ссылки."""
+        quotes = []
+        for quote in draft.quotes:
+            names = quote.names or [owner_placeholder(x) for x in quote.owner_ids]
+            quotes.append(f"\n \N{speech balloon} {' & '.join(names)}:\n{quote.text}")
+
+        links = list(draft.links)
+        # Добавление ссылки на пост, если надо
         if self.include_link:
-            links.append(f"\n ВК: {post_url} \n")
+            links.append(f"\n ВК: {draft.url} \n")
+
+        message = '\n'.join([draft.text, ''.join(quotes)] + links)
+        for transform in self.transforms:
+            message = transform(message)
+        draft.message = message
 
-        # Сборка всего текста
-        text = '\n'.join([text] + [copy_history_text] + links)
-        self.logger.info(f"Обработан пост: {post_url}")
+    def _stage_split(self, draft: PostDraft) -> None:
+        """Раскладываем текст и фото на сообщения Telegram один раз для всех каналов."""
+        # composer сам импортирует этот модуль, поэтому импорт здесь
+        from app.composer import compose_message
 
-        return text, images
+        parse_mode = self.bot.parse_mode if self.bot else None
+        draft.parts = compose_message(draft.message, draft.images, parse_mode, self.media_caption)
 
     @staticmethod
-    def clean_text(text: str) -> str:
-        """Очищаем текст от ВК-ссылок вида [id123| ] и [club123| ].
+    def clean_text(text: str, parse_mode: Optional[str] = None) -> str:
+        """Заменяем ВК-упоминания вида [id123|Имя], [club123|Имя] и [public123|Имя].
+
+        Текст проходится один раз. Без parse_mode упоминание заменяется на имя,
+        с parse_mode - на ссылку Telegram, а остальной текст экранируется.
 
         Args:
             text (str): Исходный текст.
+            parse_mode (Optional[str]): None, 'HTML' или 'MarkdownV2'.
 
         Returns:
             str: Очищенный текст.
         """
-        str_id = "\[id"  # noqa: W605
-        str_club = "\[club"  # noqa: W605
-        str_end = "|"
-        result = [_.start() for _ in re.finditer(str_id, text)]
-        result = result + [_.start() for _ in re.finditer(str_club, text)]
-        result.sort()
-        correct = 0
-        for ind in result:
-            ind = ind - correct
-            res = text.find(str_end, ind)
-            correct = correct + (res - ind + 2)
-            text = text[:int(ind)] + text[int(res) + 1:]
-            text = text.replace(']', '', 1)
-
-        return text
+        if parse_mode is None:
+            return MENTION_RE.sub(r'\3', text)
+
+        if parse_mode == 'HTML':
+            escape = html.escape
+            link = '<a href="https://vk.ru/{0}{1}">{2}</a>'
+        else:
+            def escape(part: str) -> str:
+                return MARKDOWN_RE.sub(r'\\\1', part)
+            link = '[{2}](https://vk.ru/{0}{1})'
+
+        parts = []
+        position = 0
+        for match in MENTION_RE.finditer(text):
+            parts.append(escape(text[position:match.start()]))
+            name = match.group(3) or f'{match.group(1)}{match.group(2)}'
+            parts.append(link.format(match.group(1), match.group(2), escape(name)))
+            position = match.end()
+        parts.append(escape(text[position:]))
+        return ''.join(parts)
 
     @staticmethod
-    def split_text(text: str) -> List[str]:
+    def split_text(
+        text: str,
+        limit: int = TEXT_LIMIT,
+        parse_mode: Optional[str] = None
+    ) -> Iterator[str]:
         """Разделяем текст на части, соответствующие ограничениям Telegram.
 
+        Длина считается в кодовых единицах UTF-16, как в Telegram. Текст
+        режется по абзацу, если его нет в окне - по строке или предложению,
+        затем по слову, и только в крайнем случае посередине слова. Ссылки
+        и экранированные символы разметки parse_mode не разрываются.
+
         Args:
             text (str): Исходный текст.
+            limit (int): Максимальная длина части.
+            parse_mode (Optional[str]): None, 'HTML' или 'MarkdownV2'.
 
-        Returns:
-            List[str]: Список частей текста.
+        Yields:
+            str: Части текста.
         """
-        message_breakers = [':', '\n']
-        max_message_length = 4096
-
-        if len(text) <= max_message_length:
-            return [text]
-        
-        last_index = max(
-            map(lambda separator: text.rfind(separator, 0, max_message_length), message_breakers))
-        good_part = text[:last_index]
-        bad_part = text[last_index + 1:]
-        return [good_part] + PostProcessor.split_text(bad_part)
+        entity_re = ENTITY_RES.get(parse_mode)
+        spans = [match.span() for match in entity_re.finditer(text)] if entity_re else []
+        span_starts = [span[0] for span in spans]
+        length = len(text)
+        start = 0
+
+        while start < length:
+            end = _utf16_end(text, start, limit)
+            if end >= length:
+                cut = length
+            else:
+                cut = _find_break(text, start, end, spans, span_starts)
+
+            part = text[start:cut].strip()
+            if part:
+                yield part
+            start = cut
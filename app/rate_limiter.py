@@ -0,0 +1,197 @@
+from typing import Any, Callable, Dict, Optional, TypeVar
+import logging
+import threading
+import time
+
+import telebot
+
+from app.async_runtime import BlockingRunner, Runner
+from app.metrics import MetricsRegistry, REGISTRY
+
+T = TypeVar('T')
+
+# Ограничения Telegram Bot API: около 30 сообщений в секунду на бота
+# и не более 20 сообщений в минуту в одну группу или канал
+GLOBAL_RATE = 30.0
+CHAT_RATE = 20 / 60
+CHAT_BURST = 3
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """Инициализируем ведро токенов.
+
+        Args:
+            rate (float): Скорость пополнения, токенов в секунду.
+            capacity (float): Максимальный запас токенов (допустимый всплеск).
+            clock (Callable[[], float]): Источник монотонного времени.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Резервируем токены и возвращаем, сколько нужно подождать перед отправкой.
+
+        Запас может уйти в минус: так следующие отправки встают в очередь
+        за уже зарезервированными.
+
+        Args:
+            tokens (float): Количество токенов.
+
+        Returns:
+            float: Время ожидания в секундах.
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        """Запрещаем отправку на заданное время (ответ 429 с retry_after).
+
+        Args:
+            seconds (float): Длительность блокировки в секундах.
+        """
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class SendScheduler:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: float = CHAT_BURST,
+        max_retries: int = 5,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        """Инициализируем планировщик отправок в Telegram.
+
+        Один планировщик разделяется между всеми ботами и каналами процесса,
+        чтобы общий лимит бота соблюдался при нескольких каналах.
+
+        Args:
+            logger (logging.Logger): Логгер для вывода сообщений.
+            global_rate (float): Общий лимит сообщений в секунду.
+            chat_rate (float): Лимит сообщений в секунду в один чат.
+            chat_burst (float): Сколько сообщений подряд можно отправить в чат без паузы.
+            max_retries (int): Сколько раз повторять запрос после ответа 429.
+            sleep (Callable[[float], None]): Функция ожидания в синхронном режиме (см. blocking).
+            clock (Callable[[], float]): Источник монотонного времени.
+            metrics (Optional[MetricsRegistry]): Реестр метрик, по умолчанию общий REGISTRY.
+        """
+        self.logger = logger
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.sleep = sleep
+        # Синхронные отправки ждут в своём потоке, асинхронные передают в call свой LoopRunner
+        self.blocking = BlockingRunner(sleep)
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        metrics = metrics or REGISTRY
+        self.requests_total = metrics.counter(
+            'vk2tg_api_requests_total', 'Запросы к API по методам и результату', ('api', 'method', 'result'))
+        self.request_seconds = metrics.histogram(
+            'vk2tg_api_request_seconds', 'Длительность запросов к API', ('api', 'method'))
+        self.throttled_seconds = metrics.counter(
+            'vk2tg_telegram_throttled_seconds_total', 'Время ожидания лимитов Telegram, секунд')
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        return bucket
+
+    def reserve(self, chat_id: str, cost: float = 1) -> float:
+        """Резервируем отправку в общем лимите и лимите чата.
+
+        Args:
+            chat_id (str): ID или имя чата.
+            cost (float): Стоимость отправки в сообщениях (для альбома - число фото).
+
+        Returns:
+            float: Сколько секунд нужно подождать перед отправкой.
+        """
+        with self._lock:
+            wait = max(self.global_bucket.reserve(cost), self._chat_bucket(chat_id).reserve(cost))
+        if wait > 0:
+            self.logger.debug("Лимит Telegram для %s, жду %.1f с", chat_id, wait)
+            self.throttled_seconds.inc(wait)
+        return wait
+
+    async def call(self, runner: Runner, chat_id: str, func: Callable[..., T], *args: Any, cost: float = 1,
+                   **kwargs: Any) -> T:
+        """Вызываем метод Telegram API с соблюдением лимитов.
+
+        При ответе 429 чат блокируется на retry_after секунд из ответа, после
+        чего запрос повторяется. Ожидания и сам запрос выполняет runner.
+
+        Args:
+            runner (Runner): self.blocking или LoopRunner цикла событий.
+            chat_id (str): ID или имя чата.
+            func (Callable[..., T]): Метод бота, например bot.send_message.
+            *args (Any): Позиционные аргументы метода.
+            cost (float): Стоимость отправки в сообщениях.
+            **kwargs (Any): Именованные аргументы метода.
+
+        Returns:
+            T: Результат метода.
+
+        Raises:
+            telebot.apihelper.ApiTelegramException: Если запрос не удался или
+                исчерпаны повторы после 429.
+        """
+        attempt = 0
+        method = getattr(func, '__name__', 'call')
+        while True:
+            wait = self.reserve(chat_id, cost)
+            if wait > 0:
+                await runner.sleep(wait)
+            started = time.perf_counter()
+            try:
+                result = await runner.call(func, *args, **kwargs)
+            except telebot.apihelper.ApiTelegramException as e:
+                retry_after = self.retry_after(e)
+                self._observe(method, started, 'error' if retry_after is None else 'rate_limited')
+                if retry_after is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.logger.warning(f"Telegram ответил 429 для {chat_id}, повтор через {retry_after} с")
+                with self._lock:
+                    self._chat_bucket(chat_id).block(retry_after)
+                continue
+            except Exception:
+                self._observe(method, started, 'error')
+                raise
+            self._observe(method, started, 'ok')
+            return result
+
+    def _observe(self, method: str, started: float, result: str) -> None:
+        self.request_seconds.observe(time.perf_counter() - started, api='telegram', method=method)
+        self.requests_total.inc(api='telegram', method=method, result=result)
+
+    @staticmethod
+    def retry_after(error: telebot.apihelper.ApiTelegramException) -> Optional[float]:
+        """Достаём retry_after из ответа 429.
+
+        Args:
+            error (telebot.apihelper.ApiTelegramException): Ошибка Telegram API.
+
+        Returns:
+            Optional[float]: Время ожидания в секундах или None, если это не 429.
+        """
+        if error.error_code != 429:
+            return None
+        parameters = (error.result_json or {}).get('parameters') or {}
+        return float(parameters.get('retry_after', 1))
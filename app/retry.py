@@ -0,0 +1,105 @@
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+import json
+import logging
+import random
+import threading
+
+import requests
+import telebot
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        jitter: float = 0.5,
+        rand: Callable[[], float] = random.random
+    ):
+        """Инициализируем политику повторов с ограниченной экспоненциальной задержкой.
+
+        Args:
+            max_attempts (int): Максимальное количество попыток, включая первую.
+            base_delay (float): Задержка перед первым повтором в секундах.
+            max_delay (float): Верхняя граница задержки в секундах.
+            jitter (float): Доля случайного разброса задержки (0 - без разброса).
+            rand (Callable[[], float]): Источник случайных чисел в [0, 1).
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.rand = rand
+
+    def delay(self, attempt: int) -> float:
+        """Считаем задержку перед следующей попыткой.
+
+        Args:
+            attempt (int): Номер неудачной попытки, начиная с 1.
+
+        Returns:
+            float: Задержка в секундах.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * self.rand())
+
+
+def is_retryable(error: Exception, scheduled: bool = False) -> bool:
+    """Определяем, имеет ли смысл повторять запрос после ошибки.
+
+    Повторяем сетевые ошибки, 429 и ошибки сервера Telegram. Ошибки запроса
+    (неверный URL картинки, нет прав в канале и т.п.) повторять бесполезно.
+
+    Args:
+        error (Exception): Ошибка запроса.
+        scheduled (bool): Запрос шёл через SendScheduler. Он сам повторяет ответы
+            429 с retry_after, и 429 после его повторов второй раз не повторяется.
+
+    Returns:
+        bool: True, если ошибка временная.
+    """
+    if isinstance(error, telebot.apihelper.ApiTelegramException):
+        return (error.error_code == 429 and not scheduled) or error.error_code >= 500
+    if isinstance(error, telebot.apihelper.ApiHTTPException):
+        return error.result.status_code == 429 or error.result.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class DeadLetterLog:
+    def __init__(self, file_path: Optional[str], logger: logging.Logger):
+        """Инициализируем журнал окончательно неотправленных сообщений.
+
+        Args:
+            file_path (Optional[str]): Путь к файлу JSON Lines. Если пусто, записи только логируются.
+            logger (logging.Logger): Логгер для вывода сообщений.
+        """
+        self.file_path = file_path
+        self.logger = logger
+        self._lock = threading.Lock()
+
+    def record(self, channel: str, kind: str, payload: Any, error: Exception) -> None:
+        """Записываем неотправленное сообщение, чтобы его можно было разобрать и отправить вручную.
+
+        Args:
+            channel (str): Канал Telegram.
+            kind (str): Тип сообщения (text, photos).
+            payload (Any): Содержимое сообщения.
+            error (Exception): Последняя ошибка.
+        """
+        entry: Dict[str, Any] = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'channel': channel,
+            'kind': kind,
+            'payload': payload,
+            'error': str(error),
+        }
+        self.logger.error(f"Сообщение ({kind}) в {channel} не отправлено окончательно: {error}")
+        if not self.file_path:
+            return
+        try:
+            with self._lock, open(self.file_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except IOError as e:
+            self.logger.error(f"Не удалось записать файл {self.file_path}: {e}")
@@ -0,0 +1,60 @@
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List
+import json
+
+from app.post_processor import STAGES
+
+
+@dataclass
+class Route:
+    """Маршрут: группа ВК и каналы Telegram, в которые она пересылается."""
+    domain: str
+    channels: List[str] = field(default_factory=list)
+    include_link: bool = True
+    preview_link: bool = False
+    reposts: bool = True
+    count: int = 10
+    media_caption: bool = True
+    stages: List[str] = field(default_factory=lambda: list(STAGES))
+
+
+def load_routes(file_path: str, defaults: Route) -> List[Route]:
+    """Читаем маршруты из JSON-файла.
+
+    Файл содержит список объектов с полями domain и channels (строка или
+    список), остальные поля необязательны и берутся из defaults:
+
+        [
+            {"domain": "group_one", "channels": ["@one", "@all"]},
+            {"domain": "group_two", "channels": "@all", "reposts": false},
+            {"domain": "group_three", "channels": "@all", "stages": ["extract", "format", "split"]}
+        ]
+
+    Args:
+        file_path (str): Путь к файлу маршрутов. Если пусто, используется один маршрут defaults.
+        defaults (Route): Маршрут с настройками по умолчанию (из переменных окружения).
+
+    Returns:
+        List[Route]: Маршруты.
+
+    Raises:
+        IOError: Если файл не удалось прочитать.
+        ValueError: Если в файле ошибка.
+    """
+    if not file_path:
+        return [defaults]
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        items: List[Dict[str, Any]] = json.load(file)
+
+    routes = []
+    for item in items:
+        if not item.get('domain') or not item.get('channels'):
+            raise ValueError(f"В маршруте должны быть domain и channels: {item}")
+        channels = item['channels']
+        item = {**item, 'channels': [channels] if isinstance(channels, str) else list(channels)}
+        unknown = set(item) - set(Route.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Неизвестные поля маршрута {item['domain']}: {', '.join(sorted(unknown))}")
+        routes.append(replace(defaults, **item))
+    return routes
@@ -0,0 +1,270 @@
+from bisect import bisect
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import hashlib
+import logging
+import threading
+import time
+
+from app.routes import Route
+from app.state_store import StateStore
+
+# Точек на окружности на каждый процесс: чем больше, тем равномернее делятся источники
+REPLICAS = 64
+# Срок аренды и отметки о том, что процесс жив, по умолчанию, секунд
+LEASE_TTL = 120
+# Во сколько раз срок аренды должен быть больше самого долгого действия под арендой:
+# после продления остаётся 2/3 срока, и действие должно успеть до следующего продления
+MIN_TTL_FACTOR = 2
+
+
+class LeaseLost(Exception):
+    """Процесс больше не владеет источником, отправку нужно прервать."""
+
+
+def _hash(value: str) -> int:
+    return int(hashlib.sha1(value.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str], replicas: int = REPLICAS):
+        """Инициализируем окружность согласованного хэширования.
+
+        При добавлении или удалении процесса меняют владельца только ключи,
+        попавшие на его участки окружности, остальные остаются на месте.
+
+        Args:
+            nodes (Iterable[str]): ID процессов.
+            replicas (int): Точек на окружности на один процесс.
+        """
+        self._points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{replica}"), node) for node in set(nodes) for replica in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Процесс, которому принадлежит ключ.
+
+        Args:
+            key (str): Ключ источника.
+
+        Returns:
+            Optional[str]: ID процесса или None, если процессов нет.
+        """
+        if not self._points:
+            return None
+        return self._points[bisect(self._hashes, _hash(key)) % len(self._points)][1]
+
+
+def shard_groups(routes: List[Route]) -> Dict[str, List[int]]:
+    """Объединяем маршруты с общими каналами в группы, которые обрабатывает один процесс.
+
+    Лимиты отправки в канал и поиск повторов работают внутри процесса,
+    поэтому все маршруты одного канала должны быть у одного владельца.
+
+    Args:
+        routes (List[Route]): Маршруты.
+
+    Returns:
+        Dict[str, List[int]]: Индексы маршрутов по ключу группы (отсортированные каналы группы).
+    """
+    parent = list(range(len(routes)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    first_route: Dict[str, int] = {}
+    for index, route in enumerate(routes):
+        for channel in route.channels:
+            parent[find(index)] = find(first_route.setdefault(channel, index))
+
+    members: Dict[int, List[int]] = {}
+    for index in range(len(routes)):
+        members.setdefault(find(index), []).append(index)
+    groups = {}
+    for indexes in members.values():
+        channels = sorted({channel for index in indexes for channel in routes[index].channels})
+        # Маршрут без каналов ни с кем не делит лимиты, ключом служит его группа ВК
+        key = ','.join(channels) or f"domain:{routes[indexes[0]].domain}"
+        groups.setdefault(key, []).extend(indexes)
+    return groups
+
+
+class ShardCoordinator:
+    def __init__(
+        self,
+        store: StateStore,
+        worker_id: str,
+        keys: List[str],
+        logger: logging.Logger,
+        lease_ttl: float = LEASE_TTL,
+        send_timeout: float = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Инициализируем распределение источников между процессами.
+
+        Процессы отмечаются в общем хранилище и делят ключи источников
+        согласованным хэшированием. Источник обрабатывает только процесс,
+        арендовавший его ключ. Аренду продлевает фоновый поток каждые
+        lease_ttl / 3 секунд, поэтому ключи упавшего процесса через lease_ttl
+        переходят к живым. Перед каждым запросом отправки проверяется, что
+        аренда продержится ещё send_timeout секунд, иначе отправка прерывается.
+
+        Args:
+            store (StateStore): Общее хранилище процессов и аренды.
+            worker_id (str): Уникальный ID процесса.
+            keys (List[str]): Ключи всех источников.
+            logger (logging.Logger): Логгер для вывода сообщений.
+            lease_ttl (float): Срок аренды, секунд.
+            send_timeout (float): Самый долгий запрос отправки, секунд.
+            clock (Callable[[], float]): Источник монотонного времени.
+
+        Raises:
+            ValueError: Если срок аренды меньше MIN_TTL_FACTOR * send_timeout.
+        """
+        if lease_ttl < MIN_TTL_FACTOR * send_timeout:
+            raise ValueError(f"срок аренды {lease_ttl:.0f} с меньше {MIN_TTL_FACTOR * send_timeout:.0f} с: "
+                             f"запрос отправки может длиться до {send_timeout:.0f} с")
+        self.store = store
+        self.worker_id = worker_id
+        self.keys = keys
+        self.logger = logger
+        self.lease_ttl = lease_ttl
+        self.send_timeout = send_timeout
+        self.clock = clock
+        self.owned: Set[str] = set()
+        # Ключи, источники которых сейчас проверяются: их аренда продлевается до конца проверки
+        self._busy: Dict[str, int] = {}
+        # До какого момента действует аренда ключей owned по часам clock
+        self._valid_until: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def renew_interval(self) -> float:
+        """Как часто продлевать аренду, секунд."""
+        return self.lease_ttl / 3
+
+    def refresh(self) -> Set[str]:
+        """Отмечаем процесс живым, берём ключи, которые ему положены, и отдаём остальные.
+
+        Ключ, который ещё арендует прежний владелец, переходит к процессу,
+        когда тот его отдаст или аренда истечёт. Ключ проверяемого источника
+        отдаётся только после окончания проверки, поэтому новый владелец не
+        отправляет пост, который ещё отправляет прежний. Если хранилище
+        недоступно, ключи остаются за процессом, пока не истечёт аренда.
+
+        Returns:
+            Set[str]: Ключи, которыми владеет процесс.
+
+        Raises:
+            Exception: Ошибка хранилища.
+        """
+        with self._lock:
+            previous = set(self.owned)
+            # Хранилище отсчитывает срок аренды не раньше, чем начался запрос
+            started = self.clock()
+            self.store.heartbeat(self.worker_id, self.lease_ttl)
+            ring = HashRing(self.store.workers() + [self.worker_id])
+            owned = set()
+            for key in self.keys:
+                if ring.owner(key) == self.worker_id or (key in previous and self._busy.get(key)):
+                    if self.store.acquire(key, self.worker_id, self.lease_ttl):
+                        owned.add(key)
+                elif key in previous:
+                    self.store.release(key, self.worker_id)
+            self.owned = owned
+            self._valid_until = started + self.lease_ttl
+
+        if owned != previous:
+            self.logger.info("Процесс %s: источников %d из %d, получены: %s, отданы: %s", self.worker_id,
+                             len(owned), len(self.keys), sorted(owned - previous), sorted(previous - owned))
+        return owned
+
+    def start(self) -> None:
+        """Берём ключи и запускаем фоновое продление аренды."""
+        self._renew()
+        self._thread = threading.Thread(target=self._run, name=f'lease-{self.worker_id}', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.renew_interval):
+            self._renew()
+
+    def _renew(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            self.logger.error(f"Не удалось продлить аренду источников: {e}")
+
+    def owns(self, key: str, margin: float = 0) -> bool:
+        """Проверяем, владеет ли процесс ключом ещё хотя бы margin секунд.
+
+        Args:
+            key (str): Ключ источника.
+            margin (float): Сколько секунд аренда должна ещё действовать.
+
+        Returns:
+            bool: True, если источник можно обрабатывать.
+        """
+        with self._lock:
+            return self._owns(key, margin)
+
+    def _owns(self, key: str, margin: float = 0) -> bool:
+        return key in self.owned and self._valid_until is not None and self.clock() + margin < self._valid_until
+
+    def ensure(self, key: str) -> None:
+        """Проверяем перед запросом отправки, что аренда продержится до его конца.
+
+        Args:
+            key (str): Ключ источника.
+
+        Raises:
+            LeaseLost: Если процесс не владеет ключом или аренда истекает раньше send_timeout.
+        """
+        if not self.owns(key, self.send_timeout):
+            raise LeaseLost(f"процесс {self.worker_id} больше не владеет {key}")
+
+    def fence(self, key: str) -> Callable[[], None]:
+        """Проверка аренды ключа для TelegramBot.fence.
+
+        Args:
+            key (str): Ключ источника.
+
+        Returns:
+            Callable[[], None]: Функция, поднимающая LeaseLost, если аренда потеряна.
+        """
+        return partial(self.ensure, key)
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[bool]:
+        """Отмечаем, что источник проверяется, чтобы его ключ не был отдан посреди отправки.
+
+        Args:
+            key (str): Ключ источника.
+
+        Yields:
+            bool: Владеет ли процесс ключом. Если нет, источник проверять не нужно.
+        """
+        with self._lock:
+            self._busy[key] = self._busy.get(key, 0) + 1
+            owned = self._owns(key)
+        try:
+            yield owned
+        finally:
+            with self._lock:
+                self._busy[key] -= 1
+
+    def close(self) -> None:
+        """Останавливаем продление, удаляем процесс из хранилища и отдаём все ключи."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self.owned = set()
+            self._valid_until = None
+            self.store.leave(self.worker_id)
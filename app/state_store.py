@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.transport import build_session
+
+
+class StateStore(ABC):
+    """Общее состояние процессов бота: живые процессы и аренда источников.
+
+    Реализации должны выполнять acquire атомарно: источник арендует только
+    один процесс, пока аренда не истекла или не освобождена.
+    """
+
+    @abstractmethod
+    def heartbeat(self, worker_id: str, ttl: float) -> None:
+        """Отмечаем, что процесс жив, на ttl секунд."""
+
+    @abstractmethod
+    def workers(self) -> List[str]:
+        """Живые процессы в порядке ID."""
+
+    @abstractmethod
+    def leave(self, worker_id: str) -> None:
+        """Удаляем процесс и освобождаем его аренды."""
+
+    @abstractmethod
+    def acquire(self, key: str, worker_id: str, ttl: float) -> bool:
+        """Берём или продлеваем аренду ключа на ttl секунд.
+
+        Returns:
+            bool: True, если аренда принадлежит worker_id.
+        """
+
+    @abstractmethod
+    def release(self, key: str, worker_id: str) -> None:
+        """Освобождаем аренду, если она принадлежит worker_id."""
+
+
+class SqliteStateStore(StateStore):
+    def __init__(self, path: str, clock: Any = time.time):
+        """Инициализируем общее состояние в файле SQLite.
+
+        Подходит для процессов на одной машине или на нескольких машинах
+        с общим томом, на котором лежит и журнал доставки.
+
+        Args:
+            path (str): Путь к файлу базы данных.
+            clock (Any): Источник времени (Unix timestamp), общий для всех процессов.
+        """
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'key TEXT PRIMARY KEY, worker_id TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def heartbeat(self, worker_id: str, ttl: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO workers (worker_id, expires_at) VALUES (?, ?)',
+                (worker_id, self.clock() + ttl))
+
+    def workers(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT worker_id FROM workers WHERE expires_at >= ? ORDER BY worker_id', (self.clock(),)).fetchall()
+        return [row[0] for row in rows]
+
+    def leave(self, worker_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+            self._conn.execute('DELETE FROM leases WHERE worker_id = ?', (worker_id,))
+
+    def acquire(self, key: str, worker_id: str, ttl: float) -> bool:
+        now = self.clock()
+        with self._lock, self._conn:
+            # Вставка или продление одним запросом: чужая действующая аренда не перезаписывается
+            self._conn.execute(
+                'INSERT INTO leases (key, worker_id, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET worker_id = excluded.worker_id, expires_at = excluded.expires_at '
+                'WHERE leases.worker_id = excluded.worker_id OR leases.expires_at < ?',
+                (key, worker_id, now + ttl, now))
+            row = self._conn.execute('SELECT worker_id FROM leases WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] == worker_id
+
+    def release(self, key: str, worker_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM leases WHERE key = ? AND worker_id = ?', (key, worker_id))
+
+    def close(self) -> None:
+        """Закрываем соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+
+class HttpStateStore(StateStore):
+    def __init__(self, url: str, timeout: float = 10):
+        """Инициализируем клиент общего состояния, которое хранит StateStoreServer.
+
+        Args:
+            url (str): Адрес сервера, например http://127.0.0.1:8200.
+            timeout (float): Таймаут запроса в секундах.
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = build_session(2)
+
+    def _call(self, method: str, **params: Any) -> Any:
+        response = self.session.post(f'{self.url}/{method}', json=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def heartbeat(self, worker_id: str, ttl: float) -> None:
+        self._call('heartbeat', worker_id=worker_id, ttl=ttl)
+
+    def workers(self) -> List[str]:
+        return self._call('workers')
+
+    def leave(self, worker_id: str) -> None:
+        self._call('leave', worker_id=worker_id)
+
+    def acquire(self, key: str, worker_id: str, ttl: float) -> bool:
+        return self._call('acquire', key=key, worker_id=worker_id, ttl=ttl)
+
+    def release(self, key: str, worker_id: str) -> None:
+        self._call('release', key=key, worker_id=worker_id)
+
+
+class StateStoreServer:
+    # Методы хранилища, доступные по HTTP
+    METHODS = ('heartbeat', 'workers', 'leave', 'acquire', 'release')
+
+    def __init__(self, host: str, port: int, store: StateStore, logger: logging.Logger):
+        """Инициализируем HTTP-сервер, открывающий хранилище состояния процессам на других машинах.
+
+        Запрос: POST /<метод> с JSON-параметрами метода, ответ: {"result": ...}.
+
+        Args:
+            host (str): Адрес, на котором слушать.
+            port (int): Порт, 0 - выбрать свободный.
+            store (StateStore): Хранилище, например SqliteStateStore.
+            logger (logging.Logger): Логгер для вывода сообщений.
+        """
+        self.store = store
+        self.logger = logger
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Порт, на котором слушает сервер."""
+        return self._server.server_address[1]
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                method = self.path.strip('/')
+                if method not in server.METHODS:
+                    self._reply(404, {'error': 'not found'})
+                    return
+                try:
+                    params: Dict[str, Any] = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                    result = getattr(server.store, method)(**params)
+                except (TypeError, ValueError) as e:
+                    self._reply(400, {'error': str(e)})
+                    return
+                self._reply(200, {'result': result})
+
+            def _reply(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        """Запускаем сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='state-store', daemon=True)
+        self._thread.start()
+        self.logger.info("Хранилище состояния доступно на порту %d", self.port)
+
+    def stop(self) -> None:
+        """Останавливаем сервер."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def open_state_store(location: str) -> StateStore:
+    """Открываем хранилище состояния по адресу.
+
+    Args:
+        location (str): http(s)://... - StateStoreServer, иначе путь к файлу SQLite.
+
+    Returns:
+        StateStore: Хранилище.
+    """
+    if location.startswith(('http://', 'https://')):
+        return HttpStateStore(location)
+    return SqliteStateStore(location)
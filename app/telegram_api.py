@@ -1,88 +1,307 @@
-from typing import List
-from time import sleep
+from typing import Any, Callable, List, Optional, Union
+from contextlib import ExitStack
+from functools import wraps
 import logging
+import requests
 import telebot
-from telebot.types import InputMediaPhoto
+from telebot.types import InputFile, InputMediaPhoto
 
-from app.post_processor import PostProcessor
+from app.async_runtime import Runner, run_blocking
+from app.cache import LRUCache
+from app.composer import MessagePart
+from app.journal import PostSteps
+from app.media_relay import MediaRelay
+from app.metrics import MetricsRegistry, REGISTRY
+from app.models import Photo
+from app.rate_limiter import SendScheduler
+from app.retry import DeadLetterLog, RetryPolicy, is_retryable
+
+
+def request_timeout() -> float:
+    """Самый долгий запрос к Telegram API: таймауты соединения и чтения telebot, секунд."""
+    return telebot.apihelper.CONNECT_TIMEOUT + telebot.apihelper.READ_TIMEOUT
+
+
+# Ответы Telegram на недействительный или чужой file_id
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file identifier', 'file reference')
+
+
+def rejects_file_id(error: Exception) -> bool:
+    """Определяем, отклонил ли Telegram переданный file_id.
+
+    Args:
+        error (Exception): Ошибка отправки.
+
+    Returns:
+        bool: True, если file_id недействителен.
+    """
+    if not isinstance(error, telebot.apihelper.ApiTelegramException) or error.error_code != 400:
+        return False
+    description = (error.description or '').lower()
+    return any(text in description for text in FILE_ID_ERRORS)
 
 
 class TelegramBot:
-    def __init__(self, bot_token: str, channel: str, logger: logging.Logger):
+    def __init__(
+        self,
+        bot_token: str,
+        channel: str,
+        logger: logging.Logger,
+        scheduler: Optional[SendScheduler] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        dead_letters: Optional[DeadLetterLog] = None,
+        parse_mode: Optional[str] = None,
+        file_ids: Optional[LRUCache] = None,
+        relay: Optional[MediaRelay] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
         """Инициализируем Telegram-бот.
 
         Args:
             bot_token (str): Токен Telegram-бота.
             channel (str): ID или имя канала Telegram.
             logger (logging.Logger): Логгер для вывода сообщений.
+            scheduler (Optional[SendScheduler]): Общий планировщик отправок с лимитами Telegram.
+                Если не передан, создаётся собственный.
+            retry_policy (Optional[RetryPolicy]): Политика повторов при временных ошибках.
+            dead_letters (Optional[DeadLetterLog]): Журнал окончательно неотправленных сообщений.
+            parse_mode (Optional[str]): 'HTML' или 'MarkdownV2', чтобы упоминания ВК
+                становились ссылками. None - упоминания заменяются на имена.
+            file_ids (Optional[LRUCache]): Кэш file_id уже отправленных фото.
+            relay (Optional[MediaRelay]): Пересылка фото через бота, когда Telegram не может скачать их по URL.
+            metrics (Optional[MetricsRegistry]): Реестр метрик, по умолчанию общий REGISTRY.
         """
         self.bot = telebot.TeleBot(bot_token)
         self.channel = channel
         self.logger = logger
+        self.scheduler = scheduler or SendScheduler(logger)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letters = dead_letters or DeadLetterLog(None, logger)
+        self.parse_mode = parse_mode
+        self.file_ids = file_ids
+        self.relay = relay
+        # Проверка перед каждым запросом, что процесс ещё владеет источником канала (см. ShardCoordinator.fence)
+        self.fence: Optional[Callable[[], None]] = None
+        self.metrics = metrics or REGISTRY
+        self.retries_total = self.metrics.counter(
+            'vk2tg_api_retries_total', 'Повторы запросов после временных ошибок', ('api',))
+        self.send_seconds = self.metrics.histogram(
+            'vk2tg_send_seconds', 'Отправка одного сообщения с повторами', ('kind',))
+        self.dead_letters_total = self.metrics.counter(
+            'vk2tg_dead_letters_total', 'Окончательно неотправленные сообщения', ('kind',))
 
-    def send_text_message(self, text: str, preview_link: bool) -> None:
-        """Отправляем текстовое сообщение в Telegram.
+    async def _call(self, runner: Runner, kind: str, func: Callable[..., Any], *args: Any, cost: float = 1,
+                    **kwargs: Any) -> Any:
+        """Вызываем метод Telegram API с повторами при временных ошибках.
+
+        Ответы 429 обрабатывает планировщик, здесь повторяются остальные
+        временные ошибки с растущей задержкой. 429, оставшийся после повторов
+        планировщика, не повторяется ещё раз. Если задан fence, он вызывается
+        перед каждым запросом и может прервать отправку.
 
         Args:
-            text (str): Текст сообщения.
-            preview_link (bool): Включать ли предпросмотр ссылок.
+            runner (Runner): Выполняет ожидания и запросы, см. send_parts и send_parts_async.
+            kind (str): Тип сообщения для логов (text, photos).
+            func (Callable[..., Any]): Метод бота.
+            *args (Any): Позиционные аргументы метода.
+            cost (float): Стоимость отправки в сообщениях.
+            **kwargs (Any): Именованные аргументы метода.
+
+        Returns:
+            Any: Результат метода.
+
+        Raises:
+            telebot.apihelper.ApiException: Если ошибка постоянная или попытки закончились.
+            requests.RequestException: Если сеть недоступна и попытки закончились.
+            LeaseLost: Если fence сообщил, что процесс больше не владеет источником.
         """
-        text = PostProcessor.clean_text(text)
+        if self.fence is not None:
+            fence, send = self.fence, func
 
-        if not text:
-            self.logger.info('Нет текста для отправки')
-            return
+            # Аренда проверяется непосредственно перед запросом, после ожидания лимитов и повторов
+            @wraps(send)
+            def func(*args: Any, **kwargs: Any) -> Any:
+                fence()
+                return send(*args, **kwargs)
 
-        # В телеграмме есть ограничения на длину одного сообщения в 4096 символ, разбиваем длинные на части
-        for msg in PostProcessor.split_text(text):
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                self.bot.send_message(self.channel, msg, disable_web_page_preview=not preview_link)
-                self.logger.info('Текст отправлен')
-            except telebot.apihelper.ApiException as e:
-                self.logger.error(f"Ошибка отправки текста: {e}")
-                sleep(60)
+                return await self.scheduler.call(runner, self.channel, func, *args, cost=cost, **kwargs)
+            except (telebot.apihelper.ApiException, requests.RequestException) as e:
+                if not is_retryable(e, scheduled=True) or attempt >= self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                self.retries_total.inc(api='telegram')
+                self.logger.warning(f"Ошибка отправки ({kind}), попытка {attempt}, повтор через {delay:.0f} с: {e}")
+                await runner.sleep(delay)
 
-    def send_image_messages(self, images: List[dict]) -> None:
-        """Отправляем изображения в Telegram.
+    async def _send(self, runner: Runner, kind: str, payload: Any, func: Callable[..., Any], *args: Any,
+                    cost: float = 1, **kwargs: Any) -> bool:
+        """Отправляем одно сообщение с повторами при временных ошибках.
+
+        Сообщение, которое не удалось отправить, попадает в журнал
+        неотправленных, и отправка поста продолжается.
 
         Args:
-            images (List[dict]): Список словарей с данными изображений.
+            runner (Runner): Выполняет ожидания и запросы.
+            kind (str): Тип сообщения для логов (text, photos).
+            payload (Any): Содержимое сообщения для журнала неотправленных.
+            func (Callable[..., Any]): Метод бота.
+            *args (Any): Позиционные аргументы метода.
+            cost (float): Стоимость отправки в сообщениях.
+            **kwargs (Any): Именованные аргументы метода.
+
+        Returns:
+            bool: True, если сообщение отправлено.
         """
-        if not images:
-            self.logger.info('Нет картинок для отправки')
-            return
+        try:
+            with self.send_seconds.time(kind=kind):
+                await self._call(runner, kind, func, *args, cost=cost, **kwargs)
+            return True
+        except (telebot.apihelper.ApiException, requests.RequestException) as e:
+            self.dead_letters_total.inc(kind=kind)
+            self.dead_letters.record(self.channel, kind, payload, e)
+            return False
 
-        image_urls = [self.get_image_url(img) for img in images]
+    def send_parts(self, parts: List[MessagePart], preview_link: bool, steps: Optional[PostSteps] = None) -> bool:
+        """Отправляем сообщения поста, собранные compose_message, ожидая лимиты в текущем потоке.
 
-        # При ограничении времени запросов в Telegram включаем ждуна
-        success = False
+        Args:
+            parts (List[MessagePart]): Сообщения поста.
+            preview_link (bool): Включать ли предпросмотр ссылок.
+            steps (Optional[PostSteps]): Шаги доставки поста. Сообщения, отправленные
+                до перезапуска, пропускаются.
 
-        # Блоки по 10 фотографий максимум
-        chunk_size = 10
-        image_chunks = [image_urls[i:i + chunk_size] for i in range(0, len(image_urls), chunk_size)]
+        Returns:
+            bool: True, если все сообщения отправлены.
+        """
+        return run_blocking(self.send_parts_async(parts, preview_link, steps, self.scheduler.blocking))
+
+    async def send_parts_async(self, parts: List[MessagePart], preview_link: bool, steps: Optional[PostSteps],
+                               runner: Runner) -> bool:
+        """Асинхронная версия send_parts: ожидания лимитов и повторов выполняет runner.
+
+        Returns:
+            bool: True, если все сообщения отправлены.
+        """
+        failed = 0
+        for part in parts:
+            if steps and steps.is_done(part.step):
+                continue
+            if part.images:
+                with self.send_seconds.time(kind='photos'):
+                    sent = await self._send_photos(runner, part.images, part.text)
+            else:
+                sent = await self._send(runner, 'text', part.text, self.bot.send_message, self.channel, part.text,
+                                        disable_web_page_preview=not preview_link, parse_mode=self.parse_mode)
+            if steps:
+                await runner.call(steps.mark, part.step, sent)
+            if sent:
+                self.logger.info('Фото отправлены' if part.images else 'Текст отправлен')
+            else:
+                failed += 1
+
+        if failed:
+            self.logger.error(f'Ошибка при отправке поста, не отправлено сообщений: {failed} из {len(parts)}')
+        return not failed
+
+    async def _send_photos(self, runner: Runner, images: List[Photo], caption: str) -> bool:
+        """Отправляем до 10 фото одним альбомом, подпись крепится к первому фото.
+
+        Фото, которые бот уже отправлял, передаются по file_id из кэша, и
+        Telegram не скачивает их заново. Если альбом с file_id не отправился,
+        он отправляется повторно по URL, и file_id альбома в кэше заменяются
+        новыми. Прочие ошибки (сеть, подпись) не очищают кэш. Если Telegram
+        не смог скачать фото по URL и включена пересылка, бот сам скачивает
+        фото и загружает их файлами.
+
+        Args:
+            runner (Runner): Выполняет ожидания, запросы и скачивание фото.
+            images (List[Photo]): Изображения поста.
+            caption (str): Подпись, может быть пустой.
 
-        for chunk in image_chunks:
-            while not success:
-                try:
-                    self.bot.send_media_group(self.channel, list(map(lambda url: InputMediaPhoto(url), chunk)))
-                    success = True
-                    self.logger.info('Фото отправлены')
-                # except Exception:
-                except telebot.apihelper.ApiException as e:
-                    self.logger.debug(f"Ошибка при отправке медиа, ждём 60 секунд... {e}")
-                    sleep(60)
+        Returns:
+            bool: True, если альбом отправлен.
+        """
+        urls = [image.url for image in images]
+        keys = [image.key for image in images]
+        cached = [self.file_ids.get(key) if self.file_ids is not None else None for key in keys]
 
-        if not success:
-            self.logger.error(f'Ошибка при отправке медиа, общее количество = {len(image_urls)}')
+        # Способы отправки по очереди: (брать ли file_id из кэша, пересылать ли фото через бота)
+        relay_always = self.relay is not None and self.relay.always
+        plans = [(True, relay_always)]
+        if any(cached):
+            plans.append((False, relay_always))
+        if self.relay is not None and self.relay.enabled and not relay_always:
+            plans.append((False, True))
+
+        for use_cache, use_relay in plans:
+            file_ids = cached if use_cache else [None] * len(keys)
+            try:
+                with ExitStack() as stack:
+                    photos: List[Union[str, InputFile]] = []
+                    for file_id, url in zip(file_ids, urls):
+                        photo = file_id or url
+                        if not file_id and use_relay:
+                            # Фото скачивается через runner, файл удаляется при выходе из stack
+                            photo = await runner.call(stack.enter_context, self.relay.open(url))
+                        photos.append(photo)
+                    result = await self._call_photos(runner, photos, caption)
+                break
+            except (telebot.apihelper.ApiException, OSError) as e:
+                error = e
+                # Удаляем file_id, только если Telegram отклонил именно его. В альбоме неизвестно,
+                # какой из file_id плохой: все они заменятся новыми после отправки по URL
+                if use_cache and len(keys) == 1 and cached[0] and rejects_file_id(e):
+                    self.file_ids.delete(keys[0])
+                self.logger.warning(f"Не удалось отправить фото ({'через бота' if use_relay else 'по ссылке'}): {e}")
+        else:
+            self.dead_letters_total.inc(kind='photos')
+            self.dead_letters.record(self.channel, 'photos', urls, error)
+            return False
 
-    def get_image_url(self, image: dict) -> str:
-        """Получаем URL изображения наибольшего размера.
+        if self.file_ids is not None:
+            messages = result if isinstance(result, list) else [result]
+            for key, file_id, message in zip(keys, file_ids, messages):
+                if not file_id and getattr(message, 'photo', None):
+                    self.file_ids.set(key, message.photo[-1].file_id)
+        return True
+
+    async def _call_photos(self, runner: Runner, photos: List[Union[str, InputFile]], caption: str) -> Any:
+        """Вызываем send_photo или send_media_group для списка URL, file_id или файлов.
 
         Args:
-            image (dict): Данные изображения из VK API.
+            runner (Runner): Выполняет ожидания и запросы.
+            photos (List[Union[str, InputFile]]): URL, file_id или скачанные файлы фото.
+            caption (str): Подпись, может быть пустой.
 
         Returns:
-            str: URL изображения.
+            Any: Отправленное сообщение или список сообщений альбома.
         """
-        max_size_image = max(image["sizes"], key=lambda size: size["type"])
-        return max_size_image["url"]
+        files = [photo.file for photo in photos if isinstance(photo, InputFile)]
+
+        def rewind(func: Callable[..., Any]) -> Callable[..., Any]:
+            # При повторе запроса файлы нужно читать сначала
+            @wraps(func)
+            def call(*args: Any, **kwargs: Any) -> Any:
+                for file in files:
+                    file.seek(0)
+                return func(*args, **kwargs)
+            return call
+
+        if len(files) > 1 and not self.relay.fits_album(files):
+            self.logger.warning("Фото альбома больше %d байт, загружаем их по одному", self.relay.max_album_bytes)
+            return [await self._call_photos(runner, [photo], caption if index == 0 else '')
+                    for index, photo in enumerate(photos)]
+
+        caption = caption or None
+        # Альбом должен содержать от 2 до 10 фото, одиночное фото отправляется отдельно
+        if len(photos) == 1:
+            return await self._call(runner, 'photos', rewind(self.bot.send_photo), self.channel, photos[0],
+                                    caption=caption, parse_mode=self.parse_mode)
+        media = [InputMediaPhoto(photo) for photo in photos]
+        media[0] = InputMediaPhoto(photos[0], caption=caption, parse_mode=self.parse_mode)
+        return await self._call(runner, 'photos', rewind(self.bot.send_media_group), self.channel, media,
+                                cost=len(photos))
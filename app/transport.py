@@ -0,0 +1,119 @@
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.metrics import MetricsRegistry, REGISTRY
+
+VK_API_URL = 'https://api.vk.ru/method'
+# Коды ошибок VK API, означающие превышение лимита запросов
+VK_RATE_LIMIT_CODES = (6, 9, 29)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def build_session(pool_size: int = 10) -> requests.Session:
+    """Создаём HTTP-сессию с пулом keep-alive соединений.
+
+    Args:
+        pool_size (int): Количество соединений в пуле на один хост.
+
+    Returns:
+        requests.Session: Настроенная сессия.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    })
+    return session
+
+
+class HttpTransport:
+    def __init__(
+        self,
+        base_url: str = VK_API_URL,
+        timeout: Timeout = (5, 30),
+        pool_size: int = 10,
+        session: Optional[requests.Session] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        api: str = 'vk'
+    ):
+        """Инициализируем транспорт запросов к HTTP API.
+
+        Один транспорт можно разделять между несколькими клиентами, чтобы
+        они использовали общий пул соединений.
+
+        Args:
+            base_url (str): Базовый адрес API, например адрес локальной заглушки в тестах.
+            timeout (Timeout): Таймаут запроса (connect, read) в секундах.
+            pool_size (int): Размер пула соединений.
+            session (Optional[requests.Session]): Готовая сессия вместо создаваемой.
+            metrics (Optional[MetricsRegistry]): Реестр метрик, по умолчанию общий REGISTRY.
+            api (str): Имя API в метке метрик запросов.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or build_session(pool_size)
+        self.api = api
+        metrics = metrics or REGISTRY
+        self.requests_total = metrics.counter(
+            'vk2tg_api_requests_total', 'Запросы к API по методам и результату', ('api', 'method', 'result'))
+        self.request_seconds = metrics.histogram(
+            'vk2tg_api_request_seconds', 'Длительность запросов к API', ('api', 'method'))
+
+    def _request(self, method: str, send: Callable[[], requests.Response]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = 'http_error'
+        try:
+            data = send().json()
+            error = data.get('error') if isinstance(data, dict) else None
+            if not error:
+                result = 'ok'
+            elif isinstance(error, dict) and error.get('error_code') in VK_RATE_LIMIT_CODES:
+                result = 'rate_limited'
+            else:
+                result = 'api_error'
+            return data
+        finally:
+            self.request_seconds.observe(time.perf_counter() - started, api=self.api, method=method)
+            self.requests_total.inc(api=self.api, method=method, result=result)
+
+    def get(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняем GET-запрос к методу API.
+
+        Args:
+            method (str): Имя метода, например wall.get.
+            params (Dict[str, Any]): Параметры запроса.
+
+        Returns:
+            Dict[str, Any]: Разобранный JSON-ответ.
+
+        Raises:
+            requests.RequestException: Если запрос не удался.
+        """
+        return self._request(
+            method, lambda: self.session.get(f'{self.base_url}/{method}', params=params, timeout=self.timeout))
+
+    def post(self, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняем POST-запрос к методу API (для длинных параметров, например execute).
+
+        Args:
+            method (str): Имя метода.
+            data (Dict[str, Any]): Параметры запроса в теле формы.
+
+        Returns:
+            Dict[str, Any]: Разобранный JSON-ответ.
+
+        Raises:
+            requests.RequestException: Если запрос не удался.
+        """
+        return self._request(
+            method, lambda: self.session.post(f'{self.base_url}/{method}', data=data, timeout=self.timeout))
+
+    def close(self) -> None:
+        """Закрываем соединения пула."""
+        self.session.close()
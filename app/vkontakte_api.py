@@ -1,115 +1,357 @@
-from typing import Dict, Any
+from collections import deque
+from typing import Deque, Dict, Any, Iterable, Iterator, List, Optional
 import logging
 import requests
 
+from app.cache import LRUCache
+from app.models import Post, parse_owners, parse_posts
+from app.photo_size import PhotoSizeSelector
+from app.transport import HttpTransport
+
+VK_API_VERSION = '5.199'
+
+# Ограничения VK API на количество идентификаторов в одном запросе
+USERS_GET_LIMIT = 1000
+GROUPS_GET_LIMIT = 500
+WALL_GET_LIMIT = 100
+
 
 class VkAPI:
-    def __init__(self, vk_token: str, domain_vk: str, logger: logging.Logger):
+    def __init__(
+        self,
+        vk_token: str,
+        domain_vk: str,
+        logger: logging.Logger,
+        transport: Optional[HttpTransport] = None,
+        owner_names: Optional[LRUCache] = None,
+        photo_sizes: Optional[PhotoSizeSelector] = None
+    ):
         """Инициализируем VK API.
 
         Args:
             vk_token (str): Токен доступа ВК.
             domain_vk (str): Домен группы ВК.
             logger (logging.Logger): Логгер для вывода сообщений.
+            transport (Optional[HttpTransport]): Общий транспорт с пулом соединений.
+                Если не передан, создаётся собственный.
+            owner_names (Optional[LRUCache]): Общий кэш имён владельцев.
+                Если не передан, создаётся кэш в памяти.
+            photo_sizes (Optional[PhotoSizeSelector]): Выбор варианта фото при разборе постов.
         """
         self.vk_token = vk_token
         self.domain_vk = domain_vk
         self.logger = logger
+        self.transport = transport or HttpTransport()
+        self.owner_names = owner_names if owner_names is not None else LRUCache(maxsize=2048, ttl=86400)
+        self.photo_sizes = photo_sizes or PhotoSizeSelector()
+
+    def _request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняем запрос к методу VK API через общий транспорт.
+
+        Args:
+            method (str): Имя метода VK API.
+            params (Dict[str, Any]): Параметры метода без токена и версии.
 
-    def get_data(self, count_vk: int) -> Dict[str, Any]:
+        Returns:
+            Dict[str, Any]: JSON-ответ VK API.
+
+        Raises:
+            requests.RequestException: Если запрос к API не удался.
+        """
+        params = {**params, 'access_token': self.vk_token, 'v': VK_API_VERSION}
+        return self.transport.get(method, params)
+
+    def get_data(self, count_vk: int, offset: int = 0) -> Dict[str, Any]:
         """Получаем посты из ВК.
 
+        Ошибки не скрываются: пустая страница вместо упавшей выглядела бы
+        концом стены, и более старые посты были бы пропущены.
+
         Args:
             count_vk (int): Количество постов для загрузки.
+            offset (int): Смещение от самого нового поста стены.
 
         Returns:
             Dict[str, Any]: Данные постов из VK API.
 
         Raises:
-            requests.RequestException: Если запрос к API не удался.
+            requests.RequestException: Если запрос к API не удался или ВК вернул ошибку.
+        """
+        params = {
+            'domain': self.domain_vk,
+            'extended': 1,
+            'count': count_vk,
+            'offset': offset,
+        }
+        response = self._request('wall.get', params)
+        if 'response' not in response:
+            raise requests.RequestException(f"Ошибка VK API: {response.get('error', 'Неизвестная ошибка')}")
+        self.remember_owners(response['response'])
+        return response['response']
+
+    def iter_new_posts(self, last_date: Optional[int], count_vk: int, max_posts: int) -> Iterator[Post]:
+        """Получаем посты новее last_date постранично, от старых к новым.
+
+        Первая страница размером count_vk, чтобы обычная проверка стоила один
+        небольшой запрос. Если новых постов больше, догружаем страницы по 100
+        постов, пока не дойдём до поста старше last_date. Посты с датой,
+        равной last_date, возвращаются: какие из них уже отправлены, решает
+        журнал доставки. Закреплённый пост может быть старым, поэтому он не
+        останавливает обход.
+
+        Если новых постов больше max_posts, возвращаются max_posts самых
+        старых из них, остальные - при следующих проверках, поэтому дата
+        последнего отправленного поста не перескакивает через неотправленные.
+        Если какая-то страница не загрузилась, проверка прерывается без
+        постов и повторяется целиком.
+
+        Args:
+            last_date (Optional[int]): Дата последнего отправленного поста. Если None,
+                загружается только первая страница.
+            count_vk (int): Размер первой страницы.
+            max_posts (int): Максимальное количество постов за один обход.
+
+        Yields:
+            Post: Новые посты в порядке публикации.
         """
+        # Стена идёт от новых к старым, в очереди остаются самые старые из новых постов
+        new_posts: Deque[Post] = deque(maxlen=max_posts)
+        found = 0
+        offset = 0
+        page_size = count_vk
+        reached = last_date is None
+
         try:
-            url = 'https://api.vk.ru/method/wall.get'
-            params = {
-                'access_token': self.vk_token,
-                'domain': self.domain_vk,
-                'extended': 1,
-                'count': count_vk,
-                'v': '5.199'
-            }
-            response = requests.get(url, params=params).json()
-            if 'response' not in response:
-                self.logger.error(f"Ошибка VK API: {response.get('error', 'Неизвестная ошибка')}")
-                return {'items': []}
-            return response['response']
+            while True:
+                data = self.get_data(page_size, offset)
+                # Ответ разбирается сразу, сам ответ с profiles и groups дальше не хранится
+                items = parse_posts(data, self.photo_sizes)
+                total = data.get('count', 0)
+                del data
+                if not items:
+                    break
+
+                for post in items:
+                    if last_date and post.date < last_date:
+                        if post.is_pinned:
+                            continue
+                        reached = True
+                        break
+                    new_posts.append(post)
+                    found += 1
+
+                offset += len(items)
+                if reached or offset >= total:
+                    break
+                page_size = WALL_GET_LIMIT
+                self.logger.info("Догружаю посты ВК, смещение %d", offset)
         except requests.RequestException as e:
-            self.logger.error(f"Ошибка запроса к VK API: {e}")
-            return {'items': []}
+            self.logger.error(f"Ошибка загрузки постов ВК {self.domain_vk} (смещение {offset}), проверка прервана: {e}")
+            return
+
+        if found > max_posts:
+            self.logger.warning(f"Новых постов {found}, отправляются {max_posts} самых старых, "
+                                f"остальные - при следующих проверках")
 
+        # Закреплённый пост идёт первым на стене, сортировка ставит его на место по дате
+        yield from sorted(new_posts, key=lambda post: post.date)
 
-    def get_little_data(self, posts: str) -> Dict[str, Any]:
-        """Получаем выборочные посты из ВК.
+    def get_posts(self, posts: str) -> List[Post]:
+        """Получаем выборочные посты из ВК запросами wall.getById по 100 постов.
+
+        Ошибки не скрываются: пустой список означает, что постов в ВК нет.
 
         Args:
+            posts (str): Строка идентификаторов постов через запятую.
 
         Returns:
-            Dict[str, Any]: Данные постов из VK API.
+            List[Post]: Найденные посты в порядке ответа.
 
         Raises:
-            requests.RequestException: Если запрос к API не удался.
+            requests.RequestException: Если запрос к API не удался или ВК вернул ошибку.
         """
-        try:
-            url = 'https://api.vk.ru/method/wall.getById'
+        ids = [x.strip() for x in posts.split(',') if x.strip()]
+        result: List[Post] = []
+        for i in range(0, len(ids), WALL_GET_LIMIT):
             params = {
-                'access_token': self.vk_token,
-                'posts': posts,
+                'posts': ','.join(ids[i:i + WALL_GET_LIMIT]),
                 'extended': 1,
-                'v': '5.199'
             }
-            response = requests.get(url, params=params).json()
+            response = self._request('wall.getById', params)
             if 'response' not in response:
-                self.logger.error(f"Ошибка VK API: {response.get('error', 'Неизвестная ошибка')}")
-                return {'items': []}
-            return response['response']
-        except requests.RequestException as e:
-            self.logger.error(f"Ошибка запроса к VK API: {e}")
-            return {'items': []}
+                raise requests.RequestException(f"Ошибка VK API: {response.get('error', 'Неизвестная ошибка')}")
+            self.remember_owners(response['response'])
+            result.extend(parse_posts(response['response'], self.photo_sizes))
+        return result
 
+    def get_group_id(self) -> Optional[int]:
+        """Получаем ID группы по домену, чтобы сопоставлять события Callback API с маршрутами.
+
+        Returns:
+            Optional[int]: ID группы (положительный) или None, если домен не найден.
+        """
+        try:
+            response = self._request('groups.getById', {'group_id': self.domain_vk})
+            return int(response['response']['groups'][0]['id'])
+        except (requests.RequestException, KeyError, IndexError, TypeError) as e:
+            self.logger.error(f"Не удалось получить ID группы {self.domain_vk}: {e}")
+            return None
 
     def get_owner_name_by_id(self, owner_id: int) -> str:
         """Получаем имя владельца поста по ID.
 
+        Сначала ищем имя в кэше (туда попадают имена со страницы постов
+        и из resolve_owner_names), и только если его там нет, делаем
+        отдельный запрос.
+
         Args:
             owner_id (int): ID владельца (положительный для пользователей, отрицательный для групп).
 
         Returns:
             str: Имя владельца.
         """
+        name = self.owner_names.get(owner_id)
+        if name is not None:
+            return name
+
         try:
             if owner_id > 0:
-                url = 'https://api.vk.ru/method/users.get'
                 params = {
-                    'access_token': self.vk_token,
                     'user_ids': owner_id,
                     'fields': 'first_name, last_name',
-                    'v': '5.199'
                 }
-                response = requests.get(url, params=params).json()['response'][0]
-                return f"{response['first_name']} {response['last_name']}"
+                response = self._request('users.get', params)['response'][0]
+                name = f"{response['first_name']} {response['last_name']}"
 
             else:
-                url = 'https://api.vk.ru/method/groups.getById'
                 params = {
-                    'access_token': self.vk_token,
                     'group_id': (-1) * owner_id,
-                    'v': '5.199'
                 }
-                response = requests.get(url, params=params).json()['response']['groups'][0]
-                return response['name']
-        except (requests.RequestException, KeyError) as e:
+                response = self._request('groups.getById', params)['response']['groups'][0]
+                name = response['name']
+        except (requests.RequestException, KeyError, IndexError) as e:
             self.logger.error(f"Ошибка получения имени владельца {owner_id}: {e}")
             return  "Unknown"
 
+        self.owner_names.set(owner_id, name)
+        return name
+
+    def resolve_owner_names(self, owner_ids: Iterable[int]) -> Dict[int, str]:
+        """Получаем имена владельцев: из кэша, а недостающие одним пакетным запросом.
+
+        Args:
+            owner_ids (Iterable[int]): ID владельцев.
+
+        Returns:
+            Dict[int, str]: Имена найденных владельцев по ID.
+        """
+        names = {}
+        missing = []
+        for owner_id in set(owner_ids):
+            name = self.owner_names.get(owner_id)
+            if name is None:
+                missing.append(owner_id)
+            else:
+                names[owner_id] = name
+        if missing:
+            for owner_id, name in self.get_owner_names(missing).items():
+                self.owner_names.set(owner_id, name)
+                names[owner_id] = name
+        return names
+
+    def remember_owners(self, data: Dict[str, Any]) -> None:
+        """Запоминаем имена из массивов profiles и groups ответа VK API.
+
+        Args:
+            data (Dict[str, Any]): Ответ метода с extended=1.
+        """
+        for owner in parse_owners(data):
+            self.owner_names.set(owner.id, owner.name)
+
+    def get_owner_names(self, owner_ids: Iterable[int]) -> Dict[int, str]:
+        """Получаем имена пользователей и групп одним вызовом execute.
+
+        Если execute недоступен, делаем по одному запросу users.get и groups.getById.
+
+        Args:
+            owner_ids (Iterable[int]): ID владельцев.
+
+        Returns:
+            Dict[int, str]: Имена найденных владельцев по ID.
+        """
+        owner_ids = set(owner_ids)
+        user_ids = sorted(x for x in owner_ids if x > 0)
+        group_ids = sorted(-x for x in owner_ids if x < 0)
+        names: Dict[int, str] = {}
+
+        while user_ids or group_ids:
+            users, user_ids = user_ids[:USERS_GET_LIMIT], user_ids[USERS_GET_LIMIT:]
+            groups, group_ids = group_ids[:GROUPS_GET_LIMIT], group_ids[GROUPS_GET_LIMIT:]
+            try:
+                names.update(self._execute_owner_names(users, groups))
+            except (requests.RequestException, KeyError, TypeError) as e:
+                self.logger.warning(f"Пакетный запрос имён через execute не удался: {e}")
+                names.update(self._fetch_owner_names(users, groups))
+
+        return names
+
+    def _execute_owner_names(self, user_ids: List[int], group_ids: List[int]) -> Dict[int, str]:
+        """Запрашиваем имена пользователей и групп одним вызовом execute.
+
+        Args:
+            user_ids (List[int]): ID пользователей.
+            group_ids (List[int]): ID групп (положительные).
+
+        Returns:
+            Dict[int, str]: Имена по ID владельцев.
+
+        Raises:
+            requests.RequestException: Если запрос к API не удался.
+            KeyError: Если VK API вернул ошибку.
+        """
+        users = ','.join(map(str, user_ids))
+        groups = ','.join(map(str, group_ids))
+        code = (
+            f'var users = [];'
+            f'if ("{users}" != "") {{ users = API.users.get({{"user_ids": "{users}"}}); }}'
+            f'var groups = [];'
+            f'if ("{groups}" != "") {{ groups = API.groups.getById({{"group_ids": "{groups}"}}).groups; }}'
+            f'return {{"profiles": users, "groups": groups}};'
+        )
+        params = {'code': code, 'access_token': self.vk_token, 'v': VK_API_VERSION}
+        response = self.transport.post('execute', params)['response']
+
+        names = {}
+        for profile in response['profiles'] or []:
+            names[int(profile['id'])] = f"{profile['first_name']} {profile['last_name']}"
+        for group in response['groups'] or []:
+            names[-int(group['id'])] = group['name']
+        return names
+
+    def _fetch_owner_names(self, user_ids: List[int], group_ids: List[int]) -> Dict[int, str]:
+        """Запрашиваем имена пользователей и групп двумя отдельными запросами.
+
+        Args:
+            user_ids (List[int]): ID пользователей.
+            group_ids (List[int]): ID групп (положительные).
+
+        Returns:
+            Dict[int, str]: Имена по ID владельцев.
+        """
+        names = {}
+        try:
+            if user_ids:
+                params = {'user_ids': ','.join(map(str, user_ids))}
+                for profile in self._request('users.get', params)['response']:
+                    names[int(profile['id'])] = f"{profile['first_name']} {profile['last_name']}"
+            if group_ids:
+                params = {'group_ids': ','.join(map(str, group_ids))}
+                for group in self._request('groups.getById', params)['response']['groups']:
+                    names[-int(group['id'])] = group['name']
+        except (requests.RequestException, KeyError) as e:
+            self.logger.error(f"Ошибка пакетного получения имён владельцев: {e}")
+        return names
+
 
     def get_video(self, video):
         """Получаем видео (пока не работает на стороне ВК)
@@ -121,16 +363,13 @@ class VkAPI:
             str: Ссылка на видео.
         """
         try:
-            url = 'https://api.vk.ru/method/video.get'
             params = {
-                'access_token': self.vk_token,
                 'videos': f'{video["owner_id"]}_{video["id"]}_{video["access_key"]}',
-                'v': '5.199',
                 'scope': ''
             }
 
-            response = requests.get(url, params=params).json()
+            response = self._request('video.get', params)
             return response['response']['items'][0]['player']
         except (requests.RequestException, KeyError) as e:
             self.logger.error(f"Ошибка получения видео  {video}: {e}")
-            return  "Unknown"   
+            return  "Unknown"
@@ -0,0 +1,265 @@
+"""Сквозной бенчмарк основного цикла бота без сети.
+
+Поднимает локальные замены api.vk.ru и Telegram Bot API (benchmarks.fake_servers),
+собирает источники так же, как main(), и запускает main.run_sync или main.run_async,
+пока все маршруты не догонят стену из сгенерированных или записанных постов.
+Поиск повторов, деление источников между процессами (здесь - потоками с общим
+хранилищем аренды) и отправка списка старых постов включаются флагами.
+Выводит посты в секунду, вызовы API на пост, p50/p99 задержки доставки поста
+и пиковую память процесса бота.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.bench_pipeline --posts 100 --photos 1
+    python -m benchmarks.bench_pipeline --posts 50 --photos 50 --tg-latency 0.05 --tg-rate-limit 0.02
+    python -m benchmarks.bench_pipeline --posts 200 --routes 4 --workers 2 --dedup --copies 4 --backfill 20
+    python -m benchmarks.bench_pipeline --replay wall_get.json --async
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import telebot
+
+import main as bot_main
+from app.backfill import Backfill, BackfillQueue, BackfillSchedule, parse_windows
+from app.cache import LRUCache
+from app.dedup import DedupIndex
+from app.journal import DeliveryJournal, PostSteps
+from app.metrics import REGISTRY
+from app.photo_size import PhotoSizeSelector
+from app.poll_scheduler import PollScheduler
+from app.rate_limiter import SendScheduler
+from app.retry import DeadLetterLog, RetryPolicy
+from app.routes import Route
+from app.sharding import LEASE_TTL, ShardCoordinator, shard_groups
+from app.state_store import SqliteStateStore
+from app.telegram_api import request_timeout
+from app.transport import HttpTransport
+from benchmarks.fake_servers import FakeServers, FaultOptions, generate_posts, load_recorded
+
+# Интервал проверок стены: после прохода с постами следующий начинается почти сразу
+POLL_INTERVAL = 0.1
+
+
+class TimedJournal(DeliveryJournal):
+    def __init__(self, path: str):
+        """Журнал доставки, который замеряет время от начала отправки поста в канал до доставки.
+
+        Посты, ни один шаг которых не отправлялся (повторы, отклонённые
+        фильтрами), считаются пропущенными и в задержку не входят.
+
+        Args:
+            path (str): Путь к файлу базы данных.
+        """
+        super().__init__(path)
+        self.latencies: List[float] = []
+        self.skipped = 0
+        self._started: Dict[Tuple[str, str], float] = {}
+        self._sent: Set[Tuple[str, str]] = set()
+        self._timing = threading.Lock()
+
+    def begin(self, post_key: str, channel: str, date: int) -> PostSteps:
+        with self._timing:
+            self._started[(post_key, channel)] = time.perf_counter()
+        return super().begin(post_key, channel, date)
+
+    def mark_step(self, post_key: str, channel: str, step: str, ok: bool = True) -> None:
+        with self._timing:
+            self._sent.add((post_key, channel))
+        super().mark_step(post_key, channel, step, ok)
+
+    def mark_done(self, post_key: str, channel: str) -> None:
+        super().mark_done(post_key, channel)
+        key = (post_key, channel)
+        with self._timing:
+            started = self._started.pop(key, None)
+            if key in self._sent and started is not None:
+                self._sent.discard(key)
+                self.latencies.append(time.perf_counter() - started)
+            else:
+                self.skipped += 1
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль по ближайшему рангу, 0 для пустого списка."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def peak_rss_mb() -> float:
+    """Пиковая резидентная память процесса в МБ (ru_maxrss в Linux - КБ, в macOS - байты)."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=100, help='Сколько постов сгенерировать на стене')
+    parser.add_argument('--photos', type=int, default=1, help='Фото в каждом посте, больше 10 - несколько альбомов')
+    parser.add_argument('--text-size', type=int, default=500, help='Длина текста поста')
+    parser.add_argument('--copies', type=int, default=0, help='Каждый N-й пост повторяет предыдущий, 0 - без повторов')
+    parser.add_argument('--replay', help='Записанный ответ wall.get/wall.getById вместо сгенерированных постов')
+    parser.add_argument('--count', type=int, default=10, help='Размер первой страницы wall.get (COUNT)')
+    parser.add_argument('--max-catchup', type=int, default=1000)
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Цикл ASYNC_MODE')
+    parser.add_argument('--stages', default='', help='Стадии PostProcessor через запятую, по умолчанию все')
+    parser.add_argument('--routes', type=int, default=1, help='Маршрутов, каждый читает стену в свой канал')
+    parser.add_argument('--workers', type=int, default=0, help='Процессов, делящих маршруты (SHARD_WORKERS)')
+    parser.add_argument('--dedup', action='store_true', help='Искать повторы (DEDUP_WINDOW)')
+    parser.add_argument('--backfill', type=int, default=0, help='Сколько самых старых постов отправить списком')
+    parser.add_argument('--timeout', type=float, default=600, help='Прервать прогон через столько секунд')
+    for api in ('vk', 'tg'):
+        parser.add_argument(f'--{api}-latency', type=float, default=0.0, help='Задержка ответа, секунд')
+        parser.add_argument(f'--{api}-rate-limit', type=float, default=0.0, help='Доля ответов "слишком часто"')
+        parser.add_argument(f'--{api}-errors', type=float, default=0.0, help='Доля ответов 502')
+    parser.add_argument('--metrics', action='store_true', help='Вывести метрики бота после прогона')
+    parser.add_argument('--verbose', action='store_true', help='Выводить лог бота')
+    args = parser.parse_args()
+
+    posts = load_recorded(args.replay) if args.replay else generate_posts(
+        args.posts, photos=args.photos, text_size=args.text_size, copies=args.copies)
+    if not posts:
+        parser.error('нет постов для прогона')
+    if not 0 <= args.backfill < len(posts):
+        parser.error('--backfill должен быть меньше числа постов')
+    vk_faults = FaultOptions(args.vk_latency, args.vk_rate_limit, args.vk_errors)
+    tg_faults = FaultOptions(args.tg_latency, args.tg_rate_limit, args.tg_errors)
+
+    # Серверы запускаются до создания клиентов, их процесс не входит в замер памяти
+    servers = FakeServers(posts, vk_faults, tg_faults)
+    telebot.apihelper.API_URL = servers.telegram_url
+
+    logger = logging.getLogger('bench')
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+    logger.setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+
+    stages = [x.strip() for x in args.stages.split(',') if x.strip()]
+    routes = [Route(f'bench{number}', [f'@bench{number}'], count=args.count) for number in range(args.routes)]
+    for route in routes:
+        if stages:
+            route.stages = stages
+    channels = [channel for route in routes for channel in route.channels]
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal_file = os.path.join(directory, 'journal.sqlite3')
+        journal = TimedJournal(journal_file)
+        # Самые старые посты уходят списком, остальные - догоняющей проверкой стены
+        dates = sorted(post['date'] for post in posts)
+        # Каналы начинают с записи о доставке между постами списка и стены, как у работающего бота.
+        # Дата, перенесённая из last_post/date, не подходит: посты не новее неё считаются доставленными
+        last_date = dates[args.backfill - 1] + 1 if args.backfill else dates[0] - 1
+        for channel in channels:
+            DeliveryJournal.begin(journal, 'bench_start', channel, last_date)
+            DeliveryJournal.mark_done(journal, 'bench_start', channel)
+        backfill_queue = BackfillQueue(journal_file)
+        backfill = None
+        if args.backfill:
+            oldest = sorted(posts, key=lambda post: post['date'])[:args.backfill]
+            backfill_queue.add(f"{post['owner_id']}_{post['id']}" for post in oldest)
+            # Без пауз между постами списка: мерим отправку, а не расписание
+            backfill = Backfill(backfill_queue, BackfillSchedule(10 ** 9, parse_windows('')), logger)
+
+        # Ограничения скорости Telegram снимаются, чтобы мерить сам бот, а не паузы планировщика
+        scheduler = SendScheduler(logger, global_rate=1e6, chat_rate=1e6, chat_burst=1e6)
+        transport = HttpTransport(servers.vk_url)
+        owner_names, file_ids = LRUCache(2048), LRUCache(10000)
+        dedup = DedupIndex(LRUCache(10000, 86400)) if args.dedup else None
+        stop = threading.Event()
+
+        # Процесс с делением источников - поток со своими ботами и арендой в общем хранилище
+        groups = shard_groups(routes)
+        keys = [''] * len(routes)
+        for key, indexes in groups.items():
+            for index in indexes:
+                keys[index] = key
+        worker_ids = [f'bench-{number}' for number in range(args.workers)] or [None]
+        state_file = os.path.join(directory, 'state.sqlite3')
+        for worker_id in filter(None, worker_ids):
+            # Все процессы отмечаются заранее, чтобы не ждать перераспределения источников после старта
+            SqliteStateStore(state_file).heartbeat(worker_id, LEASE_TTL)
+
+        def run_worker(worker_id: Optional[str]) -> None:
+            sources = bot_main.build_sources(
+                routes, 'vk-token', '123:bench-token', transport, owner_names, scheduler,
+                RetryPolicy(max_attempts=5, base_delay=0.05), DeadLetterLog(None, logger), None, file_ids, None,
+                PhotoSizeSelector(), logger)
+            poller = PollScheduler(POLL_INTERVAL, POLL_INTERVAL, 0)
+            for index in range(len(sources)):
+                poller.add(index)
+                poller.postpone(index, 0)
+            shard = None
+            if worker_id:
+                coordinator = ShardCoordinator(SqliteStateStore(state_file), worker_id, list(groups), logger,
+                                               LEASE_TTL, request_timeout())
+                for index, source in enumerate(sources):
+                    for telegram_bot in source.telegram_bots:
+                        telegram_bot.fence = coordinator.fence(keys[index])
+                shard = bot_main.Shard(coordinator, keys)
+            loop_args = (sources, journal, logger, backfill, args.max_catchup, poller, None, REGISTRY, dedup, shard,
+                         stop)
+            try:
+                if args.use_async:
+                    asyncio.run(bot_main.run_async(*loop_args))
+                else:
+                    bot_main.run_sync(*loop_args)
+            finally:
+                if shard:
+                    shard.coordinator.close()
+
+        def caught_up() -> bool:
+            if backfill_queue.pending_count():
+                return False
+            return all((journal.last_date(channel) or 0) >= dates[-1] for channel in channels)
+
+        servers.reset()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run_worker, args=(worker_id,), daemon=True) for worker_id in worker_ids]
+        for thread in threads:
+            thread.start()
+        while not caught_up() and time.perf_counter() - started < args.timeout:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        finished = caught_up()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        stats = servers.stats()
+        latencies = list(journal.latencies)
+        skipped = journal.skipped
+        backfill_queue.close()
+        journal.close()
+    servers.stop()
+
+    delivered = len(latencies)
+    vk_calls = sum(value for key, value in stats.items() if key.startswith('vk.'))
+    tg_calls = sum(value for key, value in stats.items() if key.startswith('tg.'))
+    per_post = max(delivered, 1)
+    print(f"Режим: {'async' if args.use_async else 'sync'}, постов на стене: {len(posts)}, маршрутов: {len(routes)}, "
+          f"процессов: {args.workers or 1}")
+    interrupted = '' if finished else f", прогон прерван через {args.timeout:.0f} с"
+    print(f"Отправлено в каналы: {delivered}, пропущено (повторы, фильтры): {skipped}{interrupted}")
+    print(f"Время: {elapsed:.2f} с, постов в секунду: {delivered / elapsed:.1f}")
+    print(f"Вызовов API на пост: VK {vk_calls / per_post:.2f}, Telegram {tg_calls / per_post:.2f}")
+    print('  ' + ', '.join(f"{key}={value}" for key, value in sorted(stats.items())))
+    if latencies:
+        print(f"Задержка доставки поста: p50 {percentile(latencies, 0.5) * 1000:.1f} мс, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс, "
+              f"среднее {statistics.mean(latencies) * 1000:.1f} мс")
+    print(f"Пиковая память бота: {peak_rss_mb():.1f} МБ")
+    if args.metrics:
+        print(REGISTRY.render(), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Микробенчмарк обработки текста постов.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.bench_text
+"""
+from typing import Callable, List
+import re
+import timeit
+
+from app.post_processor import PostProcessor
+
+
+def legacy_clean_text(text: str) -> str:
+    """Прежняя реализация clean_text для сравнения."""
+    str_id = "\\[id"  # noqa: W605
+    str_club = "\\[club"  # noqa: W605
+    str_end = "|"
+    result = [_.start() for _ in re.finditer(str_id, text)]
+    result = result + [_.start() for _ in re.finditer(str_club, text)]
+    result.sort()
+    correct = 0
+    for ind in result:
+        ind = ind - correct
+        res = text.find(str_end, ind)
+        correct = correct + (res - ind + 2)
+        text = text[:int(ind)] + text[int(res) + 1:]
+        text = text.replace(']', '', 1)
+    return text
+
+
+def legacy_split_text(text: str) -> List[str]:
+    """Прежняя рекурсивная реализация split_text для сравнения."""
+    message_breakers = [':', '\n']
+    max_message_length = 4096
+    if len(text) <= max_message_length:
+        return [text]
+    last_index = max(map(lambda separator: text.rfind(separator, 0, max_message_length), message_breakers))
+    return [text[:last_index]] + legacy_split_text(text[last_index + 1:])
+
+
+def make_text(mentions: int) -> str:
+    """Строим текст поста с заданным количеством упоминаний."""
+    chunk = 'Текст поста с упоминанием [id{0}|Имя Фамилия] и группы [club{0}|Название].\n'
+    return ''.join(chunk.format(i) for i in range(mentions // 2))
+
+
+def bench(name: str, func: Callable[[], object], number: int) -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f'{name:<40} {seconds * 1000:10.3f} мс')
+
+
+def main() -> None:
+    for mentions in (10, 100, 1000, 10000):
+        text = make_text(mentions)
+        number = max(1, 2000 // mentions)
+        print(f'-- {mentions} упоминаний, {len(text)} символов')
+        bench('legacy clean_text', lambda: legacy_clean_text(text), number)
+        bench('clean_text', lambda: PostProcessor.clean_text(text), number)
+        bench('clean_text HTML', lambda: PostProcessor.clean_text(text, 'HTML'), number)
+        bench('legacy split_text', lambda: legacy_split_text(text), number)
+        bench('split_text', lambda: list(PostProcessor.split_text(text)), number)
+
+
+if __name__ == '__main__':
+    main()
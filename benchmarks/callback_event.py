@@ -0,0 +1,54 @@
+"""Локальная замена ВК для проверки приёма событий Callback API.
+
+Отправляет на запущенный бот запрос подтверждения и событие wall_post_new
+с примером поста. Запуск из корня проекта при CALLBACK_PORT=8080:
+
+    python -m benchmarks.callback_event --url http://127.0.0.1:8080/ --group 1 --secret СЕКРЕТ
+"""
+from typing import Any, Dict
+import argparse
+import time
+
+import requests
+
+
+def sample_post(group_id: int, post_id: int) -> Dict[str, Any]:
+    """Пост в формате поля object события wall_post_new."""
+    return {
+        'id': post_id,
+        'owner_id': -group_id,
+        'from_id': -group_id,
+        'date': int(time.time()),
+        'post_type': 'post',
+        'text': 'Тестовый пост из события Callback API [id1|Павел Дуров]',
+        'attachments': [{'type': 'link', 'link': {'url': 'https://vk.ru/dev/callback_api'}}],
+    }
+
+
+def send(url: str, body: Dict[str, Any]) -> str:
+    """Отправляем событие и возвращаем ответ бота."""
+    response = requests.post(url, json=body, timeout=10)
+    return f"{response.status_code} {response.text}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/')
+    parser.add_argument('--group', type=int, required=True, help='ID группы ВК (положительный)')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--post-id', type=int, default=int(time.time()) % 1000000)
+    args = parser.parse_args()
+
+    print('confirmation:', send(args.url, {'type': 'confirmation', 'group_id': args.group, 'secret': args.secret}))
+    event = {
+        'type': 'wall_post_new',
+        'group_id': args.group,
+        'event_id': f'test-{args.post_id}',
+        'object': sample_post(args.group, args.post_id),
+        'secret': args.secret,
+    }
+    print('wall_post_new:', send(args.url, event))
+
+
+if __name__ == '__main__':
+    main()
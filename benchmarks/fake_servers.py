@@ -0,0 +1,271 @@
+"""Локальные замены api.vk.ru и Telegram Bot API для бенчмарков.
+
+Серверы запускаются в отдельном процессе, чтобы их память не попадала в
+замеры бота. Задержка, доля ответов 429 и ошибок задаются параметрами,
+посты генерируются или берутся из записанных ответов wall.get/wall.getById.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import collections
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+
+import requests
+
+
+class FaultOptions(NamedTuple):
+    """Поведение сервера: задержка ответа и доли отказов."""
+    latency: float = 0.0
+    rate_limit: float = 0.0
+    errors: float = 0.0
+
+
+def generate_posts(count: int, owner_id: int = -1, photos: int = 1, text_size: int = 500,
+                   start_date: Optional[int] = None, copies: int = 0) -> List[Dict[str, Any]]:
+    """Генерируем посты в формате wall.get, от новых к старым.
+
+    Каждый пятый пост - репост другой группы, каждый третий содержит упоминание.
+
+    Args:
+        count (int): Количество постов.
+        owner_id (int): ID владельца стены.
+        photos (int): Фото в каждом посте.
+        text_size (int): Примерная длина текста.
+        start_date (Optional[int]): Дата самого старого поста, по умолчанию посты идут раз в минуту до текущего момента.
+        copies (int): Каждый copies-й пост повторяет текст и фото предыдущего, как пост группы-зеркала.
+            0 - без повторов.
+
+    Returns:
+        List[Dict[str, Any]]: Посты.
+    """
+    if start_date is None:
+        start_date = int(time.time()) - count * 60
+    posts = []
+    for number in range(count, 0, -1):
+        # Копия берёт текст и фото предыдущего (более старого) поста
+        source = number - 1 if copies and number % copies == 0 and number > 1 else number
+        text = (f'Текст поста {source} [id1|Павел Дуров]. ' if source % 3 == 0 else f'Текст поста {source}. ')
+        text = text * (text_size // len(text) + 1)
+        post: Dict[str, Any] = {
+            'id': number,
+            'owner_id': owner_id,
+            'date': start_date + number * 60,
+            'text': text[:text_size],
+            'attachments': [
+                {'type': 'photo', 'photo': {
+                    'id': source * 100 + index, 'owner_id': owner_id,
+                    'sizes': [{'type': kind, 'width': width, 'height': width * 3 // 4,
+                               'url': f'https://sun.example/{source}_{index}_{kind}.jpg'}
+                              for kind, width in (('s', 75), ('x', 604), ('y', 807), ('z', 1280), ('w', 2560))]}}
+                for index in range(photos)
+            ] + [{'type': 'link', 'link': {'url': f'https://example.com/{number}'}}],
+        }
+        if number % 5 == 0:
+            post['copy_history'] = [{'id': number, 'owner_id': -2, 'date': post['date'] - 10, 'text': 'Репост'}]
+        posts.append(post)
+    return posts
+
+
+class FakeVk:
+    def __init__(self, posts: List[Dict[str, Any]], faults: FaultOptions):
+        """Инициализируем замену VK API со стеной из posts (от новых к старым)."""
+        self.posts = posts
+        self.by_id = {f"{post['owner_id']}_{post['id']}": post for post in posts}
+        self.faults = faults
+
+    def call(self, method: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        """Отвечаем на вызов метода VK API."""
+        if random.random() < self.faults.rate_limit:
+            return 200, {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}
+        if method == 'wall.get':
+            offset = int(params.get('offset', 0))
+            count = int(params.get('count', 20))
+            return 200, {'response': {'count': len(self.posts), 'items': self.posts[offset:offset + count],
+                                      'profiles': [], 'groups': [{'id': 2, 'name': 'Другая группа'}]}}
+        if method == 'wall.getById':
+            items = [self.by_id[x] for x in params.get('posts', '').split(',') if x in self.by_id]
+            return 200, {'response': {'items': items, 'profiles': [], 'groups': []}}
+        if method == 'execute':
+            # Код VkAPI._execute_owner_names передаёт ID строками "user_ids" и "group_ids"
+            code = params.get('code', '')
+            users = re.search(r'"user_ids": "([\d,]*)"', code)
+            groups = re.search(r'"group_ids": "([\d,]*)"', code)
+            return 200, {'response': {'profiles': self._profiles(users.group(1) if users else ''),
+                                      'groups': self._groups(groups.group(1) if groups else '')}}
+        if method == 'users.get':
+            return 200, {'response': self._profiles(params.get('user_ids', ''))}
+        if method == 'groups.getById':
+            return 200, {'response': {'groups': self._groups(params.get('group_ids') or params.get('group_id', ''))}}
+        return 200, {'error': {'error_code': 3, 'error_msg': f'Unknown method {method}'}}
+
+    @staticmethod
+    def _profiles(user_ids: str) -> List[Dict[str, Any]]:
+        return [{'id': int(x), 'first_name': 'Имя', 'last_name': f'Фамилия{x}'} for x in user_ids.split(',') if x]
+
+    @staticmethod
+    def _groups(group_ids: str) -> List[Dict[str, Any]]:
+        return [{'id': int(x), 'name': f'Группа {x}'} for x in group_ids.split(',') if x.isdigit()]
+
+
+class FakeTelegram:
+    def __init__(self, faults: FaultOptions):
+        """Инициализируем замену Telegram Bot API."""
+        self.faults = faults
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def _message(self, chat_id: str, **fields: Any) -> Dict[str, Any]:
+        with self.lock:
+            message_id = next(self.message_ids)
+        return {'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': -100, 'type': 'channel', 'username': chat_id.lstrip('@')}, **fields}
+
+    def _photo(self, chat_id: str) -> Dict[str, Any]:
+        with self.lock:
+            file_id = f'file{next(self.file_ids)}'
+        return self._message(chat_id, photo=[{'file_id': file_id, 'file_unique_id': file_id,
+                                              'width': 1280, 'height': 960}])
+
+    def call(self, method: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        """Отвечаем на вызов метода Bot API."""
+        if random.random() < self.faults.rate_limit:
+            return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                         'parameters': {'retry_after': 1}}
+        chat_id = params.get('chat_id', '@bench')
+        if method == 'sendMessage':
+            return 200, {'ok': True, 'result': self._message(chat_id, text=params.get('text', ''))}
+        if method == 'sendPhoto':
+            return 200, {'ok': True, 'result': self._photo(chat_id)}
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            if not 2 <= len(media) <= 10:
+                return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: wrong media count'}
+            return 200, {'ok': True, 'result': [self._photo(chat_id) for _ in media]}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+
+def _handler(vk: FakeVk, telegram: FakeTelegram, stats: collections.Counter) -> type:
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self) -> None:
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if body and 'x-www-form-urlencoded' in self.headers.get('Content-Type', ''):
+                params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+
+            parts = url.path.strip('/').split('/')
+            if parts == ['__stats']:
+                with lock:
+                    self._reply(200, dict(stats))
+                return
+            if parts == ['__reset']:
+                with lock:
+                    stats.clear()
+                self._reply(200, {})
+                return
+
+            api, server = ('vk', vk) if parts[0] == 'method' else ('tg', telegram)
+            method = parts[-1]
+            with lock:
+                stats[f'{api}.{method}'] += 1
+            faults = server.faults
+            if faults.latency:
+                time.sleep(faults.latency)
+            if random.random() < faults.errors:
+                self._reply(502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+                return
+            self._reply(*server.call(method, params))
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def serve(port: int, posts: List[Dict[str, Any]], vk_faults: FaultOptions, tg_faults: FaultOptions,
+          ready: Optional[Any] = None) -> None:
+    """Запускаем обе замены на одном порту: /method/... - VK API, /bot<token>/... - Bot API."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _handler(FakeVk(posts, vk_faults), FakeTelegram(tg_faults),
+                                                               collections.Counter()))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeServers:
+    def __init__(self, posts: List[Dict[str, Any]], vk_faults: FaultOptions = FaultOptions(),
+                 tg_faults: FaultOptions = FaultOptions()):
+        """Инициализируем замены серверов в отдельном процессе.
+
+        Args:
+            posts (List[Dict[str, Any]]): Стена ВК от новых постов к старым.
+            vk_faults (FaultOptions): Поведение VK API.
+            tg_faults (FaultOptions): Поведение Bot API.
+        """
+        ready: multiprocessing.Queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(0, posts, vk_faults, tg_faults, ready), daemon=True)
+        self.process.start()
+        self.url = f'http://127.0.0.1:{ready.get(timeout=10)}'
+
+    @property
+    def vk_url(self) -> str:
+        """Адрес VK API для HttpTransport."""
+        return f'{self.url}/method'
+
+    @property
+    def telegram_url(self) -> str:
+        """Шаблон адреса Bot API для telebot.apihelper.API_URL."""
+        return self.url + '/bot{0}/{1}'
+
+    def stats(self) -> Dict[str, int]:
+        """Количество вызовов по методам."""
+        return requests.get(f'{self.url}/__stats', timeout=5).json()
+
+    def reset(self) -> None:
+        """Обнуляем счётчики вызовов."""
+        requests.get(f'{self.url}/__reset', timeout=5)
+
+    def stop(self) -> None:
+        """Останавливаем процесс серверов."""
+        self.process.terminate()
+        self.process.join()
+
+
+def load_recorded(path: str) -> List[Dict[str, Any]]:
+    """Читаем записанный ответ wall.get или wall.getById (JSON с полем response или без него).
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        List[Dict[str, Any]]: Посты от новых к старым.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    data = data.get('response', data)
+    items = data['items'] if isinstance(data, dict) else data
+    return sorted(items, key=lambda post: post.get('date', 0), reverse=True)
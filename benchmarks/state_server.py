@@ -0,0 +1,42 @@
+"""Локальный сервер общего состояния для процессов бота на нескольких машинах или в тестах.
+
+Хранит живые процессы и аренду источников в SQLite и открывает их по HTTP.
+Запуск из корня проекта:
+
+    python -m benchmarks.state_server --port 8200 --path /tmp/state.sqlite3
+
+Процессы бота подключаются к нему через STATE_STORE=http://127.0.0.1:8200.
+"""
+import argparse
+import logging
+import time
+
+from app.state_store import SqliteStateStore, StateStoreServer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--path', default=':memory:', help='Файл SQLite, по умолчанию состояние только в памяти')
+    parser.add_argument('--interval', type=float, default=10, help='Как часто выводить живые процессы, секунд')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    logger = logging.getLogger('state_server')
+    store = SqliteStateStore(args.path)
+    server = StateStoreServer(args.host, args.port, store, logger)
+    server.start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            logger.info("Живые процессы: %s", ', '.join(store.workers()) or 'нет')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,75 @@
+import asyncio
+import atexit
+import multiprocessing
 import os
+import queue
+import signal
+import socket
 import sys
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, nullcontext
+from typing import AsyncIterator, ContextManager, Dict, Iterable, List, NamedTuple, Optional
 from decouple import config
-from time import sleep
+from time import sleep, monotonic
 from datetime import datetime
 import logging
+import requests
 
+from app.async_runtime import PIPELINE_STAGES, AsyncPipeline, AsyncVkAPI, LoopRunner, Runner, run_blocking
+from app.backfill import Backfill, BackfillQueue, BackfillSchedule, DEFAULT_WINDOWS, parse_windows
+from app.cache import LRUCache, SqliteStore
+from app.callback_server import CallbackEvent, CallbackServer
+from app.composer import compose_message
+from app.dedup import DEDUP_WINDOW, DedupIndex
+from app.journal import DeliveryJournal, PostSteps
+from app.logs import LOG_FORMATS, parse_levels, setup_logging
+from app.media_relay import MAX_ALBUM_BYTES, MediaRelay, RELAY_MODES
+from app.metrics import LAG_BUCKETS, MetricsRegistry, MetricsServer, REGISTRY
+from app.models import Post
+from app.photo_size import PhotoSizeSelector, MAX_SIDE
+from app.poll_scheduler import PollScheduler
+from app.rate_limiter import SendScheduler, GLOBAL_RATE, CHAT_RATE, CHAT_BURST
+from app.retry import DeadLetterLog, RetryPolicy
+from app.routes import Route, load_routes
+from app.sharding import LEASE_TTL, LeaseLost, ShardCoordinator, shard_groups
+from app.state_store import open_state_store
+from app.transport import HttpTransport, VK_API_URL
 from app.vkontakte_api import VkAPI
-from app.telegram_api import TelegramBot
-from app.post_processor import PostProcessor
+from app.telegram_api import TelegramBot, request_timeout
+from app.post_processor import PostDraft, PostProcessor
 
 
 def setup_logger() -> logging.Logger:
     """Настраиваем логгер для приложения.
 
+    Записи выводятся отдельным потоком через очередь, поэтому запись логов
+    не задерживает проверку и отправку постов. Уровень, уровни по модулям,
+    формат и ограничение повторов берутся из LOG_LEVEL, LOG_LEVELS, LOG_FORMAT,
+    LOG_REPEAT_LIMIT и LOG_REPEAT_INTERVAL.
+
     Returns:
         logging.Logger: Настроенный логгер.
     """
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    logger_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
-    console_handler.setFormatter(logger_format)
-    logger.addHandler(console_handler)
+    log_level = config('LOG_LEVEL', default='INFO').upper()
+    log_format = config('LOG_FORMAT', default='text').lower()
+    try:
+        level = logging.getLevelName(log_level)
+        if not isinstance(level, int):
+            raise ValueError(f"Неизвестный уровень LOG_LEVEL: {log_level}")
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"LOG_FORMAT должен быть одним из: {', '.join(LOG_FORMATS)}")
+        module_levels = parse_levels(config('LOG_LEVELS', default=''))
+    except ValueError as e:
+        print(f"Неверные настройки логов: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    listener = setup_logging(logger, level, module_levels, log_format,
+                             config('LOG_REPEAT_LIMIT', default=5, cast=int),
+                             config('LOG_REPEAT_INTERVAL', default=60, cast=float))
+    # При выходе дописываем записи, оставшиеся в очереди
+    atexit.register(listener.stop)
     return logger
 
 
@@ -86,20 +132,6 @@ def read_posts_list(file_path: str, logger: logging.Logger) -> Optional[str]:
         return None
 
 
-def write_last_date(file_path: str, date: int, logger: logging.Logger) -> None:
-    """Записываем дату последнего поста в файл.
-
-    Args:
-        file_path (str): Путь к файлу.
-        date (int): Unix timestamp для записи
-        logger (logging.Logger): Логгер для вывода сообщений.
-    """
-    try:
-        _write_file(file_path, str(date), logger, success_msg=f"Обновлена дата последнего поста: {date}")
-    except IOError as e:
-        logger.error(f"Не удалось записать файл {file_path} : {e}")
-
-
 def write_posts_list(file_path: str, posts_list: str, logger: logging.Logger) -> None:
     """Записываем дату последнего поста в файл.
 
@@ -109,7 +141,7 @@ def write_posts_list(file_path: str, posts_list: str, logger: logging.Logger) ->
         logger (logging.Logger): Логгер для вывода сообщений.
     """
     try:
-        _write_file(file_path, posts_list, logger, f"Загрузили список постов, очищаем файл: {posts_list}")
+        _write_file(file_path, posts_list, logger, f"Записан список постов {file_path}, символов: {len(posts_list)}")
     except IOError as e:
         logger.error(f"Не удалось записать файл {file_path} : {e}")
 
@@ -129,126 +161,971 @@ def _write_file(
         logger.error(f"Не удалось записать файл {file_path}: {e}")
 
 
+# Формат ссылок на упоминания ВК (MENTION_LINKS) и соответствующий parse_mode Telegram
+PARSE_MODES = {'html': 'HTML', 'markdown': 'MarkdownV2'}
 
-def check_post(
-    post: dict,
-    last_date: Optional[int],
+
+class PreparedPost(NamedTuple):
+    """Обработанный пост, готовый к отправке."""
+    post_key: str
+    draft: PostDraft
+    steps: Dict[str, PostSteps]
+
+
+class Source(NamedTuple):
+    """Источник: маршрут и клиенты, через которые он обрабатывается."""
+    route: Route
+    vk_api: VkAPI
+    post_processor: PostProcessor
+    telegram_bots: List[TelegramBot]
+
+
+class Push(NamedTuple):
+    """Приём новых постов через VK Callback API."""
+    server: CallbackServer
+    # Индексы источников по ID группы ВК
+    groups: Dict[int, List[int]]
+    # Насколько глубже смотрят сверочные проверки, секунд
+    lookback: int
+
+
+class Shard(NamedTuple):
+    """Часть источников, которую обрабатывает этот процесс."""
+    coordinator: ShardCoordinator
+    # Ключ группы источников по индексу источника
+    keys: List[str]
+
+
+def screen_post(
+    post: Post,
+    journal: DeliveryJournal,
     post_processor: PostProcessor,
-    telegram_bot: TelegramBot,
+    channels: List[str],
     logger: logging.Logger,
-    reposts: bool
-) -> bool:
-    """Проверяем и отправляем пост, если он новый и соответствует настройкам.
+    dedup: Optional[DedupIndex] = None
+) -> Optional[PreparedPost]:
+    """Проверяем, в какие каналы нужно отправить пост, и прогоняем его через фильтры.
+
+    Копии поста, уже отправленного в канал из другой группы, отбрасываются
+    до обработки, поэтому не стоят запросов к ВК и Telegram. Имена авторов
+    цитат и текст сообщения ещё не готовы, их добавляют resolve_owners и finish.
 
     Args:
-        post (dict): Данные поста из ВК.
-        last_date (Optional[int]): Дата последнего отправленного поста (Unix timestamp).
+        post (Post): Пост ВК.
+        journal (DeliveryJournal): Журнал доставки постов.
         post_processor (PostProcessor): Обработчик постов.
-        telegram_bot (TelegramBot): Бот для отправки сообщений.
+        channels (List[str]): Каналы Telegram маршрута.
         logger (logging.Logger): Логгер для вывода сообщений.
-        reposts (bool): Разрешать ли отправку репостов.
+        dedup (Optional[DedupIndex]): Индекс отправленного содержимого, None - не искать повторы.
 
     Returns:
-        bool: True, если пост отправлен, иначе False.
+        Optional[PreparedPost]: Пост после фильтров или None, если отправлять не нужно.
     """
-    post_date = int(post['date'])
+    post_key = post.key
+    post_date = post.date
+    logger.debug("Проверяю пост %s от %s", post_key, datetime.fromtimestamp(post_date).date())
+
     # Пропуск уже опубликованных
-    if last_date and post_date <= last_date:
-        logger.info(f"Пост уже опубликован  {post['id']} : {last_date} > {post_date}")
-        return False
+    channels = [channel for channel in channels if not journal.is_delivered(post_key, channel, post_date)]
+    if not channels:
+        logger.info("Пост уже опубликован  %s", post_key)
+        return None
 
-    # Пропуск перепостов
-    if not reposts and 'copy_history' in post:
-        logger.info(f"Пропущен пост {post['id']}, так как перепост отключен")
-        return False
+    # Пропуск копий постов, уже отправленных в канал из других групп
+    if dedup is not None:
+        duplicates = {channel: original for channel in channels if (original := dedup.claim(post, channel))}
+        for channel, original in duplicates.items():
+            logger.info("Пост %s повторяет %s, в %s не отправляется", post_key, original, channel)
+            post_processor.metrics.counter(
+                'vk2tg_duplicates_total', 'Посты, отброшенные как повтор уже отправленных', ('channel',)
+            ).inc(channel=channel)
+            journal.begin(post_key, channel, post_date)
+            journal.mark_done(post_key, channel)
+        channels = [channel for channel in channels if channel not in duplicates]
+        if not channels:
+            return None
 
-    logger.info(f"Отправка поста {post['id']}")
-    text, images = post_processor.process_post(post)
-    
-    if text:
-        telegram_bot.send_text_message(text, post_processor.preview_link)
-    
-    if images:
-        telegram_bot.send_image_messages(images)
+    steps = {channel: journal.begin(post_key, channel, post_date) for channel in channels}
+
+    # Пропуск постов, отклонённых фильтрами (например, перепостов)
+    draft = post_processor.screen(post)
+    if draft.skip_reason:
+        logger.info("Пропущен пост %s, так как %s", post.id, draft.skip_reason)
+        for channel in channels:
+            journal.mark_done(post_key, channel)
+            if dedup is not None:
+                dedup.release(post, channel)
+        return None
+
+    return PreparedPost(post_key, draft, steps)
+
+
+def screen_posts(
+    posts: Iterable[Post],
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    channels: List[str],
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None
+) -> List[PreparedPost]:
+    """Проверяем страницу постов и получаем имена авторов цитат одним запросом на страницу.
+
+    Имена запрашиваются только для постов, прошедших журнал, поиск повторов
+    и фильтры. Осталось вызвать PostProcessor.finish для каждого поста.
+
+    Args:
+        posts (Iterable[Post]): Посты ВК в порядке отправки.
+        journal (DeliveryJournal): Журнал доставки постов.
+        post_processor (PostProcessor): Обработчик постов.
+        channels (List[str]): Каналы Telegram маршрута.
+        logger (logging.Logger): Логгер для вывода сообщений.
+        dedup (Optional[DedupIndex]): Индекс отправленного содержимого, None - не искать повторы.
+
+    Returns:
+        List[PreparedPost]: Посты, которые нужно отправить.
+    """
+    screened = [prepared for post in posts
+                if (prepared := screen_post(post, journal, post_processor, channels, logger, dedup)) is not None]
+    post_processor.resolve_owners(prepared.draft for prepared in screened)
+    return screened
+
+
+def prepare_posts(
+    posts: Iterable[Post],
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    channels: List[str],
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None
+) -> List[PreparedPost]:
+    """Проверяем и обрабатываем страницу постов, см. screen_posts.
+
+    Returns:
+        List[PreparedPost]: Обработанные посты, которые нужно отправить.
+    """
+    prepared = screen_posts(posts, journal, post_processor, channels, logger, dedup)
+    for item in prepared:
+        post_processor.finish(item.draft)
+    return prepared
+
+
+def prepare_post(
+    post: Post,
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    channels: List[str],
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None
+) -> Optional[PreparedPost]:
+    """Проверяем и обрабатываем один пост, см. screen_posts.
+
+    Returns:
+        Optional[PreparedPost]: Обработанный пост или None, если отправлять не нужно.
+    """
+    prepared = prepare_posts([post], journal, post_processor, channels, logger, dedup)
+    return prepared[0] if prepared else None
+
+
+def deliver_post(
+    prepared: PreparedPost,
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    telegram_bots: List[TelegramBot],
+    logger: logging.Logger,
+    observe_lag: bool = True
+) -> None:
+    """Отправляем обработанный пост в каналы и отмечаем его доставленным.
+
+    Лимиты Telegram и повторы ожидаются в текущем потоке, см. deliver_post_async.
+    """
+    run_blocking(deliver_post_async(prepared, journal, post_processor, telegram_bots, logger, None, observe_lag))
+
+
+async def deliver_post_async(
+    prepared: PreparedPost,
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    telegram_bots: List[TelegramBot],
+    logger: logging.Logger,
+    runner: Optional[Runner],
+    observe_lag: bool = True
+) -> None:
+    """Отправляем обработанный пост в каналы и отмечаем его доставленным.
+
+    Args:
+        prepared (PreparedPost): Обработанный пост.
+        journal (DeliveryJournal): Журнал доставки постов.
+        post_processor (PostProcessor): Обработчик постов.
+        telegram_bots (List[TelegramBot]): Боты каналов маршрута.
+        logger (logging.Logger): Логгер для вывода сообщений.
+        runner (Optional[Runner]): Выполняет ожидания и запросы, None - в текущем потоке
+            через планировщик каждого бота.
+        observe_lag (bool): Записывать ли задержку доставки. Старые посты из списка
+            last_post/posts не записываются, иначе они забивают верхние интервалы гистограммы.
+    """
+    for telegram_bot in telegram_bots:
+        steps = prepared.steps.get(telegram_bot.channel)
+        if steps is None:
+            continue
+        bot_runner = runner or telegram_bot.scheduler.blocking
+
+        logger.info("Отправка поста %s в %s", prepared.post_key, telegram_bot.channel)
+        draft = prepared.draft
+        # Без стадии split сообщения собираются для каждого канала отдельно
+        parts = draft.parts if draft.parts is not None else compose_message(
+            draft.message, draft.images, telegram_bot.parse_mode, post_processor.media_caption)
+        await telegram_bot.send_parts_async(parts, post_processor.preview_link, steps, bot_runner)
+
+        await bot_runner.call(journal.mark_done, prepared.post_key, telegram_bot.channel)
+        if not observe_lag:
+            continue
+        # Задержка от публикации в ВК до доставки в канал
+        telegram_bot.metrics.histogram(
+            'vk2tg_delivery_lag_seconds', 'Время от публикации поста в ВК до доставки в канал', ('channel',),
+            LAG_BUCKETS).observe(datetime.now().timestamp() - draft.post.date, channel=telegram_bot.channel)
 
-    return True
+
+def check_posts(
+    posts: Iterable[Post],
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    telegram_bots: List[TelegramBot],
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None,
+    observe_lag: bool = True
+) -> List[Post]:
+    """Проверяем страницу постов и отправляем новые, соответствующие настройкам.
+
+    Каждый шаг отправки записывается в журнал, поэтому после перезапуска
+    наполовину отправленный пост дописывается с места остановки. Имена
+    авторов цитат запрашиваются одним запросом на страницу. Если у ботов
+    задан fence, аренда проверяется перед страницей, перед каждым постом
+    и перед каждым запросом.
+
+    Args:
+        posts (Iterable[Post]): Посты ВК в порядке отправки.
+        journal (DeliveryJournal): Журнал доставки постов.
+        post_processor (PostProcessor): Обработчик постов.
+        telegram_bots (List[TelegramBot]): Боты каналов, в которые отправляются посты.
+        logger (logging.Logger): Логгер для вывода сообщений.
+        dedup (Optional[DedupIndex]): Индекс отправленного содержимого, None - не искать повторы.
+        observe_lag (bool): Записывать ли задержку доставки, False - для постов из списка.
+
+    Returns:
+        List[Post]: Отправленные посты.
+
+    Raises:
+        LeaseLost: Если процесс потерял аренду источника.
+    """
+    def fence() -> None:
+        for telegram_bot in telegram_bots:
+            if telegram_bot.fence is not None:
+                telegram_bot.fence()
+
+    posts = list(posts)
+    started = monotonic()
+    check_seconds = post_processor.metrics.histogram(
+        'vk2tg_check_post_seconds', 'Проверка, обработка и отправка одного поста', ('result',))
+    channels = [telegram_bot.channel for telegram_bot in telegram_bots]
+    # Страница не начинается, если процесс больше не владеет источником каналов
+    fence()
+    prepared = prepare_posts(posts, journal, post_processor, channels, logger, dedup)
+    # Время обработки страницы делится поровну между её постами
+    share = (monotonic() - started) / len(posts) if posts else 0
+    for _ in range(len(posts) - len(prepared)):
+        check_seconds.observe(share, result='skipped')
+
+    sent = []
+    for item in prepared:
+        started = monotonic()
+        fence()
+        deliver_post(item, journal, post_processor, telegram_bots, logger, observe_lag)
+        check_seconds.observe(share + monotonic() - started, result='sent')
+        sent.append(item.draft.post)
+    return sent
+
+
+def check_post(
+    post: Post,
+    journal: DeliveryJournal,
+    post_processor: PostProcessor,
+    telegram_bots: List[TelegramBot],
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None,
+    observe_lag: bool = True
+) -> bool:
+    """Проверяем и отправляем один пост, см. check_posts.
+
+    Returns:
+        bool: True, если пост отправлен, иначе False.
+
+    Raises:
+        LeaseLost: Если процесс потерял аренду источника.
+    """
+    return bool(check_posts([post], journal, post_processor, telegram_bots, logger, dedup, observe_lag))
+
+
+def source_last_date(journal: DeliveryJournal, channels: List[str], lookback: int = 0) -> Optional[int]:
+    """Получаем дату, с которой нужно загружать посты для всех каналов маршрута.
+
+    Args:
+        journal (DeliveryJournal): Журнал доставки постов.
+        channels (List[str]): Каналы маршрута.
+        lookback (int): На сколько секунд раньше начинать, чтобы найти посты,
+            пропущенные между доставленными (например, потерянные события Callback API).
+
+    Returns:
+        Optional[int]: Самая ранняя из дат последних доставленных постов или None.
+    """
+    dates = [date for date in (journal.last_date(channel) for channel in channels) if date is not None]
+    return min(dates) - lookback if dates else None
+
+
+def build_sources(
+    routes: List[Route],
+    vk_token: str,
+    bot_token: str,
+    vk_transport: HttpTransport,
+    owner_names: LRUCache,
+    scheduler: SendScheduler,
+    retry_policy: RetryPolicy,
+    dead_letters: DeadLetterLog,
+    parse_mode: Optional[str],
+    file_ids: LRUCache,
+    relay: Optional[MediaRelay],
+    photo_sizes: PhotoSizeSelector,
+    logger: logging.Logger,
+    metrics: Optional[MetricsRegistry] = None
+) -> List[Source]:
+    """Создаём клиентов для маршрутов, разделяя пул соединений, кэш имён, планировщик и реестр метрик.
+
+    Для каждого канала создаётся один бот, даже если канал есть в нескольких маршрутах.
+
+    Returns:
+        List[Source]: Источники в порядке маршрутов.
+    """
+    telegram_bots: Dict[str, TelegramBot] = {}
+    sources = []
+    for route in routes:
+        for channel in route.channels:
+            if channel not in telegram_bots:
+                telegram_bots[channel] = TelegramBot(
+                    bot_token, channel, logger, scheduler, retry_policy, dead_letters, parse_mode, file_ids, relay,
+                    metrics)
+        bots = [telegram_bots[channel] for channel in route.channels]
+        vk_api = VkAPI(vk_token, route.domain, logger, vk_transport, owner_names, photo_sizes)
+        post_processor = PostProcessor(bots[0], vk_api, route.include_link, route.preview_link, route.reposts, logger,
+                                       route.media_caption, route.stages, metrics=metrics)
+        sources.append(Source(route, vk_api, post_processor, bots))
+    return sources
+
+
+def hold_source(shard: Optional[Shard], index: int) -> ContextManager[bool]:
+    """Отмечаем, что источник проверяется, если источники делятся между процессами.
+
+    Args:
+        shard (Optional[Shard]): Источники этого процесса или None.
+        index (int): Индекс источника.
+
+    Returns:
+        ContextManager[bool]: Контекст, который возвращает, владеет ли процесс источником.
+    """
+    return shard.coordinator.hold(shard.keys[index]) if shard else nullcontext(True)
+
+
+def handle_event(
+    event: CallbackEvent,
+    sources: List[Source],
+    push: Push,
+    journal: DeliveryJournal,
+    logger: logging.Logger,
+    dedup: Optional[DedupIndex] = None,
+    shard: Optional[Shard] = None
+) -> None:
+    """Отправляем пост из события Callback API во все маршруты его группы.
+
+    Тело события не отправляется: пост перечитывается из ВК запросом
+    wall.getById, поэтому в канал попадает только то, что опубликовано на
+    стене группы. События о постах чужих стен отбрасываются. Если пост не
+    удалось загрузить, его найдёт сверочная проверка стены.
+
+    Args:
+        event (CallbackEvent): Событие wall_post_new.
+        sources (List[Source]): Источники.
+        push (Push): Приём событий и соответствие групп источникам.
+        journal (DeliveryJournal): Журнал доставки постов.
+        logger (logging.Logger): Логгер для вывода сообщений.
+        dedup (Optional[DedupIndex]): Индекс отправленного содержимого, None - не искать повторы.
+        shard (Optional[Shard]): Источники этого процесса, маршруты других процессов пропускаются.
+    """
+    indexes = push.groups.get(event.group_id)
+    if not indexes:
+        logger.warning(f"Событие от группы {event.group_id}, для которой нет маршрута")
+        return
+    owner_id, post_id = event.post.get('owner_id'), event.post.get('id')
+    if owner_id != -event.group_id or not isinstance(post_id, int):
+        logger.warning(f"Событие группы {event.group_id} о посте чужой стены {owner_id}_{post_id}, пропускаем")
+        return
+    try:
+        posts = sources[indexes[0]].vk_api.get_posts(f'{owner_id}_{post_id}')
+    except requests.RequestException as e:
+        logger.warning(f"Не удалось загрузить пост {owner_id}_{post_id} из события: {e}")
+        return
+    if not posts:
+        logger.warning(f"Пост {owner_id}_{post_id} из события не найден в ВК")
+        return
+    post = posts[0]
+    for index in indexes:
+        source = sources[index]
+        with hold_source(shard, index) as owned:
+            if not owned:
+                continue
+            try:
+                check_post(post, journal, source.post_processor, source.telegram_bots, logger, dedup)
+            except LeaseLost as e:
+                logger.warning(f"Отправка поста из события прервана: {e}")
+
+
+def run_sync(
+    sources: List[Source],
+    journal: DeliveryJournal,
+    logger: logging.Logger,
+    backfill: Optional[Backfill],
+    max_catchup: int,
+    poller: PollScheduler,
+    push: Optional[Push],
+    metrics: MetricsRegistry = REGISTRY,
+    dedup: Optional[DedupIndex] = None,
+    shard: Optional[Shard] = None,
+    stop: Optional[threading.Event] = None
+) -> None:
+    """Основной цикл: источники проверяются по очереди, когда подходит их время, посты отправляются по одному.
+
+    Между проверками отправляются посты из событий Callback API и из списка
+    last_post/posts по расписанию backfill, список относится к первому маршруту.
+    Посты из списка выбраны вручную, повторы среди них не ищутся.
+    Если задан shard, проверяются только источники, которыми владеет процесс,
+    а список отправляет владелец первого маршрута. Аренду продлевает фоновый
+    поток, а отправка прерывается, как только аренда потеряна.
+    Цикл завершается, когда установлен stop (например, в бенчмарке).
+    """
+    first = sources[0]
+    lookback = push.lookback if push else 0
+    loop_seconds = metrics.counter('vk2tg_loop_seconds_total', 'Время работы и ожидания основного цикла', ('state',))
+    last_poll = metrics.gauge('vk2tg_last_poll_timestamp_seconds', 'Время последней проверки источника', ('source',))
+    stop = stop or threading.Event()
+    if shard:
+        shard.coordinator.start()
+    while not stop.is_set():
+        started = monotonic()
+        try:
+            for index in poller.due():
+                source = sources[index]
+                route = source.route
+                with hold_source(shard, index) as owned:
+                    if not owned:
+                        # Источник обрабатывает другой процесс, проверим, не перешёл ли он к нам
+                        poller.postpone(index, shard.coordinator.renew_interval)
+                        continue
+                    # Получаем свежие данные из ВК, от старых к новым до последнего опубликованного
+                    logger.info("Делаю проверку новых постов ВК %s...", route.domain)
+                    last_date = source_last_date(journal, route.channels, lookback)
+                    posts = source.vk_api.iter_new_posts(last_date, route.count, max_catchup)
+                    try:
+                        dates = [post.date for post in check_posts(
+                            posts, journal, source.post_processor, source.telegram_bots, logger, dedup)]
+                    except LeaseLost as e:
+                        logger.warning(f"Проверка {route.domain} прервана: {e}")
+                        poller.postpone(index, shard.coordinator.renew_interval)
+                        continue
+                interval = poller.record(index, dates)
+                last_poll.set(datetime.now().timestamp(), source=route.domain)
+                logger.debug("Следующая проверка %s через %.0f с", route.domain, interval)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Кэш имён владельцев: %s", first.vk_api.owner_names.stats())
+
+            # Посты из списка отправляются по одному, когда подходит их время
+            delay = None
+            if backfill:
+                with hold_source(shard, 0) as owned:
+                    if not owned:
+                        delay = shard.coordinator.renew_interval
+                    else:
+                        try:
+                            delay = backfill.step(
+                                first.vk_api.get_posts,
+                                lambda post: check_post(post, journal, first.post_processor, first.telegram_bots,
+                                                        logger, observe_lag=False))
+                        except LeaseLost as e:
+                            logger.warning(f"Отправка списка постов прервана: {e}")
+
+            # Ожидание на проверку следующего нового поста в ВК или следующего поста из списка
+            sleep_time = poller.delay()
+            if delay is not None and delay < sleep_time:
+                sleep_time = delay
+            logger.info("..Сплю %.0f секунд перед следующей проверкой ВК", sleep_time)
+            waited = monotonic()
+            loop_seconds.inc(waited - started, state='work')
+            if not push:
+                stop.wait(sleep_time)
+                loop_seconds.inc(monotonic() - waited, state='sleep')
+                continue
+
+            # Во время ожидания отправляем посты из событий Callback API
+            try:
+                event = push.server.events.get(timeout=sleep_time)
+            except queue.Empty:
+                continue
+            finally:
+                loop_seconds.inc(monotonic() - waited, state='sleep')
+            started = monotonic()
+            handle_event(event, sources, push, journal, logger, dedup, shard)
+            loop_seconds.inc(monotonic() - started, state='work')
+
+        except Exception as e:
+            logger.error(f"Ошибка в основном цикле: {e}")
+            stop.wait(60)
+
+
+async def run_async(
+    sources: List[Source],
+    journal: DeliveryJournal,
+    logger: logging.Logger,
+    backfill: Optional[Backfill],
+    max_catchup: int,
+    poller: PollScheduler,
+    push: Optional[Push],
+    metrics: MetricsRegistry = REGISTRY,
+    dedup: Optional[DedupIndex] = None,
+    shard: Optional[Shard] = None,
+    stop: Optional[threading.Event] = None
+) -> None:
+    """Основной цикл на asyncio: каждый источник проверяется своей задачей по расписанию poller,
+    а внутри источника обработка следующего поста идёт одновременно с отправкой предыдущего.
+    События Callback API и посты из списка last_post/posts обрабатываются отдельными задачами.
+    Если задан shard, аренду источников продлевает фоновый поток, как и в run_sync.
+    Цикл завершается, когда установлен stop.
+
+    Блокирующие вызовы выполняются в собственном пуле цикла: по потоку на каждую
+    стадию конвейера каждого источника, список постов и события. Ожидания лимитов
+    Telegram и повторов отправки идут в цикле событий и потоков не занимают."""
+    lookback = push.lookback if push else 0
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(len(sources) * PIPELINE_STAGES + 2, thread_name_prefix='vk2tg'))
+    runner = LoopRunner()
+    # Проверка источника и пост из события не должны отправлять один и тот же пост одновременно
+    locks = [asyncio.Lock() for _ in sources]
+    # Время работы и ожидания суммируется по задачам источников
+    loop_seconds = metrics.counter('vk2tg_loop_seconds_total', 'Время работы и ожидания основного цикла', ('state',))
+    last_poll = metrics.gauge('vk2tg_last_poll_timestamp_seconds', 'Время последней проверки источника', ('source',))
+
+    async def run_source(index: int) -> List[int]:
+        source = sources[index]
+        route = source.route
+        async_vk = AsyncVkAPI(source.vk_api)
+
+        def screen(posts: List[Post]) -> List[PreparedPost]:
+            if shard:
+                shard.coordinator.ensure(shard.keys[index])
+            return screen_posts(posts, journal, source.post_processor, route.channels, logger, dedup)
+
+        def finish(prepared: PreparedPost) -> PreparedPost:
+            if shard:
+                shard.coordinator.ensure(shard.keys[index])
+            source.post_processor.finish(prepared.draft)
+            return prepared
+
+        dates = []
+
+        async def deliver(prepared: PreparedPost) -> None:
+            await deliver_post_async(prepared, journal, source.post_processor, source.telegram_bots, logger, runner)
+            dates.append(prepared.draft.post.date)
+
+        async def screened() -> AsyncIterator[PreparedPost]:
+            logger.info("Делаю проверку новых постов ВК %s...", route.domain)
+            last_date = source_last_date(journal, route.channels, lookback)
+            posts = [post async for post in async_vk.iter_new_posts(last_date, route.count, max_catchup)]
+            # Имена авторов цитат запрашиваются для всей страницы сразу, до отправки первого поста
+            for prepared in await asyncio.to_thread(screen, posts):
+                yield prepared
+
+        await AsyncPipeline(logger).run(screened(), finish, deliver)
+        return dates
+
+    async def poll_source(index: int) -> None:
+        source = sources[index]
+        while True:
+            delay = poller.delay(index)
+            await asyncio.sleep(delay)
+            loop_seconds.inc(delay, state='sleep')
+            started = monotonic()
+            try:
+                async with locks[index]:
+                    with hold_source(shard, index) as owned:
+                        if not owned:
+                            # Источник обрабатывает другой процесс, проверим, не перешёл ли он к нам
+                            poller.postpone(index, shard.coordinator.renew_interval)
+                            continue
+                        dates = await run_source(index)
+                loop_seconds.inc(monotonic() - started, state='work')
+                last_poll.set(datetime.now().timestamp(), source=source.route.domain)
+                interval = poller.record(index, dates)
+                logger.debug("Следующая проверка %s через %.0f с", source.route.domain, interval)
+            except LeaseLost as e:
+                logger.warning(f"Проверка {source.route.domain} прервана: {e}")
+                poller.postpone(index, shard.coordinator.renew_interval)
+            except Exception as e:
+                logger.error(f"Ошибка при проверке {source.route.domain}: {e}")
+                poller.record(index, [])
+
+    async def run_push(push: Push) -> None:
+        events = push.server.attach(asyncio.get_running_loop())
+        while True:
+            event = await events.get()
+            try:
+                async with AsyncExitStack() as stack:
+                    for index in push.groups.get(event.group_id, []):
+                        await stack.enter_async_context(locks[index])
+                    await asyncio.to_thread(handle_event, event, sources, push, journal, logger, dedup, shard)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке события Callback API: {e}")
+
+    async def run_backfill(backfill: Backfill) -> None:
+        first = sources[0]
+
+        def step() -> Optional[float]:
+            with hold_source(shard, 0) as owned:
+                if not owned:
+                    return shard.coordinator.renew_interval
+                return backfill.step(
+                    first.vk_api.get_posts,
+                    lambda post: check_post(post, journal, first.post_processor, first.telegram_bots, logger,
+                                            observe_lag=False))
+
+        while True:
+            try:
+                delay = await asyncio.to_thread(step)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+            except LeaseLost as e:
+                logger.warning(f"Отправка списка постов прервана: {e}")
+                await asyncio.sleep(shard.coordinator.renew_interval)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке списка постов: {e}")
+                await asyncio.sleep(60)
+
+    async def watch_stop(stop: threading.Event, polls: asyncio.Future) -> None:
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        polls.cancel()
+
+    tasks = [asyncio.create_task(run_backfill(backfill))] if backfill else []
+    if push:
+        tasks.append(asyncio.create_task(run_push(push)))
+    if shard:
+        await asyncio.to_thread(shard.coordinator.start)
+    polls = asyncio.gather(*(poll_source(index) for index in range(len(sources))))
+    if stop is not None:
+        tasks.append(asyncio.create_task(watch_stop(stop, polls)))
+    try:
+        await polls
+    except asyncio.CancelledError:
+        if stop is None or not stop.is_set():
+            raise
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def register_state_metrics(
+    metrics: MetricsRegistry,
+    sources: List[Source],
+    caches: Dict[str, LRUCache],
+    poller: PollScheduler,
+    backfill_queue: BackfillQueue,
+    push: Optional[Push],
+    shard: Optional[Shard] = None
+) -> None:
+    """Добавляем метрики, значения которых читаются из состояния бота при каждом запросе /metrics.
+
+    Args:
+        metrics (MetricsRegistry): Реестр метрик.
+        sources (List[Source]): Источники.
+        caches (Dict[str, LRUCache]): Кэши по именам.
+        poller (PollScheduler): Планировщик проверок ВК.
+        backfill_queue (BackfillQueue): Очередь постов из списка last_post/posts.
+        push (Optional[Push]): Приём событий Callback API.
+        shard (Optional[Shard]): Источники этого процесса, если они делятся между процессами.
+    """
+    hits = metrics.counter('vk2tg_cache_hits_total', 'Попадания в кэш', ('cache',))
+    misses = metrics.counter('vk2tg_cache_misses_total', 'Промахи кэша', ('cache',))
+    size = metrics.gauge('vk2tg_cache_entries', 'Записей кэша в памяти', ('cache',))
+    for name, cache in caches.items():
+        hits.set_function(lambda cache=cache: cache.hits, cache=name)
+        misses.set_function(lambda cache=cache: cache.misses, cache=name)
+        size.set_function(lambda cache=cache: len(cache), cache=name)
+
+    depth = metrics.gauge('vk2tg_queue_depth', 'Постов в очереди на отправку', ('queue',))
+    depth.set_function(backfill_queue.pending_count, queue='backfill')
+    if push:
+        depth.set_function(push.server.pending, queue='callback')
+
+    interval = metrics.gauge('vk2tg_poll_interval_seconds', 'Текущий интервал проверок источника', ('source',))
+    for index, source in enumerate(sources):
+        interval.set_function(lambda index=index: poller.states[index].interval, source=source.route.domain)
+
+    if shard:
+        owned = metrics.gauge('vk2tg_shard_owned_groups', 'Группы источников, которыми владеет процесс')
+        owned.set_function(lambda: len(shard.coordinator.owned))
+
+
+def run_worker(env: Dict[str, str]) -> None:
+    """Запускаем бота в дочернем процессе с настройками, переданными супервизором.
+
+    Args:
+        env (Dict[str, str]): Переменные окружения процесса, например SHARD_WORKER_ID.
+    """
+    os.environ.update(env)
+    main()
+
+
+def run_supervisor(workers: int, logger: logging.Logger) -> None:
+    """Запускаем workers процессов бота, которые делят источники, и перезапускаем упавшие.
+
+    Каждый процесс получает ID вида <имя хоста>-<номер> и свою долю
+    TG_GLOBAL_RATE. Метрики процесса с номером N доступны на METRICS_PORT + N.
+
+    Args:
+        workers (int): Количество процессов.
+        logger (logging.Logger): Логгер для вывода сообщений.
+    """
+    context = multiprocessing.get_context('spawn')
+    host = socket.gethostname()
+    global_rate = config('TG_GLOBAL_RATE', default=GLOBAL_RATE, cast=float)
+    metrics_port = config('METRICS_PORT', default=0, cast=int)
+
+    def start(index: int) -> multiprocessing.Process:
+        env = {'SHARD_WORKER_ID': f"{host}-{index}", 'TG_GLOBAL_RATE': str(global_rate / workers)}
+        if metrics_port:
+            env['METRICS_PORT'] = str(metrics_port + index)
+        process = context.Process(target=run_worker, args=(env,), name=env['SHARD_WORKER_ID'])
+        process.start()
+        return process
+
+    # SIGTERM завершает процессы так же, как Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    processes = [start(index) for index in range(workers)]
+    logger.info(f"Запущено процессов: {workers}")
+    try:
+        while True:
+            sleep(5)
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    # Процесс с тем же ID сразу получает свои источники обратно, аренда ещё его
+                    logger.warning(f"Процесс {process.name} завершился с кодом {process.exitcode}, перезапускаю")
+                    processes[index] = start(index)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
 
 
 def main() -> None:
     """Основная функция для запуска бота."""
     logger = setup_logger()
 
+    # Супервизор только запускает процессы, которые делят между собой источники
+    shard_workers = config('SHARD_WORKERS', default=0, cast=int)
+    worker_id = config('SHARD_WORKER_ID', default='')
+    if shard_workers > 0 and not worker_id:
+        run_supervisor(shard_workers, logger)
+        return
+
     vk_token = read_tokens(os.environ.get('TOKEN_VK_FILE', ''), 'VK_TOKEN', logger)
     bot_token = read_tokens(os.environ.get('TOKEN_TELEGRAM_FILE', ''), 'BOT_TOKEN', logger)
     channel = config('CHANNEL', default="")
+    routes_file = config('ROUTES_FILE', default='')
     # Проверка обязательных переменных окружения
-    if not all([vk_token, bot_token, channel]):
+    if not all([vk_token, bot_token, channel or routes_file]):
         logger.critical("Одна или несколько обязательных переменных окружения не установлены!")
         sys.exit(1)
 
     # Считываем переменных окружения
     count_vk = config('COUNT', default=10, cast=int)
+    max_catchup = config('MAX_CATCHUP', default=1000, cast=int)
     domain_vk = config('DOMAIN', default='')
     include_link = config('INCLUDE_LINK', default=True, cast=bool)
     preview_link = config('PREVIEW_LINK', default=False, cast=bool)
     reposts = config('REPOSTS', default=True, cast=bool)
+    media_caption = config('MEDIA_CAPTION', default=True, cast=bool)
     wait_time = config('WAIT_TIME', default=3600, cast=int)
+    poll_min_interval = config('POLL_MIN_INTERVAL', default=300, cast=int)
+    poll_max_interval = config('POLL_MAX_INTERVAL', default=14400, cast=int)
+    callback_port = config('CALLBACK_PORT', default=0, cast=int)
+    callback_path = config('CALLBACK_PATH', default='/')
+    callback_confirmation = config('CALLBACK_CONFIRMATION', default='')
+    callback_secret = config('CALLBACK_SECRET', default='')
+    callback_poll_interval = config('CALLBACK_POLL_INTERVAL', default=21600, cast=int)
+    vk_api_url = config('VK_API_URL', default=VK_API_URL)
+    vk_timeout = config('VK_TIMEOUT', default=30, cast=float)
+    vk_pool_size = config('VK_POOL_SIZE', default=10, cast=int)
+    name_cache_size = config('NAME_CACHE_SIZE', default=2048, cast=int)
+    name_cache_ttl = config('NAME_CACHE_TTL', default=604800, cast=int)
+    name_cache_file = config('NAME_CACHE_FILE', default='last_post/cache.sqlite3')
+    tg_global_rate = config('TG_GLOBAL_RATE', default=GLOBAL_RATE, cast=float)
+    tg_chat_rate = config('TG_CHAT_RATE', default=CHAT_RATE * 60, cast=float) / 60
+    tg_chat_burst = config('TG_CHAT_BURST', default=CHAT_BURST, cast=float)
+    tg_max_attempts = config('TG_MAX_ATTEMPTS', default=5, cast=int)
+    dead_letter_file = config('DEAD_LETTER_FILE', default='last_post/dead_letter.jsonl')
+    journal_file = config('JOURNAL_FILE', default='last_post/journal.sqlite3')
+    use_async = config('ASYNC_MODE', default=False, cast=bool)
+    mention_links = config('MENTION_LINKS', default='').lower()
+    file_id_cache_size = config('FILE_ID_CACHE_SIZE', default=10000, cast=int)
+    relay_media = config('RELAY_MEDIA', default='fallback').lower()
+    relay_downloads = config('RELAY_DOWNLOADS', default=2, cast=int)
+    relay_album_mb = config('RELAY_ALBUM_MB', default=MAX_ALBUM_BYTES // (1024 * 1024), cast=int)
+    photo_max_side = config('PHOTO_MAX_SIDE', default=MAX_SIDE, cast=int)
+    photo_target_kb = config('PHOTO_TARGET_KB', default=0, cast=int)
+    backfill_per_day = config('BACKFILL_PER_DAY', default=3, cast=int)
+    backfill_windows = config('BACKFILL_WINDOWS', default=DEFAULT_WINDOWS)
+    metrics_port = config('METRICS_PORT', default=0, cast=int)
+    dedup_window = config('DEDUP_WINDOW', default=DEDUP_WINDOW, cast=int)
+    dedup_size = config('DEDUP_SIZE', default=10000, cast=int)
+    state_store = config('STATE_STORE', default='last_post/state.sqlite3')
+    shard_lease_ttl = config('SHARD_LEASE_TTL', default=LEASE_TTL, cast=float)
 
     # Инициализируем API и обработчики
-    vk_api = VkAPI(vk_token, domain_vk, logger)
-    telegram_bot = TelegramBot(bot_token, channel, logger)
-    post_processor = PostProcessor(telegram_bot, vk_api, include_link, preview_link, reposts, logger)
+    metrics = REGISTRY
+    vk_transport = HttpTransport(vk_api_url, timeout=(5, vk_timeout), pool_size=vk_pool_size, metrics=metrics)
+    name_store = SqliteStore(name_cache_file, 'owner_names', max_rows=name_cache_size * 10) if name_cache_file else None
+    owner_names = LRUCache(name_cache_size, name_cache_ttl, name_store)
+    # file_id фото в Telegram бессрочные, храним их рядом с кэшем имён
+    file_id_store = SqliteStore(name_cache_file, 'file_ids', max_rows=file_id_cache_size) if name_cache_file else None
+    file_ids = LRUCache(file_id_cache_size, None, file_id_store)
+    # Отпечатки отправленных постов для поиска копий из групп-зеркал, хранятся DEDUP_WINDOW секунд
+    dedup = None
+    if dedup_window:
+        dedup_store = SqliteStore(name_cache_file, 'dedup', max_rows=dedup_size) if name_cache_file else None
+        dedup = DedupIndex(LRUCache(dedup_size, dedup_window, dedup_store))
+    scheduler = SendScheduler(logger, tg_global_rate, tg_chat_rate, tg_chat_burst, metrics=metrics)
+    if relay_media not in RELAY_MODES:
+        logger.critical(f"RELAY_MEDIA должен быть одним из: {', '.join(RELAY_MODES)}")
+        sys.exit(1)
+    relay = None
+    if relay_media != 'off':
+        relay = MediaRelay(logger, relay_media, relay_downloads, max_album_bytes=relay_album_mb * 1024 * 1024)
+    retry_policy = RetryPolicy(max_attempts=tg_max_attempts)
+    photo_sizes = PhotoSizeSelector(photo_max_side, photo_target_kb or None)
+    try:
+        backfill_windows = parse_windows(backfill_windows)
+    except ValueError as e:
+        logger.critical(f"Неверный BACKFILL_WINDOWS: {e}")
+        sys.exit(1)
+    if backfill_per_day < 1:
+        logger.critical("BACKFILL_PER_DAY должен быть больше 0")
+        sys.exit(1)
+    dead_letters = DeadLetterLog(dead_letter_file, logger)
+
+    # Маршруты из файла или один маршрут из DOMAIN и CHANNEL
+    default_route = Route(domain_vk, [channel] if channel else [], include_link, preview_link, reposts, count_vk,
+                          media_caption)
+    try:
+        routes = load_routes(routes_file, default_route)
+        sources = build_sources(routes, vk_token, bot_token, vk_transport, owner_names, scheduler, retry_policy,
+                                dead_letters, PARSE_MODES.get(mention_links), file_ids, relay, photo_sizes, logger,
+                                metrics)
+    except (IOError, ValueError) as e:
+        logger.critical(f"Не удалось прочитать маршруты {routes_file}: {e}")
+        sys.exit(1)
 
-    # Читаем дату последнего поста
-    last_date = read_last_date('last_post/date', logger)
+    # Журнал доставки, дата из старого файла last_post/date переносится в него один раз
+    journal = DeliveryJournal(journal_file)
+    if channel and journal.last_date(channel) is None:
+        last_date = read_last_date('last_post/date', logger)
+        if last_date:
+            journal.import_last_date(channel, last_date)
 
-    # Если надо загружаем только выборочные посты из файла:
+    # Выборочные посты из файла переносятся в очередь, прогресс которой хранится в журнале
+    backfill_queue = BackfillQueue(journal_file)
     posts = read_posts_list('last_post/posts', logger)  # Строка вида: -218511206_1625,-218511206_1628,-218511206_1630
+    if posts:
+        added = backfill_queue.add(x.strip() for x in posts.split(',') if x.strip())
+        logger.info(f"В очередь старых постов добавлено: {added}")
+        write_posts_list('last_post/posts', '', logger)
+    backfill = None
+    if backfill_queue.pending_count():
+        backfill = Backfill(backfill_queue, BackfillSchedule(backfill_per_day, backfill_windows), logger)
+        logger.info(f"Постов в очереди: {backfill_queue.pending_count()}, в день: {backfill_per_day}")
 
-    while True:
+    # Источники делятся между процессами по аренде в общем хранилище STATE_STORE.
+    # Маршруты с общими каналами обрабатывает один процесс, так как лимиты отправки и поиск повторов работают в процессе
+    shard = None
+    if worker_id:
+        if callback_port:
+            logger.critical("Callback API нельзя использовать вместе с SHARD_WORKERS и SHARD_WORKER_ID")
+            sys.exit(1)
+        groups = shard_groups(routes)
+        keys = [''] * len(sources)
+        for key, indexes in groups.items():
+            for index in indexes:
+                keys[index] = key
+        # Отправка прерывается перед запросом к Telegram, если аренда не продержится до его конца
         try:
-            # Получаем список необходимых постов для загрузки
-            if posts:
-                vk_data = vk_api.get_little_data(posts)['items']
-                logger.info("Делаю проверку списка конкретных постов ВК из файла...")
-
-            # Получаем свежие данные из ВК
-            else:
-                vk_data = vk_api.get_data(count_vk)['items']
-                logger.info("Делаю проверку новых постов ВК...")
-
-                if 'is_pinned' in vk_data[0]:
-                    check_post(vk_data[0], last_date, post_processor, telegram_bot, logger, reposts)
-                    logger.info(f"Пост закреплён {vk_data[0]['id']}")
-
-                vk_data = reversed(vk_data)
-            
-            # Обработка и отправка постов в Telegram
-            for post in vk_data:
-                post_date = int(post['date'])
-                logger.info(f"Проверяю загруженные посты...  {datetime.fromtimestamp(post_date).strftime('%d.%m.%Y')}")
-
-                # Если пост был опубликован, то перезаписываем date опубликованных постов в файл
-                if check_post(post, last_date, post_processor, telegram_bot, logger, reposts):
-                    last_date = post_date
-                    write_last_date('last_post/date', str(last_date), logger)
-                    # Ожидание на отправку следующего нового поста в Telegram
-                    if posts:
-                        logger.info(f" Для списка постов жду 8 часов, чтобы не спамить в тг старыми постами...")
-                        sleep(28800) # чтобы не спамить часто постами ждём 8 часов
-                    sleep(60)
-            
-            if posts:
-                posts = ''
-                write_posts_list('last_post/posts', posts, logger)
-
-            # Ожидание на проверку следующего нового поста в ВК
-            logger.info(f"..Сплю {wait_time} секунд перед следующей проверкой ВК")
-            sleep(wait_time)
+            coordinator = ShardCoordinator(open_state_store(state_store), worker_id, list(groups), logger,
+                                           shard_lease_ttl, request_timeout())
+        except ValueError as e:
+            logger.critical(f"Неверный SHARD_LEASE_TTL: {e}")
+            sys.exit(1)
+        for index, source in enumerate(sources):
+            for telegram_bot in source.telegram_bots:
+                telegram_bot.fence = coordinator.fence(keys[index])
+        shard = Shard(coordinator, keys)
+        # При остановке источники сразу отдаются другим процессам
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        atexit.register(coordinator.close)
+
+    # Новые посты приходят событиями Callback API, если он включён
+    push = None
+    if callback_port:
+        if not callback_confirmation:
+            logger.critical("Для Callback API нужна строка подтверждения CALLBACK_CONFIRMATION")
+            sys.exit(1)
+        # Без секретного ключа любой, кто нашёл порт, может присылать события
+        if not callback_secret:
+            logger.critical("Для Callback API нужен секретный ключ CALLBACK_SECRET")
+            sys.exit(1)
+        groups: Dict[int, List[int]] = {}
+        for index, source in enumerate(sources):
+            group_id = source.vk_api.get_group_id()
+            if group_id:
+                groups.setdefault(group_id, []).append(index)
+        server = CallbackServer('0.0.0.0', callback_port, logger, callback_confirmation, callback_secret, callback_path)
+        server.start()
+        push = Push(server, groups, callback_poll_interval)
+
+    # Частота проверок подстраивается под частоту постов, начальная оценка - по журналу доставки.
+    # Группы с Callback API проверяются редко, только чтобы найти посты из потерянных событий
+    poller = PollScheduler(poll_min_interval, poll_max_interval, wait_time)
+    pushed = {index for indexes in push.groups.values() for index in indexes} if push else set()
+    for index, source in enumerate(sources):
+        poller.add(index, journal.recent_dates(source.route.channels),
+                   callback_poll_interval if index in pushed else None)
+
+    # Метрики в формате Prometheus по адресу /metrics
+    if metrics_port:
+        caches = {'owner_names': owner_names, 'file_ids': file_ids}
+        if dedup is not None:
+            caches['dedup'] = dedup.cache
+        register_state_metrics(metrics, sources, caches, poller, backfill_queue, push, shard)
+        MetricsServer('0.0.0.0', metrics_port, metrics, logger).start()
+
+    if use_async:
+        asyncio.run(run_async(sources, journal, logger, backfill, max_catchup, poller, push, metrics, dedup, shard))
+    else:
+        run_sync(sources, journal, logger, backfill, max_catchup, poller, push, metrics, dedup, shard)
 
-        except Exception as e:
-            logger.error(f"Ошибка в основном цикле: {e}")
-            sleep(60)
 
 if __name__ == '__main__':
     main()
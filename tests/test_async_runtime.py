@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from app.async_runtime import BlockingRunner, LoopRunner, run_blocking
+from app.callback_server import CallbackServer
+from app.metrics import MetricsRegistry
+from app.rate_limiter import SendScheduler
+
+
+class RunBlockingTest(unittest.TestCase):
+    def test_returns_result_without_event_loop(self):
+        waits = []
+        runner = BlockingRunner(waits.append)
+
+        async def send():
+            await runner.sleep(2)
+            return await runner.call(lambda: 'ok')
+
+        self.assertEqual(run_blocking(send()), 'ok')
+        self.assertEqual(waits, [2])
+
+    def test_refuses_coroutine_waiting_for_loop(self):
+        with self.assertRaises(RuntimeError):
+            run_blocking(asyncio.sleep(0.01))
+
+
+class LoopRunnerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_throttled_send_does_not_hold_thread(self):
+        executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+        runner = LoopRunner(executor)
+        logger = logging.getLogger('test')
+        scheduler = SendScheduler(logger, global_rate=1000, chat_rate=10, chat_burst=1, metrics=MetricsRegistry())
+        send = mock.Mock(return_value='ok', __name__='send_message')
+
+        await scheduler.call(runner, '@a', send)
+        throttled = asyncio.create_task(scheduler.call(runner, '@a', send))
+        await asyncio.sleep(0.01)
+        # Пока отправка ждёт лимит, единственный поток пула свободен
+        self.assertEqual(await runner.call(lambda: 'free'), 'free')
+        self.assertFalse(throttled.done())
+        self.assertEqual(await throttled, 'ok')
+        self.assertEqual(send.call_count, 2)
+
+
+class CallbackAttachTest(unittest.IsolatedAsyncioTestCase):
+    async def test_events_reach_loop_queue(self):
+        server = CallbackServer('127.0.0.1', 0, logging.getLogger('test'), 'confirm', 'secret')
+        self.addCleanup(server.stop)
+        body = {'type': 'wall_post_new', 'group_id': 5, 'secret': 'secret', 'object': {'owner_id': -5, 'id': 1}}
+        server.handle(body)
+        events = server.attach(asyncio.get_running_loop())
+        await asyncio.to_thread(server.handle, {**body, 'object': {'owner_id': -5, 'id': 2}})
+
+        received = [await asyncio.wait_for(events.get(), 1) for _ in range(2)]
+        self.assertEqual([event.post['id'] for event in received], [1, 2])
+        self.assertEqual(server.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import logging
+import unittest
+from unittest import mock
+
+import requests
+
+from app.callback_server import CallbackEvent
+from app.models import Post
+from app.photo_size import PhotoSizeSelector
+from main import Push, Source, handle_event
+
+
+class HandleEventTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test')
+        self.vk_api = mock.Mock()
+        self.vk_api.get_posts.return_value = [
+            Post.from_vk({'owner_id': -5, 'id': 7, 'date': 1000, 'text': 'Со стены'}, PhotoSizeSelector())]
+        self.sources = [Source(None, self.vk_api, None, [])]
+        self.push = Push(None, {5: [0]}, 0)
+        patcher = mock.patch('main.check_post')
+        self.check_post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, post):
+        handle_event(CallbackEvent(5, post), self.sources, self.push, None, self.logger)
+
+    def test_post_is_read_from_wall(self):
+        self.handle({'owner_id': -5, 'id': 7, 'text': 'Из события'})
+        self.vk_api.get_posts.assert_called_once_with('-5_7')
+        self.assertEqual(self.check_post.call_args.args[0].text, 'Со стены')
+
+    def test_post_of_other_wall_is_dropped(self):
+        self.handle({'owner_id': -6, 'id': 7, 'text': 'Чужой пост'})
+        self.vk_api.get_posts.assert_not_called()
+        self.check_post.assert_not_called()
+
+    def test_missing_or_unloaded_post_is_not_sent(self):
+        self.vk_api.get_posts.return_value = []
+        self.handle({'owner_id': -5, 'id': 7})
+        self.vk_api.get_posts.side_effect = requests.RequestException('timeout')
+        self.handle({'owner_id': -5, 'id': 7})
+        self.check_post.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
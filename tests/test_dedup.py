@@ -0,0 +1,144 @@
+import logging
+import unittest
+from typing import Any, Dict, List
+from unittest import mock
+
+from app.async_runtime import BlockingRunner
+from app.cache import LRUCache
+from app.dedup import DedupIndex, normalize_text, post_fingerprints
+from app.journal import DeliveryJournal
+from app.metrics import MetricsRegistry
+from app.models import Post
+from app.photo_size import PhotoSizeSelector
+from app.post_processor import PostDraft, PostProcessor
+from app.vkontakte_api import VkAPI
+from main import PreparedPost, deliver_post, prepare_post
+
+TEXT = 'Большая новость: сегодня открылась новая библиотека в центре города'
+
+
+def vk_post(owner_id: int, post_id: int, text: str = TEXT, **fields: Any) -> Dict[str, Any]:
+    return {'owner_id': owner_id, 'id': post_id, 'date': 1000 + post_id, 'text': text, **fields}
+
+
+def post(owner_id: int, post_id: int, text: str = TEXT, **fields: Any) -> Post:
+    return Post.from_vk(vk_post(owner_id, post_id, text, **fields), PhotoSizeSelector())
+
+
+class FakeTransport:
+    def __init__(self):
+        """Замена VK API: запоминает вызванные методы и знает одно имя."""
+        self.methods: List[str] = []
+
+    def get(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.methods.append(method)
+        return {'response': {'count': 1, 'items': [vk_post(-1, 1, copy_history=[vk_post(-3, 7)])],
+                             'profiles': [], 'groups': []}}
+
+    def post(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.methods.append(method)
+        return {'response': {'profiles': [], 'groups': [{'id': 3, 'name': 'Исходная группа'}]}}
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_normalize_text_drops_links_tags_and_mentions(self):
+        self.assertEqual(normalize_text('Привет, [id1|Павел]! https://vk.ru/x #новости'), 'привет павел')
+
+    def test_repost_matches_original(self):
+        original = post(-3, 7)
+        repost = post(-1, 1, '', copy_history=[vk_post(-3, 7)])
+        self.assertEqual(post_fingerprints(original)[0], post_fingerprints(repost)[0])
+
+    def test_copy_with_other_links_matches_by_content(self):
+        copy = post(-2, 5, TEXT + ' https://mirror.example #зеркало')
+        self.assertEqual(post_fingerprints(post(-1, 1))[1], post_fingerprints(copy)[1])
+
+    def test_short_text_has_no_content_key(self):
+        self.assertEqual(len(post_fingerprints(post(-1, 1, 'Привет'))), 1)
+
+
+class DedupIndexTest(unittest.TestCase):
+    def test_second_copy_in_same_channel_is_duplicate(self):
+        dedup = DedupIndex(LRUCache(100))
+        self.assertIsNone(dedup.claim(post(-1, 1), '@a'))
+        self.assertEqual(dedup.claim(post(-2, 5), '@a'), '-1_1')
+        self.assertIsNone(dedup.claim(post(-2, 5), '@b'))
+
+    def test_same_post_is_not_its_own_duplicate(self):
+        dedup = DedupIndex(LRUCache(100))
+        dedup.claim(post(-1, 1), '@a')
+        self.assertIsNone(dedup.claim(post(-1, 1), '@a'))
+
+    def test_release_frees_keys(self):
+        dedup = DedupIndex(LRUCache(100))
+        dedup.claim(post(-1, 1), '@a')
+        dedup.release(post(-1, 1), '@a')
+        self.assertIsNone(dedup.claim(post(-2, 5), '@a'))
+
+
+class OwnerNamesAfterDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test')
+        self.transport = FakeTransport()
+        self.vk_api = VkAPI('token', 'group', self.logger, self.transport, LRUCache(100))
+        self.processor = PostProcessor(None, self.vk_api, False, False, True, self.logger, metrics=MetricsRegistry())
+        self.journal = DeliveryJournal(':memory:')
+        self.addCleanup(self.journal.close)
+
+    def test_loading_page_does_not_request_names(self):
+        self.vk_api.get_data(10)
+        self.assertEqual(self.transport.methods, ['wall.get'])
+
+    def test_duplicate_is_dropped_without_name_requests(self):
+        dedup = DedupIndex(LRUCache(100))
+        dedup.claim(post(-3, 7), '@a')
+        repost = self.vk_api.iter_new_posts(None, 10, 10)
+        prepared = [prepare_post(item, self.journal, self.processor, ['@a'], self.logger, dedup) for item in repost]
+        self.assertEqual(prepared, [None])
+        self.assertEqual(self.transport.methods, ['wall.get'])
+
+    def test_owners_stage_requests_names_once(self):
+        repost = next(self.vk_api.iter_new_posts(None, 10, 10))
+        dedup = DedupIndex(LRUCache(100))
+        with mock.patch.object(self.vk_api, 'get_owner_name_by_id') as single:
+            prepared = prepare_post(repost, self.journal, self.processor, ['@a'], self.logger, dedup)
+        self.assertIn('Исходная группа', prepared.draft.message)
+        self.assertEqual(self.transport.methods, ['wall.get', 'execute'])
+        single.assert_not_called()
+
+    def test_page_requests_names_once(self):
+        drafts = [self.processor.screen(post(-1, i, copy_history=[vk_post(-3 - i, 7)])) for i in range(3)]
+        self.processor.resolve_owners(drafts)
+        self.assertEqual(self.transport.methods, ['execute'])
+        self.assertEqual([draft.quotes[0].names for draft in drafts], [['Исходная группа'], ['club4'], ['club5']])
+
+    def test_unknown_owner_is_signed_by_id(self):
+        with mock.patch.object(self.vk_api, 'get_owner_name_by_id') as single:
+            draft = self.processor.process(post(-1, 1, copy_history=[vk_post(-9, 7)]))
+        self.assertIn('club9', draft.message)
+        self.assertEqual(self.transport.methods, ['execute'])
+        single.assert_not_called()
+
+
+class DeliveryLagTest(unittest.TestCase):
+    def deliver(self, observe_lag):
+        journal = DeliveryJournal(':memory:')
+        self.addCleanup(journal.close)
+        metrics = MetricsRegistry()
+        bot = mock.Mock(channel='@a', metrics=metrics, send_parts_async=mock.AsyncMock(return_value=True))
+        bot.scheduler.blocking = BlockingRunner()
+        prepared = PreparedPost('-1_1', PostDraft(post(-1, 1), '', parts=[]),
+                                {'@a': journal.begin('-1_1', '@a', 1001)})
+        deliver_post(prepared, journal, mock.Mock(), [bot], logging.getLogger('test'), observe_lag)
+        self.assertTrue(journal.is_delivered('-1_1', '@a'))
+        return metrics.render()
+
+    def test_lag_is_observed_for_new_posts(self):
+        self.assertIn('vk2tg_delivery_lag_seconds_count{channel="@a"} 1', self.deliver(True))
+
+    def test_backfill_posts_are_not_observed(self):
+        self.assertNotIn('vk2tg_delivery_lag_seconds', self.deliver(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from app.post_processor import PostProcessor, utf16_len
+
+
+class CleanTextTest(unittest.TestCase):
+    def test_user_mention_becomes_name(self):
+        self.assertEqual(PostProcessor.clean_text('Привет [id1|Павел Дуров]!'), 'Привет Павел Дуров!')
+
+    def test_group_mentions_become_names(self):
+        self.assertEqual(PostProcessor.clean_text('[club2|Клуб] и [public3|Паблик]'), 'Клуб и Паблик')
+
+    def test_bracket_before_mention(self):
+        self.assertEqual(PostProcessor.clean_text('[важно] [id1|Павел]'), '[важно] Павел')
+        self.assertEqual(PostProcessor.clean_text('[[id1|Павел]'), '[Павел')
+
+    def test_text_without_mentions_is_unchanged(self):
+        text = 'Ссылка [не упоминание] и [id|без номера]'
+        self.assertEqual(PostProcessor.clean_text(text), text)
+
+    def test_html_links(self):
+        self.assertEqual(
+            PostProcessor.clean_text('Привет [id1|Павел] и [club2|Клуб]', 'HTML'),
+            'Привет <a href="https://vk.ru/id1">Павел</a> и <a href="https://vk.ru/club2">Клуб</a>')
+
+    def test_html_escaping(self):
+        self.assertEqual(
+            PostProcessor.clean_text('1 < 2 & [id1|<Имя>] [важно]', 'HTML'),
+            '1 &lt; 2 &amp; <a href="https://vk.ru/id1">&lt;Имя&gt;</a> [важно]')
+
+    def test_markdown_links(self):
+        self.assertEqual(
+            PostProcessor.clean_text('Привет [public3|Паблик]', 'MarkdownV2'),
+            'Привет [Паблик](https://vk.ru/public3)')
+
+    def test_markdown_escaping(self):
+        self.assertEqual(
+            PostProcessor.clean_text('a_b [важно] [id1|*Имя*] 1.5!', 'MarkdownV2'),
+            r'a\_b \[важно\] [\*Имя\*](https://vk.ru/id1) 1\.5\!')
+
+    def test_empty_name_uses_id(self):
+        self.assertEqual(PostProcessor.clean_text('[id1|]', 'HTML'), '<a href="https://vk.ru/id1">id1</a>')
+
+
+class SplitTextTest(unittest.TestCase):
+    def split(self, text, limit, parse_mode=None):
+        return list(PostProcessor.split_text(text, limit, parse_mode))
+
+    def test_short_text_is_one_part(self):
+        self.assertEqual(self.split('Короткий текст', 100), ['Короткий текст'])
+        self.assertEqual(self.split('', 100), [])
+
+    def test_prefers_paragraph_break(self):
+        text = 'Первый абзац. Ещё предложение.\n\nВторой абзац'
+        self.assertEqual(self.split(text, 40), ['Первый абзац. Ещё предложение.', 'Второй абзац'])
+
+    def test_falls_back_to_sentence_and_word(self):
+        self.assertEqual(self.split('Одно. Два три', 10), ['Одно.', 'Два три'])
+        self.assertEqual(self.split('слово слово слово', 12), ['слово слово', 'слово'])
+
+    def test_cuts_long_word(self):
+        self.assertEqual(self.split('a' * 25, 10), ['a' * 10, 'a' * 10, 'a' * 5])
+
+    def test_limit_counts_utf16_units(self):
+        text = '😀' * 30
+        parts = self.split(text, 10)
+        self.assertEqual(''.join(parts), text)
+        self.assertTrue(all(utf16_len(part) <= 10 for part in parts))
+
+    def test_keeps_text_and_limit(self):
+        text = ' '.join(f'слово{i}.' for i in range(500))
+        parts = self.split(text, 100)
+        self.assertTrue(all(utf16_len(part) <= 100 for part in parts))
+        self.assertEqual(' '.join(parts), text)
+
+    def test_does_not_break_html_links(self):
+        link = '<a href="https://vk.ru/id1">Павел Дуров</a>'
+        parts = self.split(f'Текст {link} конец', 50, 'HTML')
+        self.assertTrue(any(link in part for part in parts))
+        self.assertTrue(all(utf16_len(part) <= 50 for part in parts))
+
+    def test_does_not_break_markdown_escapes(self):
+        parts = self.split('a' * 9 + r'\.' + 'b', 10, 'MarkdownV2')
+        self.assertTrue(all(not part.endswith('\\') for part in parts))
+        self.assertEqual(''.join(parts), 'a' * 9 + r'\.' + 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import logging
+import unittest
+from unittest import mock
+
+import requests
+import telebot
+
+from app.async_runtime import run_blocking
+from app.metrics import MetricsRegistry
+from app.rate_limiter import SendScheduler
+from app.retry import RetryPolicy, is_retryable
+from app.telegram_api import TelegramBot
+
+
+def telegram_error(code: int) -> telebot.apihelper.ApiTelegramException:
+    result_json = {'ok': False, 'error_code': code, 'description': 'error', 'parameters': {'retry_after': 1}}
+    return telebot.apihelper.ApiTelegramException('sendMessage', None, result_json)
+
+
+class IsRetryableTest(unittest.TestCase):
+    def test_temporary_errors(self):
+        self.assertTrue(is_retryable(telegram_error(429)))
+        self.assertTrue(is_retryable(telegram_error(502)))
+        self.assertTrue(is_retryable(requests.ConnectionError()))
+
+    def test_permanent_errors(self):
+        self.assertFalse(is_retryable(telegram_error(400)))
+        self.assertFalse(is_retryable(ValueError()))
+
+    def test_scheduled_429_is_not_retried_again(self):
+        self.assertFalse(is_retryable(telegram_error(429), scheduled=True))
+        self.assertTrue(is_retryable(telegram_error(502), scheduled=True))
+
+
+class TelegramBotRetryTest(unittest.TestCase):
+    def test_429_is_retried_only_by_scheduler(self):
+        logger = logging.getLogger('test')
+        now = [0.0]
+
+        def sleep(seconds: float) -> None:
+            now[0] += seconds
+
+        metrics = MetricsRegistry()
+        scheduler = SendScheduler(logger, max_retries=2, sleep=sleep, clock=lambda: now[0], metrics=metrics)
+        bot = TelegramBot('123:token', '@channel', logger, scheduler, RetryPolicy(max_attempts=5), metrics=metrics)
+        send = mock.Mock(side_effect=telegram_error(429), __name__='send_message')
+
+        with self.assertRaises(telebot.apihelper.ApiTelegramException):
+            run_blocking(bot._call(scheduler.blocking, 'text', send, '@channel', 'текст'))
+        self.assertEqual(send.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
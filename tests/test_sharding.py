@@ -0,0 +1,181 @@
+import logging
+import unittest
+from typing import List
+from unittest import mock
+
+from app.composer import MessagePart
+from app.metrics import MetricsRegistry
+from app.rate_limiter import SendScheduler
+from app.routes import Route
+from app.sharding import HashRing, LeaseLost, ShardCoordinator, shard_groups
+from app.state_store import HttpStateStore, SqliteStateStore, StateStore, StateStoreServer
+from app.telegram_api import TelegramBot
+
+TTL = 120
+SEND_TIMEOUT = 45
+
+
+class FlakyStore(StateStore):
+    def __init__(self, store: StateStore):
+        """Хранилище, которое можно сделать недоступным."""
+        self.store = store
+        self.down = False
+
+    def _check(self) -> None:
+        if self.down:
+            raise ConnectionError('хранилище недоступно')
+
+    def heartbeat(self, worker_id: str, ttl: float) -> None:
+        self._check()
+        self.store.heartbeat(worker_id, ttl)
+
+    def workers(self) -> List[str]:
+        self._check()
+        return self.store.workers()
+
+    def leave(self, worker_id: str) -> None:
+        self._check()
+        self.store.leave(worker_id)
+
+    def acquire(self, key: str, worker_id: str, ttl: float) -> bool:
+        self._check()
+        return self.store.acquire(key, worker_id, ttl)
+
+    def release(self, key: str, worker_id: str) -> None:
+        self._check()
+        self.store.release(key, worker_id)
+
+
+class HashRingTest(unittest.TestCase):
+    def test_new_worker_takes_only_part_of_keys(self):
+        keys = [f'@channel{number}' for number in range(200)]
+        before = HashRing(['a', 'b'])
+        after = HashRing(['a', 'b', 'c'])
+        moved = [key for key in keys if before.owner(key) != after.owner(key)]
+        self.assertTrue(all(after.owner(key) == 'c' for key in moved))
+        self.assertLess(len(moved), len(keys) / 2)
+
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing([]).owner('key'))
+
+
+class ShardGroupsTest(unittest.TestCase):
+    def test_routes_with_common_channel_share_group(self):
+        routes = [Route('a', ['@x']), Route('b', ['@y']), Route('c', ['@y', '@z']), Route('d')]
+        groups = shard_groups(routes)
+        self.assertEqual(groups, {'@x': [0], '@y,@z': [1, 2], 'domain:d': [3]})
+
+
+class ShardCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.now = [1000.0]
+        self.store = FlakyStore(SqliteStateStore(':memory:', clock=self.clock))
+        self.keys = [f'@channel{number}' for number in range(20)]
+
+    def clock(self) -> float:
+        return self.now[0]
+
+    def coordinator(self, worker_id: str) -> ShardCoordinator:
+        return ShardCoordinator(self.store, worker_id, self.keys, logging.getLogger('test'), TTL, SEND_TIMEOUT,
+                                self.clock)
+
+    def test_workers_split_keys(self):
+        a, b = self.coordinator('a'), self.coordinator('b')
+        a.refresh()
+        b.refresh()
+        a.refresh()
+        b.refresh()
+        self.assertEqual(a.owned | b.owned, set(self.keys))
+        self.assertFalse(a.owned & b.owned)
+
+    def test_short_ttl_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ShardCoordinator(self.store, 'a', self.keys, logging.getLogger('test'), 60, SEND_TIMEOUT, self.clock)
+
+    def test_send_stops_before_lease_expires_without_renewal(self):
+        a = self.coordinator('a')
+        a.refresh()
+        key = self.keys[0]
+        a.ensure(key)
+
+        # Хранилище недоступно, продлить аренду нельзя
+        self.store.down = True
+        self.now[0] += a.renew_interval
+        a._renew()
+        a.ensure(key)
+        self.now[0] += TTL - a.renew_interval - SEND_TIMEOUT
+        with self.assertRaises(LeaseLost):
+            a.ensure(key)
+
+        # Другой процесс получит ключ только после окончания аренды, когда a уже не отправляет
+        self.store.down = False
+        b = self.coordinator('b')
+        self.assertNotIn(key, b.refresh())
+        self.now[0] += SEND_TIMEOUT + 1
+        self.assertEqual(b.refresh(), set(self.keys))
+
+    def test_busy_key_is_kept_until_check_ends(self):
+        a = self.coordinator('a')
+        a.refresh()
+        b = self.coordinator('b')
+        b.refresh()
+        moving = [key for key in self.keys if HashRing(['a', 'b']).owner(key) == 'b']
+        key = moving[0]
+        with a.hold(key) as owned:
+            self.assertTrue(owned)
+            a.refresh()
+            self.assertIn(key, a.owned)
+            self.assertNotIn(key, b.refresh())
+        a.refresh()
+        self.assertNotIn(key, a.owned)
+        self.assertIn(key, b.refresh())
+
+    def test_hold_reports_foreign_key(self):
+        a = self.coordinator('a')
+        with a.hold(self.keys[0]) as owned:
+            self.assertFalse(owned)
+
+    def test_close_releases_keys(self):
+        a, b = self.coordinator('a'), self.coordinator('b')
+        a.start()
+        a.close()
+        self.assertEqual(b.refresh(), set(self.keys))
+
+
+class TelegramBotFenceTest(unittest.TestCase):
+    def test_lost_lease_stops_send_before_request(self):
+        logger = logging.getLogger('test')
+        metrics = MetricsRegistry()
+        bot = TelegramBot('123:token', '@channel', logger, SendScheduler(logger, metrics=metrics), metrics=metrics)
+        bot.bot.send_message = mock.Mock(__name__='send_message')
+        bot.fence = mock.Mock(side_effect=[None, LeaseLost('аренда потеряна')])
+        steps = mock.Mock()
+        steps.is_done.return_value = False
+
+        with self.assertRaises(LeaseLost):
+            bot.send_parts([MessagePart('text:0', 'первое'), MessagePart('text:1', 'второе')], False, steps)
+        self.assertEqual(bot.bot.send_message.call_count, 1)
+        steps.mark.assert_called_once_with('text:0', True)
+
+
+class HttpStateStoreTest(unittest.TestCase):
+    def test_leases_over_http(self):
+        server = StateStoreServer('127.0.0.1', 0, SqliteStateStore(':memory:'), logging.getLogger('test'))
+        server.start()
+        self.addCleanup(server.stop)
+        store = HttpStateStore(f'http://127.0.0.1:{server.port}')
+
+        store.heartbeat('a', TTL)
+        self.assertEqual(store.workers(), ['a'])
+        self.assertTrue(store.acquire('@x', 'a', TTL))
+        self.assertFalse(store.acquire('@x', 'b', TTL))
+        store.leave('a')
+        self.assertTrue(store.acquire('@x', 'b', TTL))
+
+    def test_state_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            StateStore()
+
+
+if __name__ == '__main__':
+    unittest.main()
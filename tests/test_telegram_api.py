@@ -0,0 +1,118 @@
+import logging
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import telebot
+from telebot.types import InputFile
+
+from app.async_runtime import run_blocking
+from app.cache import LRUCache
+from app.media_relay import MediaRelay
+from app.metrics import MetricsRegistry
+from app.models import Photo
+from app.rate_limiter import SendScheduler
+from app.retry import RetryPolicy
+from app.telegram_api import TelegramBot, rejects_file_id
+
+
+def telegram_error(code: int, description: str) -> telebot.apihelper.ApiTelegramException:
+    result_json = {'ok': False, 'error_code': code, 'description': description}
+    return telebot.apihelper.ApiTelegramException('sendMediaGroup', None, result_json)
+
+
+def sent(file_id: str) -> SimpleNamespace:
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+class RejectsFileIdTest(unittest.TestCase):
+    def test_file_id_errors(self):
+        self.assertTrue(rejects_file_id(telegram_error(400, 'Bad Request: wrong file identifier/HTTP URL specified')))
+        self.assertTrue(rejects_file_id(telegram_error(400, 'Bad Request: wrong remote file identifier specified')))
+
+    def test_other_errors(self):
+        self.assertFalse(rejects_file_id(telegram_error(400, 'Bad Request: message caption is too long')))
+        self.assertFalse(rejects_file_id(telegram_error(502, 'Bad Gateway')))
+        self.assertFalse(rejects_file_id(OSError('connection reset')))
+
+
+class SendPhotosCacheTest(unittest.TestCase):
+    def setUp(self):
+        logger = logging.getLogger('test')
+        metrics = MetricsRegistry()
+        scheduler = SendScheduler(logger, max_retries=0, sleep=lambda seconds: None, metrics=metrics)
+        self.file_ids = LRUCache(100)
+        self.bot = TelegramBot('123:token', '@channel', logger, scheduler, RetryPolicy(max_attempts=1),
+                               file_ids=self.file_ids, metrics=metrics)
+        self.bot.dead_letters = mock.Mock()
+        self.photos = [Photo(-1, number, 'x', f'https://vk.ru/{number}.jpg') for number in (1, 2)]
+
+    def send_photos(self, images, caption):
+        return run_blocking(self.bot._send_photos(self.bot.scheduler.blocking, images, caption))
+
+    def test_caption_error_keeps_cache(self):
+        self.file_ids.set(self.photos[0].key, 'cached')
+        self.bot.bot.send_photo = mock.Mock(side_effect=telegram_error(400, 'Bad Request: message caption is too long'))
+
+        self.assertFalse(self.send_photos(self.photos[:1], 'подпись'))
+        self.assertEqual(self.file_ids.get(self.photos[0].key), 'cached')
+
+    def test_rejected_single_file_id_is_evicted(self):
+        self.file_ids.set(self.photos[0].key, 'stale')
+        error = telegram_error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+        self.bot.bot.send_photo = mock.Mock(side_effect=[error, error])
+
+        self.assertFalse(self.send_photos(self.photos[:1], ''))
+        self.assertIsNone(self.file_ids.get(self.photos[0].key))
+
+    def test_album_retry_by_url_replaces_cached_ids(self):
+        self.file_ids.set(self.photos[0].key, 'stale')
+        self.file_ids.set(self.photos[1].key, 'valid')
+        error = telegram_error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+        self.bot.bot.send_media_group = mock.Mock(side_effect=[error, [sent('new1'), sent('new2')]])
+
+        self.assertTrue(self.send_photos(self.photos, ''))
+        urls = [media.media for media in self.bot.bot.send_media_group.call_args.args[1]]
+        self.assertEqual(urls, [photo.url for photo in self.photos])
+        self.assertEqual([self.file_ids.get(photo.key) for photo in self.photos], ['new1', 'new2'])
+
+
+class RelayAlbumTest(unittest.TestCase):
+    def setUp(self):
+        logger = logging.getLogger('test')
+        metrics = MetricsRegistry()
+        scheduler = SendScheduler(logger, max_retries=0, sleep=lambda seconds: None, metrics=metrics)
+        self.bot = TelegramBot('123:token', '@channel', logger, scheduler, RetryPolicy(max_attempts=1),
+                               relay=MediaRelay(logger, 'always', max_album_bytes=1000), metrics=metrics)
+        self.bot.bot.send_photo = mock.Mock(return_value=sent('one'))
+        self.bot.bot.send_media_group = mock.Mock(return_value=[sent('one'), sent('two')])
+
+    def call_photos(self, photos, caption):
+        return run_blocking(self.bot._call_photos(self.bot.scheduler.blocking, photos, caption))
+
+    def files(self, size: int) -> list:
+        files = []
+        for _ in range(2):
+            spool = tempfile.TemporaryFile()
+            self.addCleanup(spool.close)
+            spool.write(b'x' * size)
+            spool.seek(0)
+            files.append(InputFile(spool, file_name='photo.jpg'))
+        return files
+
+    def test_light_album_is_one_request(self):
+        self.call_photos(self.files(400), 'подпись')
+        self.bot.bot.send_media_group.assert_called_once()
+        self.bot.bot.send_photo.assert_not_called()
+
+    def test_heavy_album_is_uploaded_one_by_one(self):
+        messages = self.call_photos(self.files(600), 'подпись')
+        self.assertEqual(len(messages), 2)
+        self.bot.bot.send_media_group.assert_not_called()
+        captions = [call.kwargs.get('caption') for call in self.bot.bot.send_photo.call_args_list]
+        self.assertEqual(captions, ['подпись', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
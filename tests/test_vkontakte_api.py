@@ -0,0 +1,67 @@
+import logging
+import unittest
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from app.cache import LRUCache
+from app.vkontakte_api import VkAPI
+
+
+def wall(count: int) -> List[Dict[str, Any]]:
+    """Стена из count постов от новых к старым, пост N опубликован в момент 1000 + N."""
+    return [{'id': number, 'owner_id': -1, 'date': 1000 + number, 'text': f'Пост {number}'}
+            for number in range(count, 0, -1)]
+
+
+class FakeTransport:
+    def __init__(self, items: List[Dict[str, Any]], fail_offset: Optional[int] = None):
+        """Замена VK API: отдаёт стену items, на смещении fail_offset запрос падает."""
+        self.items = items
+        self.fail_offset = fail_offset
+        self.offsets: List[int] = []
+
+    def get(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        offset, count = int(params.get('offset', 0)), int(params['count'])
+        self.offsets.append(offset)
+        if offset == self.fail_offset:
+            raise requests.ConnectionError('connection reset')
+        return {'response': {'count': len(self.items), 'items': self.items[offset:offset + count],
+                             'profiles': [], 'groups': []}}
+
+
+class IterNewPostsTest(unittest.TestCase):
+    def make_api(self, transport: FakeTransport) -> VkAPI:
+        return VkAPI('token', 'group', logging.getLogger('test'), transport, LRUCache(100))
+
+    def test_returns_posts_newer_than_last_date_oldest_first(self):
+        api = self.make_api(FakeTransport(wall(300)))
+        posts = list(api.iter_new_posts(1000 + 150, 10, 1000))
+        self.assertEqual([post.id for post in posts], list(range(150, 301)))
+
+    def test_failed_page_aborts_pass_without_posts(self):
+        transport = FakeTransport(wall(300), fail_offset=110)
+        posts = list(self.make_api(transport).iter_new_posts(1000 + 50, 10, 1000))
+        self.assertEqual(posts, [])
+        self.assertIn(110, transport.offsets)
+
+    def test_cap_returns_oldest_new_posts(self):
+        api = self.make_api(FakeTransport(wall(300)))
+        posts = list(api.iter_new_posts(1000 + 50, 10, 100))
+        self.assertEqual([post.id for post in posts], list(range(50, 150)))
+
+    def test_cap_passes_catch_up_without_gaps(self):
+        api = self.make_api(FakeTransport(wall(300)))
+        last_date = 1000 + 50
+        delivered: List[int] = []
+        while True:
+            posts = [post for post in api.iter_new_posts(last_date, 10, 100) if post.date > last_date]
+            if not posts:
+                break
+            delivered.extend(post.id for post in posts)
+            last_date = posts[-1].date
+        self.assertEqual(delivered, list(range(51, 301)))
+
+
+if __name__ == '__main__':
+    unittest.main()